@@ -0,0 +1,141 @@
+"""
+JWT authentication resolving the token's user from caches.
+
+``JWTAuthentication`` loads the user with a primary-key query on every
+request, although the token itself is already verified. Here the user's row
+is kept in a small process-local LRU (``AUTH_USER_LOCAL_TTL`` seconds) in
+front of the shared cache (``AUTH_USER_CACHE_TIMEOUT``), so steady-state
+requests run no authentication queries. Saving or deleting a user moves it
+to a new cache generation, which invalidates both entries (see
+``signals``). Other processes notice once their local entry expires, which
+bounds how long a deactivated user stays signed in there.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from monitoring.authentication import TimedJWTAuthentication
+
+
+class LocalUserCache:
+    """
+    Thread-safe LRU of cached users whose entries expire after ``ttl`` seconds
+    
+    Each entry carries the user's cache generation. Forgetting a user leaves
+    a marker with the new generation, so a request that read the row before
+    can't put it back afterwards.
+    """
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+    
+    def get(self, user_id):
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.entries[user_id]
+                return None
+            self.entries.move_to_end(user_id)
+            return entry[2]
+    
+    def set(self, user_id, generation, value):
+        with self.lock:
+            now = time.monotonic()
+            entry = self.entries.get(user_id)
+            if entry is not None and entry[0] >= now and entry[1] > generation:
+                return
+            self.entries[user_id] = (now + self.ttl, generation, value)
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+    
+    def forget(self, user_id, generation):
+        self.set(user_id, generation, None)
+    
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local_users = LocalUserCache(settings.AUTH_USER_LOCAL_SIZE, settings.AUTH_USER_LOCAL_TTL)
+
+
+def user_cache_key(user_id):
+    return f'auth-user:{user_id}'
+
+
+def user_generation_key(user_id):
+    return f'auth-user-generation:{user_id}'
+
+
+def invalidate_user(user_id):
+    """
+    Forget the cached row of a user (in this process and in the shared cache)
+    
+    The user's generation is incremented rather than the entry deleted, so a
+    row cached by a request that loaded it before is ignored however late it
+    is written.
+    """
+    key = user_generation_key(user_id)
+    cache.add(key, 0, None)
+    generation = cache.incr(key)
+    local_users.forget(str(user_id), generation)
+
+
+def cached_fields(model):
+    """
+    The attnames of the user columns that are cached: all but the password hash
+    """
+    return [field.attname for field in model._meta.concrete_fields if field.attname != 'password']
+
+
+class CachedJWTAuthentication(TimedJWTAuthentication):
+    """
+    JWT authentication that looks the user up in the local and shared caches first
+    
+    Cached entries are ``(generation, row, password digest)``: the row leaves
+    out the password hash (the instance defers it) and the digest, which
+    tokens carry anyway, is only kept when ``CHECK_REVOKE_TOKEN`` is on.
+    """
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is None:
+            return super().get_user(validated_token)
+        # Claims decode to whatever JSON type was issued; key on the string
+        key = str(user_id)
+        field_names = cached_fields(self.user_model)
+        entry = local_users.get(key)
+        if entry is None:
+            found = cache.get_many([user_cache_key(user_id), user_generation_key(user_id)])
+            generation = found.get(user_generation_key(user_id), 0)
+            entry = found.get(user_cache_key(user_id))
+            if entry is None or entry[0] != generation:
+                # Runs simplejwt's active and revocation checks on the fresh row
+                user = super().get_user(validated_token)
+                digest = get_md5_hash_password(user.password) if api_settings.CHECK_REVOKE_TOKEN else None
+                entry = (generation, tuple(getattr(user, name) for name in field_names), digest)
+                cache.set(user_cache_key(user_id), entry, settings.AUTH_USER_CACHE_TIMEOUT)
+                local_users.set(key, generation, entry)
+                return user
+            local_users.set(key, generation, entry)
+        
+        # A fresh instance per request, so views may modify request.user
+        _, row, digest = entry
+        user = self.user_model.from_db(DEFAULT_DB_ALIAS, field_names, row)
+        if not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != digest:
+            raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+        return user
@@ -54,3 +54,12 @@ class UserUpdateSerializer(serializers.ModelSerializer):
         model = User
         fields = ('first_name', 'last_name', 'store_name', 'store_type', 
                   'phone', 'address', 'profile_image')
+    
+    def update(self, instance, validated_data):
+        # The instance is request.user, possibly built from the authentication
+        # cache: only the submitted fields are written, so the rest of a stale
+        # row can't overwrite changes made meanwhile (e.g. in the admin)
+        for name, value in validated_data.items():
+            setattr(instance, name, value)
+        instance.save(update_fields=[*validated_data, 'updated_at'])
+        return instance
@@ -0,0 +1,19 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import invalidate_user
+from .models import User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, raw=False, **kwargs):
+    """
+    Drop the user's cached row when the user is changed, deactivated or deleted
+    """
+    if raw:
+        return
+    invalidate_user(instance.pk)
+    # Again after commit, in case a request cached the old row meanwhile
+    transaction.on_commit(lambda: invalidate_user(instance.pk))
@@ -1,3 +1,68 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.test import TestCase
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
 
-# Create your tests here.
+from .authentication import invalidate_user, local_users, user_cache_key
+
+
+User = get_user_model()
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_users.clear()
+        self.user = User.objects.create_user(username='alice', password='test-password-123')
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+    
+    def test_cached_user_needs_no_queries(self):
+        self.assertEqual(self.api.get('/api/auth/user/').status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.api.get('/api/auth/user/').status_code, 200)
+        # Another process finds the row in the shared cache
+        local_users.clear()
+        with self.assertNumQueries(0):
+            self.api.get('/api/auth/user/')
+    
+    def test_profile_changes_are_seen(self):
+        self.api.get('/api/auth/user/')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.api.patch('/api/auth/user/update/', {'store_name': 'Corner Shop'}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.api.get('/api/auth/user/').json()['store_name'], 'Corner Shop')
+    
+    def test_deactivated_user_is_rejected(self):
+        self.api.get('/api/auth/user/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.api.get('/api/auth/user/').status_code, 401)
+    
+    def test_profile_update_keeps_other_changes(self):
+        self.api.get('/api/auth/user/')
+        # Changed behind the cache's back, so request.user is stale
+        User.objects.filter(pk=self.user.pk).update(email='alice@example.com', is_staff=True)
+        response = self.api.patch('/api/auth/user/update/', {'store_name': 'Corner Shop'}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual((user.store_name, user.email, user.is_staff), ('Corner Shop', 'alice@example.com', True))
+        self.assertTrue(user.check_password('test-password-123'))
+    
+    def test_password_hash_is_not_cached(self):
+        self.api.get('/api/auth/user/')
+        entries = (cache.get(user_cache_key(self.user.pk)), local_users.get(str(self.user.pk)))
+        for entry in entries:
+            self.assertNotIn(self.user.password, entry[1])
+    
+    def test_late_write_of_a_stale_row_is_ignored(self):
+        self.api.get('/api/auth/user/')
+        stale = cache.get(user_cache_key(self.user.pk))
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        invalidate_user(self.user.pk)
+        # A request that loaded the row before the change caches it afterwards
+        cache.set(user_cache_key(self.user.pk), stale)
+        local_users.set(str(self.user.pk), stale[0], stale)
+        self.assertEqual(self.api.get('/api/auth/user/').status_code, 401)
@@ -1,11 +1,11 @@
 from django.contrib import admin
-from .models import WeeklyAnalysis, MonthlyAnalysis, Suggestion
+from .models import WeeklyAnalysis, MonthlyAnalysis, Suggestion, DailyRollup
 
 
 @admin.register(WeeklyAnalysis)
 class WeeklyAnalysisAdmin(admin.ModelAdmin):
     list_display = ['user', 'week_start', 'week_end', 'total_bills', 'total_amount', 'created_at']
-    list_filter = ['week_start', 'created_at']
+    list_filter = ['week_start', 'is_dirty', 'created_at']
     search_fields = ['user__username']
     readonly_fields = ['created_at', 'updated_at']
 
@@ -13,7 +13,7 @@ class WeeklyAnalysisAdmin(admin.ModelAdmin):
 @admin.register(MonthlyAnalysis)
 class MonthlyAnalysisAdmin(admin.ModelAdmin):
     list_display = ['user', 'year', 'month', 'total_bills', 'total_amount', 'growth_percentage', 'created_at']
-    list_filter = ['year', 'month', 'created_at']
+    list_filter = ['year', 'month', 'is_dirty', 'created_at']
     search_fields = ['user__username']
     readonly_fields = ['created_at', 'updated_at']
 
@@ -23,3 +23,10 @@ class SuggestionAdmin(admin.ModelAdmin):
     list_display = ['user', 'suggestion_type', 'title', 'is_read', 'is_dismissed', 'created_at']
     list_filter = ['suggestion_type', 'is_read', 'is_dismissed', 'created_at']
     search_fields = ['user__username', 'title', 'description']
+
+
+@admin.register(DailyRollup)
+class DailyRollupAdmin(admin.ModelAdmin):
+    list_display = ['user', 'day', 'vendor_name', 'category', 'bill_count', 'item_count', 'amount', 'tax']
+    list_filter = ['day']
+    search_fields = ['user__username', 'vendor_name', 'category']
@@ -0,0 +1,107 @@
+"""
+Cached weekly and monthly analyses with dirty tracking.
+
+Rollup rebuilds mark the weeks and months they touch as dirty; a dirty analysis
+is recomputed from the rollups either on its next read or by the
+``recompute_analyses`` worker, whichever comes first.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Sum
+
+from billagent_backend.routers import use_primary
+from .models import DailyRollup, MonthlyAnalysis, WeeklyAnalysis
+from .rollups import month_bounds, previous_month, summarize
+from .series import spend_series
+
+SUMMARY_FIELDS = ('total_bills', 'total_amount', 'total_tax', 'average_bill_amount',
+                  'category_breakdown', 'top_vendors')
+
+
+def _clear_dirty(analysis):
+    # Cleared before reading the rollups: a write that lands mid-recompute
+    # marks the row dirty again instead of being lost
+    if analysis.is_dirty:
+        type(analysis).objects.filter(pk=analysis.pk).update(is_dirty=False)
+        analysis.is_dirty = False
+
+
+@use_primary()
+def recompute_weekly(analysis):
+    """
+    Rebuild a weekly analysis from the daily rollups
+    """
+    _clear_dirty(analysis)
+    summary = summarize(analysis.user_id, analysis.week_start, analysis.week_end)
+    for field in SUMMARY_FIELDS:
+        setattr(analysis, field, summary[field])
+    analysis.trend_data = spend_series(analysis.user_id, analysis.week_start, analysis.week_end, 'day')
+    analysis.save(update_fields=SUMMARY_FIELDS + ('trend_data', 'updated_at'))
+
+
+@use_primary()
+def recompute_monthly(analysis):
+    """
+    Rebuild a monthly analysis (including growth) from the daily rollups
+    """
+    _clear_dirty(analysis)
+    month_start, month_end = month_bounds(analysis.year, analysis.month)
+    summary = summarize(analysis.user_id, month_start, month_end)
+    for field in SUMMARY_FIELDS:
+        setattr(analysis, field, summary[field])
+    analysis.trend_data = spend_series(analysis.user_id, month_start, month_end, 'week')
+    
+    prev_start, prev_end = month_bounds(*previous_month(analysis.year, analysis.month))
+    prev_total = DailyRollup.objects.filter(
+        user_id=analysis.user_id,
+        day__gte=prev_start,
+        day__lte=prev_end,
+        category=DailyRollup.BILL_TOTALS,
+    ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
+    if prev_total > 0:
+        analysis.growth_percentage = ((analysis.total_amount - prev_total) / prev_total) * 100
+    else:
+        analysis.growth_percentage = 0
+    analysis.save(update_fields=SUMMARY_FIELDS + ('trend_data', 'growth_percentage', 'updated_at'))
+
+
+def get_weekly_analysis(user, week_start, refresh=False):
+    """
+    Return an up-to-date weekly analysis, recomputing only if it is new or dirty
+    """
+    analysis, created = WeeklyAnalysis.objects.get_or_create(
+        user=user,
+        week_start=week_start,
+        defaults={'week_end': week_start + timedelta(days=6)}
+    )
+    analysis.user = user
+    if created or refresh or analysis.is_dirty:
+        recompute_weekly(analysis)
+    return analysis
+
+
+def get_monthly_analysis(user, year, month, refresh=False):
+    """
+    Return an up-to-date monthly analysis, recomputing only if it is new or dirty
+    """
+    analysis, created = MonthlyAnalysis.objects.get_or_create(user=user, year=year, month=month)
+    analysis.user = user
+    if created or refresh or analysis.is_dirty:
+        recompute_monthly(analysis)
+    return analysis
+
+
+def recompute_dirty(limit=None):
+    """
+    Recompute dirty analyses in the background; returns how many were rebuilt
+    """
+    count = 0
+    for model, recompute in ((WeeklyAnalysis, recompute_weekly), (MonthlyAnalysis, recompute_monthly)):
+        dirty = model.objects.filter(is_dirty=True).order_by('pk')
+        if limit is not None:
+            dirty = dirty[:max(limit - count, 0)]
+        for analysis in dirty:
+            recompute(analysis)
+            count += 1
+    return count
@@ -0,0 +1,194 @@
+"""
+Async versions of the dashboard, weekly and monthly analytics endpoints.
+
+Under an ASGI server these views give the event loop back while they wait on
+the database instead of holding a worker thread: they read through Django's
+async ORM (``aaggregate``, ``afirst``), the dashboard awaits its
+independent window aggregates together with ``asyncio.gather``, and only the
+recompute of a new or dirty analysis drops into sync code. Responses match
+the ``AnalyticsViewSet`` actions they stand in for, including the
+data-version cache, ETags, read-your-writes and replica routing; they are
+routed in place of those actions when ``ANALYTICS_ASYNC_VIEWS`` is on.
+"""
+import asyncio
+from contextlib import nullcontext
+from datetime import timedelta
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Sum
+from django.http import HttpResponseNotModified, JsonResponse
+from django.utils import timezone
+from django.views.decorators.http import require_safe
+from rest_framework import exceptions, status
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from bills.models import Bill, BillTotals
+from billagent_backend.conditional import data_etag, etag_matches, patch_conditional_headers
+from billagent_backend.routers import replica_alias, use_primary, wrote_recently
+from billagent_backend.versioning import get_data_version
+from .analyses import get_monthly_analysis, get_weekly_analysis
+from .models import MonthlyAnalysis, WeeklyAnalysis
+from .rollups import month_bounds
+from .serializers import MonthlyAnalysisSerializer, WeeklyAnalysisSerializer
+from .views import dashboard_cache_key
+
+
+def _authenticate(request):
+    """
+    Authenticate with the API's authentication classes and prepare the ETag
+    
+    Returns ``(etag, primary)``: the ETag is None when the response must not
+    be conditional, ``primary`` whether reads must stay on the primary.
+    """
+    authenticators = [auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    drf_request = Request(request, authenticators=authenticators)
+    try:
+        if not drf_request.user.is_authenticated:
+            raise exceptions.NotAuthenticated()
+    except (exceptions.NotAuthenticated, exceptions.AuthenticationFailed) as exc:
+        # As in APIView.handle_exception: 401 with a challenge, else 403
+        header = authenticators[0].authenticate_header(drf_request) if authenticators else None
+        if header:
+            exc.auth_header = header
+        else:
+            exc.status_code = status.HTTP_403_FORBIDDEN
+        raise
+    request.user = drf_request.user
+    # An explicit refresh always regenerates the analysis
+    etag = None if request.GET.get('refresh') == 'true' else data_etag(request)
+    return etag, wrote_recently(request.user.pk)
+
+
+def _error(exc):
+    response = JsonResponse({'detail': exc.detail}, status=exc.status_code)
+    if getattr(exc, 'auth_header', None):
+        response['WWW-Authenticate'] = exc.auth_header
+    return response
+
+
+def analytics_view(view):
+    """
+    Wrap an async analytics view with authentication and conditional GET
+    """
+    @require_safe
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            etag, primary = await sync_to_async(_authenticate)(request)
+        except exceptions.APIException as exc:
+            return _error(exc)
+        if etag and etag_matches(etag, request.META.get('HTTP_IF_NONE_MATCH')):
+            response = HttpResponseNotModified()
+        else:
+            with use_primary() if primary else nullcontext():
+                response = await view(request, *args, **kwargs)
+        return patch_conditional_headers(response, etag)
+    return wrapper
+
+
+def _window(totals):
+    return {
+        'total_bills': totals['total_bills'] or 0,
+        'total_amount': float(totals['total_amount'] or 0),
+    }
+
+
+async def _all_time(bills, user_id, alias):
+    # From the precomputed per-status totals, unless they were never seeded
+    totals = await BillTotals.objects.using(alias).filter(user_id=user_id).aaggregate(
+        rows=Count('id'), total_bills=Sum('bill_count'), total_amount=Sum('total_amount'),
+    )
+    if totals['rows']:
+        return totals
+    return await bills.aaggregate(total_bills=Count('id'), total_amount=Sum('total_amount'))
+
+
+@analytics_view
+async def dashboard(request):
+    """
+    Get dashboard overview data
+    """
+    user = request.user
+    today = timezone.now().date()
+    
+    cache_key = dashboard_cache_key(user.pk, await sync_to_async(get_data_version)(user.pk), today)
+    data = await cache.aget(cache_key)
+    if data is None:
+        alias = replica_alias()
+        bills = Bill.objects.using(alias).filter(user_id=user.pk)
+        month_start, month_end = month_bounds(today.year, today.month)
+        month, week, all_time = await asyncio.gather(
+            bills.filter(date__gte=month_start, date__lte=month_end).aaggregate(
+                total_bills=Count('id'), total_amount=Sum('total_amount'),
+            ),
+            bills.filter(date__gte=today - timedelta(days=7)).aaggregate(
+                total_bills=Count('id'), total_amount=Sum('total_amount'),
+            ),
+            _all_time(bills, user.pk, alias),
+        )
+        data = {
+            'current_month': _window(month),
+            'last_7_days': _window(week),
+            'all_time': _window(all_time),
+        }
+        await cache.aset(cache_key, data, settings.DASHBOARD_CACHE_TIMEOUT)
+    
+    return JsonResponse(data)
+
+
+@analytics_view
+async def weekly(request):
+    """
+    Get or generate weekly analysis
+    """
+    try:
+        week_offset = int(request.GET.get('week_offset', 0))
+    except ValueError:
+        return JsonResponse({'error': 'week_offset must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    refresh = request.GET.get('refresh') == 'true'
+    
+    today = timezone.now().date()
+    week_start = today - timedelta(days=today.weekday() + (7 * week_offset))
+    
+    analysis = None
+    if not refresh:
+        analysis = await WeeklyAnalysis.objects.filter(
+            user_id=request.user.pk, week_start=week_start, is_dirty=False
+        ).afirst()
+    if analysis is None:
+        analysis = await sync_to_async(get_weekly_analysis)(request.user, week_start, refresh=refresh)
+    analysis.user = request.user
+    
+    return JsonResponse(WeeklyAnalysisSerializer(analysis).data)
+
+
+@analytics_view
+async def monthly(request):
+    """
+    Get or generate monthly analysis
+    """
+    try:
+        month_offset = int(request.GET.get('month_offset', 0))
+    except ValueError:
+        return JsonResponse({'error': 'month_offset must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    refresh = request.GET.get('refresh') == 'true'
+    
+    today = timezone.now().date()
+    target_date = today - timedelta(days=30 * month_offset)
+    
+    analysis = None
+    if not refresh:
+        analysis = await MonthlyAnalysis.objects.filter(
+            user_id=request.user.pk, year=target_date.year, month=target_date.month, is_dirty=False
+        ).afirst()
+    if analysis is None:
+        analysis = await sync_to_async(get_monthly_analysis)(
+            request.user, target_date.year, target_date.month, refresh=refresh
+        )
+    analysis.user = request.user
+    
+    return JsonResponse(MonthlyAnalysisSerializer(analysis).data)
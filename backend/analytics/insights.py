@@ -0,0 +1,327 @@
+"""
+Batch anomaly and trend detection over the daily rollups.
+
+For a batch of users at a time, spend is loaded from ``DailyRollup`` into NumPy
+matrices with one row per series: daily bill totals per user, and weekly spend
+per (user, category) and per (user, vendor). Each detector then runs on a whole
+matrix at once with cumulative sums and array reductions, never looping over
+users in Python. Findings become ``Suggestion`` rows carrying a dedupe key, so
+running the engine again over the same data adds nothing new.
+"""
+import hashlib
+from datetime import date, timedelta
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.db.models import FloatField, Sum
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from billagent_backend.versioning import bump_data_version_on_commit
+from .models import DailyRollup, Suggestion
+from .rollups import week_start_for
+
+User = get_user_model()
+
+# Daily spend anomalies: a day is unusual when it sits ANOMALY_Z standard
+# deviations above the trailing DAILY_WINDOW-day baseline
+DAILY_WINDOW = 28
+ANOMALY_LOOKBACK_DAYS = 7
+ANOMALY_Z = 3.0
+
+# Category trends: least-squares slope over the last TREND_WEEKS full weeks,
+# relative to the average week, with a minimum goodness of fit
+TREND_WEEKS = 8
+TREND_MIN_WEEKLY_CHANGE = 0.10
+TREND_MIN_R2 = 0.6
+
+# Vendor spikes: the latest VENDOR_BLOCK_WEEKS-week block against the
+# previous blocks of the same length
+VENDOR_BLOCK_WEEKS = 4
+VENDOR_Z = 2.5
+VENDOR_MIN_INCREASE = 0.30
+
+# Spend below this (per day, week or block) is never worth a suggestion
+MIN_AMOUNT = 500.0
+
+HISTORY_DAYS = 730
+USERS_PER_BATCH = 1000
+
+
+def dedupe_key(*parts):
+    """
+    Join key parts, hashing the result if it would not fit the column
+    """
+    key = ':'.join(str(part) for part in parts)
+    if len(key) > 255:
+        key = f'{key[:200]}#{hashlib.sha1(key.encode()).hexdigest()}'
+    return key
+
+
+def series_matrix(rows, periods, period_of):
+    """
+    Build a dense (series x period) matrix from ``(key, day, amount)`` rows
+    
+    Returns the list of series keys (in row order) and the matrix.
+    """
+    index = {}
+    flat = []
+    amounts = []
+    for key, day, amount in rows:
+        row = index.setdefault(key, len(index))
+        flat.append(row * periods + period_of(day))
+        amounts.append(amount)
+    if not index:
+        return [], np.zeros((0, periods))
+    matrix = np.bincount(
+        np.asarray(flat, dtype=np.int64),
+        weights=np.asarray(amounts, dtype=np.float64),
+        minlength=len(index) * periods,
+    ).reshape(len(index), periods)
+    return list(index), matrix
+
+
+def grouped_spend(queryset, *fields):
+    """
+    Stream ``(*fields, day, total)`` rows of rollup amounts summed per group
+    
+    Totals come back as floats rather than Decimals, which keeps per-row
+    conversion out of the loading loop.
+    """
+    return (
+        queryset.values(*fields, 'day').annotate(total=Cast(Sum('amount'), FloatField()))
+        .values_list(*fields, 'day', 'total').iterator(chunk_size=10000)
+    )
+
+
+def daily_anomalies(matrix, window=DAILY_WINDOW, lookback=ANOMALY_LOOKBACK_DAYS, threshold=ANOMALY_Z,
+                    min_amount=MIN_AMOUNT):
+    """
+    Find days in the last ``lookback`` columns far above their trailing window
+    
+    Returns ``(rows, columns, amounts, baselines, scores)`` arrays.
+    """
+    series, days = matrix.shape
+    if days < window + 1:
+        empty = np.zeros(0)
+        return empty.astype(int), empty.astype(int), empty, empty, empty
+    # Prefix sums: the window [t - window, t) is a difference of two columns
+    zeros = np.zeros((series, 1))
+    totals = np.hstack([zeros, np.cumsum(matrix, axis=1)])
+    squares = np.hstack([zeros, np.cumsum(matrix ** 2, axis=1)])
+    active = np.hstack([zeros, np.cumsum(matrix > 0, axis=1)])
+    
+    columns = np.arange(max(days - lookback, window), days)
+    mean = (totals[:, columns] - totals[:, columns - window]) / window
+    variance = (squares[:, columns] - squares[:, columns - window]) / window - mean ** 2
+    # Floor the deviation so a perfectly flat baseline does not flag noise
+    std = np.maximum(np.sqrt(np.clip(variance, 0, None)), 0.1 * mean + 1.0)
+    active_days = active[:, columns] - active[:, columns - window]
+    values = matrix[:, columns]
+    
+    scores = (values - mean) / std
+    mask = (
+        (scores >= threshold)
+        & (values >= min_amount)
+        & (values >= 2 * mean)
+        & (active_days >= window // 4)
+    )
+    rows, offsets = np.nonzero(mask)
+    return rows, columns[offsets], values[rows, offsets], mean[rows, offsets], scores[rows, offsets]
+
+
+def linear_trends(matrix, weeks=TREND_WEEKS, min_change=TREND_MIN_WEEKLY_CHANGE, min_r2=TREND_MIN_R2,
+                  min_amount=MIN_AMOUNT):
+    """
+    Fit a line to the last ``weeks`` columns of every row at once
+    
+    Returns ``(rows, relative_slopes, levels, r2)`` for rows with a steady
+    rise or fall of at least ``min_change`` of the average week per week.
+    """
+    if matrix.shape[1] < weeks:
+        empty = np.zeros(0)
+        return empty.astype(int), empty, empty, empty
+    recent = matrix[:, -weeks:]
+    t = np.arange(weeks) - (weeks - 1) / 2
+    level = recent.mean(axis=1)
+    centered = recent - level[:, None]
+    slope = centered @ t / (t @ t)
+    total_ss = (centered ** 2).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r2 = np.where(total_ss > 0, (slope ** 2) * (t @ t) / total_ss, 0.0)
+        relative = np.where(level > 0, slope / level, 0.0)
+    mask = (
+        (np.abs(relative) >= min_change)
+        & (r2 >= min_r2)
+        & (level >= min_amount)
+        & ((recent > 0).sum(axis=1) >= weeks * 3 // 4)
+    )
+    rows = np.nonzero(mask)[0]
+    return rows, relative[rows], level[rows], r2[rows]
+
+
+def block_spikes(matrix, block=VENDOR_BLOCK_WEEKS, threshold=VENDOR_Z, min_increase=VENDOR_MIN_INCREASE,
+                 min_amount=MIN_AMOUNT):
+    """
+    Compare each row's latest ``block``-column total with its earlier blocks
+    
+    Returns ``(rows, latest, baselines, scores)`` for rows whose latest block is
+    well above both their usual level and its spread.
+    """
+    series, weeks = matrix.shape
+    blocks = weeks // block
+    if blocks < 4:
+        empty = np.zeros(0)
+        return empty.astype(int), empty, empty, empty
+    totals = matrix[:, weeks - blocks * block:].reshape(series, blocks, block).sum(axis=2)
+    history, latest = totals[:, :-1], totals[:, -1]
+    # Only blocks from the first one with any spend count as history, so a
+    # vendor used for a few months is not judged against empty years
+    first = np.argmax(history > 0, axis=1)
+    valid = np.arange(blocks - 1)[None, :] >= first[:, None]
+    counts = np.maximum(valid.sum(axis=1), 1)
+    mean = (history * valid).sum(axis=1) / counts
+    variance = (((history - mean[:, None]) * valid) ** 2).sum(axis=1) / counts
+    std = np.maximum(np.sqrt(variance), 0.1 * mean + 1.0)
+    scores = (latest - mean) / std
+    mask = (
+        (scores >= threshold)
+        & (latest >= mean * (1 + min_increase))
+        & (latest - mean >= min_amount)
+        & (counts >= 3)
+        & ((history > 0).sum(axis=1) >= counts // 2)
+    )
+    rows = np.nonzero(mask)[0]
+    return rows, latest[rows], mean[rows], scores[rows]
+
+
+def detect(user_ids, as_of, history_days=HISTORY_DAYS):
+    """
+    Run every detector for a batch of users; returns unsaved suggestions
+    """
+    start = week_start_for(as_of - timedelta(days=history_days - 1))
+    current_week = week_start_for(as_of)
+    days = (as_of - start).days + 1
+    weeks = (current_week - start).days // 7
+    start_ordinal = start.toordinal()
+    rollups = DailyRollup.objects.filter(user_id__in=user_ids, day__gte=start, day__lte=as_of).order_by()
+    bill_rows = rollups.filter(category=DailyRollup.BILL_TOTALS)
+    # Trends and spikes only look at complete weeks
+    weekly_rows = rollups.filter(day__lt=current_week)
+    
+    def day_index(day):
+        return day.toordinal() - start_ordinal
+    
+    def week_index(day):
+        return (day.toordinal() - start_ordinal) // 7
+    
+    suggestions = []
+    
+    keys, matrix = series_matrix(grouped_spend(bill_rows, 'user_id'), days, day_index)
+    for row, column, amount, baseline, score in zip(*daily_anomalies(matrix)):
+        day = start + timedelta(days=int(column))
+        suggestions.append(Suggestion(
+            user_id=keys[row],
+            suggestion_type='anomaly',
+            title=f'Unusual spending on {day:%d %b %Y}',
+            description=(
+                f'You spent ₹{amount:,.2f} on {day:%d %b}, {amount / max(baseline, 1):.1f}x your '
+                f'{DAILY_WINDOW}-day daily average of ₹{baseline:,.2f}. Check the bills from that day '
+                f'for duplicates or one-off purchases.'
+            ),
+            related_data={'day': day.isoformat(), 'amount': round(float(amount), 2),
+                          'baseline': round(float(baseline), 2), 'z_score': round(float(score), 2)},
+            dedupe_key=dedupe_key('anomaly', 'daily', day.isoformat()),
+        ))
+    
+    if weeks:
+        last_week = current_week - timedelta(days=7)
+        keys, matrix = series_matrix(
+            (((user_id, category), day, amount) for user_id, category, day, amount
+             in grouped_spend(weekly_rows.exclude(category=DailyRollup.BILL_TOTALS), 'user_id', 'category')),
+            weeks, week_index,
+        )
+        for row, relative, level, r2 in zip(*linear_trends(matrix)):
+            user_id, category = keys[row]
+            direction = 'up' if relative > 0 else 'down'
+            suggestions.append(Suggestion(
+                user_id=user_id,
+                suggestion_type='trend',
+                title=f'{category} spending is {"rising" if relative > 0 else "falling"}',
+                description=(
+                    f'Over the last {TREND_WEEKS} weeks your {category} spending has '
+                    f'{"grown" if relative > 0 else "dropped"} by about {abs(relative) * 100:.0f}% a week '
+                    f'(average ₹{level:,.2f} per week).'
+                ),
+                related_data={'category': category, 'weekly_change': round(float(relative), 4),
+                              'weekly_average': round(float(level), 2), 'r2': round(float(r2), 3),
+                              'week_start': last_week.isoformat()},
+                dedupe_key=dedupe_key('trend', 'category', category, direction, f'{last_week:%Y-%m}'),
+            ))
+        
+        keys, matrix = series_matrix(
+            (((user_id, vendor), day, amount) for user_id, vendor, day, amount
+             in grouped_spend(weekly_rows.filter(category=DailyRollup.BILL_TOTALS), 'user_id', 'vendor_name')),
+            weeks, week_index,
+        )
+        for row, latest, baseline, score in zip(*block_spikes(matrix)):
+            user_id, vendor = keys[row]
+            vendor = vendor or 'an unnamed vendor'
+            increase = (latest - baseline) / max(baseline, 1)
+            suggestions.append(Suggestion(
+                user_id=user_id,
+                suggestion_type='cost_saving',
+                title=f'Spending at {vendor} is up {increase * 100:.0f}%',
+                description=(
+                    f'You spent ₹{latest:,.2f} at {vendor} over the last {VENDOR_BLOCK_WEEKS} weeks against '
+                    f'a usual ₹{baseline:,.2f}. Compare prices with other suppliers or check for '
+                    f'price increases.'
+                ),
+                related_data={'vendor_name': vendor, 'amount': round(float(latest), 2),
+                              'baseline': round(float(baseline), 2), 'z_score': round(float(score), 2),
+                              'week_start': (current_week - timedelta(weeks=VENDOR_BLOCK_WEEKS)).isoformat()},
+                dedupe_key=dedupe_key('cost_saving', 'vendor', vendor, f'{current_week:%Y-%m}'),
+            ))
+    
+    return suggestions
+
+
+def save_suggestions(user_ids, suggestions, batch_size=1000):
+    """
+    Insert the suggestions that do not exist yet; returns how many were added
+    """
+    existing = set(
+        Suggestion.objects.filter(user_id__in=user_ids).exclude(dedupe_key='')
+        .values_list('user_id', 'dedupe_key')
+    )
+    new = []
+    for suggestion in suggestions:
+        key = (suggestion.user_id, suggestion.dedupe_key)
+        if key not in existing:
+            existing.add(key)
+            new.append(suggestion)
+    # ignore_conflicts covers a concurrent run inserting the same keys
+    Suggestion.objects.bulk_create(new, batch_size=batch_size, ignore_conflicts=True)
+    # bulk_create sends no signals, so bump the affected users' versions here
+    for user_id in {suggestion.user_id for suggestion in new}:
+        bump_data_version_on_commit(user_id)
+    return len(new)
+
+
+def generate_suggestions(user_ids=None, as_of=None, history_days=HISTORY_DAYS, users_per_batch=USERS_PER_BATCH):
+    """
+    Detect anomalies and trends for the given users (default: everyone)
+    
+    Returns the number of suggestions added.
+    """
+    as_of = as_of or timezone.now().date()
+    if isinstance(as_of, str):
+        as_of = date.fromisoformat(as_of)
+    if user_ids is None:
+        user_ids = list(User.objects.order_by('pk').values_list('pk', flat=True))
+    step = max(users_per_batch, 1)
+    created = 0
+    for offset in range(0, len(user_ids), step):
+        batch = user_ids[offset:offset + step]
+        created += save_suggestions(batch, detect(batch, as_of, history_days))
+    return created
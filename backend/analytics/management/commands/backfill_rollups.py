@@ -0,0 +1,44 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from analytics.rollups import rebuild_users
+from jobs.queue import enqueue
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily spend rollups from existing bills and items'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='usernames', default=[],
+                            help='Only rebuild this username (may be repeated)')
+        parser.add_argument('--users-per-batch', type=int, default=200,
+                            help='Number of users rebuilt per transaction')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows per bulk INSERT')
+        parser.add_argument('--enqueue', action='store_true',
+                            help='Queue each batch as a background job instead of running it here')
+    
+    def handle(self, *args, **options):
+        users = User.objects.order_by('pk')
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+        user_ids = list(users.values_list('pk', flat=True))
+        
+        step = max(options['users_per_batch'], 1)
+        total_rows = 0
+        for offset in range(0, len(user_ids), step):
+            chunk = user_ids[offset:offset + step]
+            if options['enqueue']:
+                enqueue('analytics.rebuild_rollups', {'user_ids': chunk, 'batch_size': options['batch_size']})
+                continue
+            total_rows += rebuild_users(chunk, batch_size=options['batch_size'])
+            self.stdout.write(f'Rebuilt {offset + len(chunk)}/{len(user_ids)} users')
+        
+        if options['enqueue']:
+            self.stdout.write(self.style.SUCCESS(f'Queued rollup rebuilds for {len(user_ids)} users'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {total_rows} rollup rows for {len(user_ids)} users'
+        ))
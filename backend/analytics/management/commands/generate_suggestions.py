@@ -0,0 +1,53 @@
+import time
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from analytics.insights import HISTORY_DAYS, USERS_PER_BATCH, generate_suggestions
+from jobs.queue import enqueue
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Detect spending anomalies and trends and store them as suggestions'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='usernames', default=[],
+                            help='Only analyse this username (may be repeated)')
+        parser.add_argument('--as-of', default=None,
+                            help='Analyse up to this date (YYYY-MM-DD, default today)')
+        parser.add_argument('--history-days', type=int, default=HISTORY_DAYS,
+                            help='Days of history loaded per user')
+        parser.add_argument('--users-per-batch', type=int, default=USERS_PER_BATCH,
+                            help='Users analysed together in one set of matrices')
+        parser.add_argument('--enqueue', action='store_true',
+                            help='Queue the run as a background job instead of running it here')
+    
+    def handle(self, *args, **options):
+        try:
+            as_of = date.fromisoformat(options['as_of']) if options['as_of'] else None
+        except ValueError:
+            raise CommandError('--as-of must be a date in YYYY-MM-DD format')
+        user_ids = None
+        if options['usernames']:
+            user_ids = list(User.objects.filter(username__in=options['usernames']).values_list('pk', flat=True))
+        
+        if options['enqueue']:
+            enqueue('analytics.generate_suggestions', {
+                'user_ids': user_ids, 'as_of': as_of.isoformat() if as_of else None,
+            })
+            self.stdout.write(self.style.SUCCESS('Queued suggestion generation'))
+            return
+        
+        started = time.monotonic()
+        created = generate_suggestions(
+            user_ids=user_ids,
+            as_of=as_of,
+            history_days=options['history_days'],
+            users_per_batch=options['users_per_batch'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Added {created} suggestions in {time.monotonic() - started:.1f}s'
+        ))
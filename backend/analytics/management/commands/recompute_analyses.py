@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from analytics.analyses import recompute_dirty
+
+
+class Command(BaseCommand):
+    help = 'Recompute weekly and monthly analyses that bill writes have marked dirty'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=500,
+                            help='Maximum analyses recomputed per pass')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running, polling for dirty analyses')
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Seconds to sleep between passes when idle (with --loop)')
+    
+    def handle(self, *args, **options):
+        while True:
+            count = recompute_dirty(limit=options['limit'])
+            if count:
+                self.stdout.write(f'Recomputed {count} analyses')
+            if not options['loop']:
+                break
+            if count < options['limit']:
+                time.sleep(options['interval'])
@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 
+from bills.models import Vendor
+
 User = get_user_model()
 
 
@@ -28,6 +30,9 @@ class WeeklyAnalysis(models.Model):
     # Trends
     trend_data = models.JSONField(default=dict, blank=True)
     
+    # Set when bills in this period change; cleared on recompute
+    is_dirty = models.BooleanField(default=False, db_index=True)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -66,6 +71,9 @@ class MonthlyAnalysis(models.Model):
     # Comparison with previous month
     growth_percentage = models.DecimalField(max_digits=5, decimal_places=2, default=0)
     
+    # Set when bills in this period change; cleared on recompute
+    is_dirty = models.BooleanField(default=False, db_index=True)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -97,6 +105,9 @@ class Suggestion(models.Model):
     # Related data
     related_data = models.JSONField(default=dict, blank=True)
     
+    # Identifies generated suggestions so re-running detection skips them
+    dedupe_key = models.CharField(max_length=255, blank=True, editable=False)
+    
     # Status
     is_read = models.BooleanField(default=False)
     is_dismissed = models.BooleanField(default=False)
@@ -105,6 +116,46 @@ class Suggestion(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'dedupe_key'],
+                condition=~models.Q(dedupe_key=''),
+                name='analytics_suggestion_unique_dedupe_key',
+            ),
+        ]
     
     def __str__(self):
         return f"{self.suggestion_type}: {self.title}"
+
+
+class DailyRollup(models.Model):
+    """
+    Per-day spend of a user by vendor and item category
+    
+    Rows with ``category == BILL_TOTALS`` carry bill-level figures (bill count,
+    bill totals and tax); every other row carries the line items of one
+    category for that vendor and day.
+    """
+    BILL_TOTALS = ''
+    UNCATEGORIZED = 'Uncategorized'
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_rollups')
+    
+    day = models.DateField()
+    # Canonical vendor (null for bills without a vendor name) and its display name
+    vendor = models.ForeignKey(Vendor, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    vendor_name = models.CharField(max_length=255, blank=True)
+    category = models.CharField(max_length=100, blank=True)
+    
+    # Metrics
+    bill_count = models.IntegerField(default=0)
+    item_count = models.IntegerField(default=0)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    tax = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        ordering = ['-day']
+        unique_together = ['user', 'day', 'vendor', 'category']
+    
+    def __str__(self):
+        return f"Rollup {self.day} {self.vendor_name} / {self.category or 'bills'} - {self.user_id}"
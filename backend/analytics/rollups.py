@@ -0,0 +1,217 @@
+"""
+Daily spend rollups that weekly, monthly and range analyses are composed from.
+
+Bill and item writes schedule the affected (user, day) pairs for a rebuild when
+the surrounding transaction commits; each rebuild re-aggregates just those days
+and marks the weekly and monthly analyses covering them as dirty, after which
+the user's data version is bumped.
+"""
+import calendar
+import threading
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+
+from billagent_backend.versioning import bump_data_version
+from bills.models import Bill, BillItem
+from jobs.queue import enqueue
+from .models import DailyRollup, MonthlyAnalysis, WeeklyAnalysis
+
+_pending = threading.local()
+
+
+def week_start_for(day):
+    return day - timedelta(days=day.weekday())
+
+
+def month_bounds(year, month):
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+def next_month(year, month):
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def previous_month(year, month):
+    return (year - 1, 12) if month == 1 else (year, month - 1)
+
+
+def mark_dirty(user_id, days):
+    """
+    Flag the weekly and monthly analyses covering ``days`` for recomputation
+    """
+    days = {day for day in days if day is not None}
+    if not days:
+        return
+    weeks = {week_start_for(day) for day in days}
+    months = set()
+    for day in days:
+        months.add((day.year, day.month))
+        # The following month's growth percentage depends on this one
+        months.add(next_month(day.year, day.month))
+
+    WeeklyAnalysis.objects.filter(
+        user_id=user_id, week_start__in=weeks, is_dirty=False
+    ).update(is_dirty=True)
+    month_filter = Q()
+    for year, month in months:
+        month_filter |= Q(year=year, month=month)
+    MonthlyAnalysis.objects.filter(month_filter, user_id=user_id, is_dirty=False).update(is_dirty=True)
+
+
+def build_rollups(bills, items):
+    """
+    Build unsaved DailyRollup rows from grouped bill and item aggregates
+    """
+    rows = {}
+    # Grouped on the canonical vendor; bills not yet linked to one (see
+    # backfill_vendors) fall back to their own vendor name
+    bill_groups = (
+        bills.filter(date__isnull=False)
+        .order_by()
+        .values('user_id', 'date', 'vendor_id', vendor_label=Coalesce('vendor__name', 'vendor_name'))
+        .annotate(bill_count=Count('id'), amount=Sum('total_amount'), tax=Sum('tax_amount'))
+    )
+    for group in bill_groups.iterator():
+        key = (group['user_id'], group['date'], group['vendor_id'], group['vendor_label'], DailyRollup.BILL_TOTALS)
+        rows[key] = DailyRollup(
+            user_id=group['user_id'], day=group['date'], vendor_id=group['vendor_id'],
+            vendor_name=group['vendor_label'], category=DailyRollup.BILL_TOTALS,
+            bill_count=group['bill_count'], amount=group['amount'] or 0, tax=group['tax'] or 0,
+        )
+    
+    item_groups = (
+        items.filter(bill__date__isnull=False)
+        .order_by()
+        .values('bill__user_id', 'bill__date', 'bill__vendor_id', 'category',
+                vendor_label=Coalesce('bill__vendor__name', 'bill__vendor_name'))
+        .annotate(item_count=Count('id'), amount=Sum('total_price'))
+    )
+    for group in item_groups.iterator():
+        category = group['category'] or DailyRollup.UNCATEGORIZED
+        key = (group['bill__user_id'], group['bill__date'], group['bill__vendor_id'], group['vendor_label'], category)
+        row = rows.get(key)
+        if row is None:
+            row = rows[key] = DailyRollup(
+                user_id=group['bill__user_id'], day=group['bill__date'], vendor_id=group['bill__vendor_id'],
+                vendor_name=group['vendor_label'], category=category,
+            )
+        # '' and 'Uncategorized' items fold into the same row
+        row.item_count += group['item_count']
+        row.amount += group['amount'] or 0
+    return list(rows.values())
+
+
+def refresh_days(user_id, days):
+    """
+    Rebuild a user's rollup rows for the given days from bills and items
+    """
+    days = {day for day in days if day is not None}
+    if not days:
+        return
+    with transaction.atomic():
+        DailyRollup.objects.filter(user_id=user_id, day__in=days).delete()
+        DailyRollup.objects.bulk_create(build_rollups(
+            Bill.objects.filter(user_id=user_id, date__in=days),
+            BillItem.objects.filter(bill__user_id=user_id, bill__date__in=days),
+        ))
+        mark_dirty(user_id, days)
+
+
+def rebuild_users(user_ids, batch_size=1000):
+    """
+    Rebuild every rollup row for a set of users; returns the number of rows written
+    """
+    with transaction.atomic():
+        DailyRollup.objects.filter(user_id__in=user_ids).delete()
+        rows = build_rollups(
+            Bill.objects.filter(user_id__in=user_ids),
+            BillItem.objects.filter(bill__user_id__in=user_ids),
+        )
+        DailyRollup.objects.bulk_create(rows, batch_size=batch_size)
+        WeeklyAnalysis.objects.filter(user_id__in=user_ids).update(is_dirty=True)
+        MonthlyAnalysis.objects.filter(user_id__in=user_ids).update(is_dirty=True)
+    return len(rows)
+
+
+def schedule_refresh(user_id, days):
+    """
+    Queue (user, day) pairs for a rebuild once the current transaction commits
+    """
+    if not hasattr(_pending, 'days'):
+        _pending.days = defaultdict(set)
+    _pending.days[user_id].update(day for day in days if day is not None)
+    # Every write registers a flush; the first one to run drains the queue and
+    # the rest find it empty. Pairs left behind by a rollback are rebuilt by
+    # the next flush, which is harmless since rebuilds are idempotent.
+    transaction.on_commit(flush_pending)
+
+
+def flush_pending():
+    """
+    Rebuild every queued (user, day) pair, then bump the users' data versions
+    """
+    pending = getattr(_pending, 'days', None)
+    if not pending:
+        return
+    _pending.days = defaultdict(set)
+    try:
+        for user_id, days in pending.items():
+            refresh_days(user_id, days)
+    finally:
+        # Only now: a request seeing the new version (ETags, cached series and
+        # dashboards) must also see the rebuilt rollups and dirty analyses
+        for user_id in pending:
+            bump_data_version(user_id)
+    # The analyses just marked dirty are recomputed by the job worker
+    schedule_recompute()
+
+
+def schedule_recompute():
+    """
+    Queue a background recompute of dirty analyses (coalesced while queued)
+    """
+    return enqueue('analytics.recompute_dirty', dedupe_key='analytics.recompute_dirty')
+
+
+def summarize(user_id, start, end):
+    """
+    Compose analysis metrics for ``start``..``end`` (inclusive) from rollups
+    """
+    rollups = DailyRollup.objects.filter(user_id=user_id, day__gte=start, day__lte=end).order_by()
+    
+    total_bills = 0
+    total_amount = Decimal('0')
+    total_tax = Decimal('0')
+    category_breakdown = {}
+    for row in rollups.values('category').annotate(
+        bills=Sum('bill_count'), amount=Sum('amount'), tax=Sum('tax')
+    ):
+        if row['category'] == DailyRollup.BILL_TOTALS:
+            total_bills = row['bills'] or 0
+            total_amount = row['amount'] or Decimal('0')
+            total_tax = row['tax'] or Decimal('0')
+        else:
+            category_breakdown[row['category']] = float(row['amount'] or 0)
+    
+    top_vendors = [
+        {'vendor_id': row['vendor_id'], 'vendor_name': row['vendor_name'],
+         'total': float(row['total']), 'count': row['count']}
+        for row in rollups.filter(category=DailyRollup.BILL_TOTALS)
+        .values('vendor_id', 'vendor_name')
+        .annotate(total=Sum('amount'), count=Sum('bill_count'))
+        .order_by('-total')[:5]
+    ]
+    
+    return {
+        'total_bills': total_bills,
+        'total_amount': total_amount,
+        'total_tax': total_tax,
+        'average_bill_amount': (total_amount / total_bills).quantize(Decimal('0.01')) if total_bills else Decimal('0'),
+        'category_breakdown': category_breakdown,
+        'top_vendors': top_vendors,
+    }
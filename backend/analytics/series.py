@@ -0,0 +1,155 @@
+"""
+Spend time series bucketed by day, week or month.
+
+Series are read from the daily rollups with one grouped query
+(``TruncDay``/``TruncWeek``/``TruncMonth`` over ``DailyRollup.day``), so a
+chart of any range costs a single round-trip. Buckets without spend are
+filled with zeros, and an optional split breaks each bucket down by item
+category or by vendor.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db.models import Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+
+from .models import DailyRollup
+from .rollups import next_month, week_start_for
+
+GRANULARITIES = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+SPLITS = {
+    'category': 'category',
+    'vendor': 'vendor_name',
+}
+
+# Splits with more keys than this fold the smallest ones into OTHER
+DEFAULT_SPLIT_LIMIT = 10
+OTHER = 'Other'
+
+MAX_BUCKETS = 2000
+
+
+class SeriesError(ValueError):
+    """
+    The requested series parameters are invalid
+    """
+
+
+def bucket_start(day, granularity):
+    """
+    Return the first day of the bucket containing ``day``
+    """
+    if granularity == 'week':
+        return week_start_for(day)
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def bucket_starts(start, end, granularity):
+    """
+    List the start dates of every bucket overlapping ``start``..``end``
+    """
+    buckets = []
+    current = bucket_start(start, granularity)
+    while current <= end:
+        buckets.append(current)
+        if granularity == 'week':
+            current += timedelta(days=7)
+        elif granularity == 'month':
+            year, month = next_month(current.year, current.month)
+            current = current.replace(year=year, month=month)
+        else:
+            current += timedelta(days=1)
+    return buckets
+
+
+def count_buckets(start, end, granularity):
+    """
+    Return how many buckets a series over ``start``..``end`` would have
+    """
+    first = bucket_start(start, granularity)
+    if granularity == 'week':
+        return (end - first).days // 7 + 1
+    if granularity == 'month':
+        return (end.year - first.year) * 12 + end.month - first.month + 1
+    return (end - start).days + 1
+
+
+def spend_series(user_id, start, end, granularity='day', split=None, limit=DEFAULT_SPLIT_LIMIT):
+    """
+    Return the user's spend for ``start``..``end`` (inclusive) in buckets
+    
+    The result holds the bucket start dates, the bill totals and bill counts
+    per bucket and, with ``split``, one list of amounts per category or vendor
+    (the largest ``limit`` keys, the rest summed into ``Other``). Category
+    splits add up item amounts, so they need not match the bill totals.
+    """
+    if granularity not in GRANULARITIES:
+        raise SeriesError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+    if split is not None and split not in SPLITS:
+        raise SeriesError(f"split must be one of {', '.join(SPLITS)}")
+    if start > end:
+        raise SeriesError('start_date must not be after end_date')
+    if count_buckets(start, end, granularity) > MAX_BUCKETS:
+        raise SeriesError(f'Range too long: at most {MAX_BUCKETS} buckets per series')
+    
+    buckets = bucket_starts(start, end, granularity)
+    index = {bucket: position for position, bucket in enumerate(buckets)}
+    totals = [0.0] * len(buckets)
+    bill_counts = [0] * len(buckets)
+    split_amounts = defaultdict(lambda: [0.0] * len(buckets))
+    
+    rollups = DailyRollup.objects.filter(user_id=user_id, day__gte=start, day__lte=end).order_by()
+    if split != 'category':
+        # Vendor splits and plain totals only need the bill-level rows
+        rollups = rollups.filter(category=DailyRollup.BILL_TOTALS)
+    split_field = SPLITS.get(split)
+    rows = (
+        rollups.annotate(bucket=GRANULARITIES[granularity]('day'))
+        .values('bucket', *([split_field] if split_field else []))
+        .annotate(amount=Sum('amount'), bills=Sum('bill_count'))
+    )
+    for row in rows:
+        position = index[row['bucket']]
+        amount = float(row['amount'] or 0)
+        if split == 'category' and row['category'] != DailyRollup.BILL_TOTALS:
+            split_amounts[row['category']][position] += amount
+            continue
+        totals[position] += amount
+        bill_counts[position] += row['bills'] or 0
+        if split == 'vendor':
+            split_amounts[row['vendor_name']][position] += amount
+    
+    series = {
+        'granularity': granularity,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'buckets': [bucket.isoformat() for bucket in buckets],
+        'totals': [round(amount, 2) for amount in totals],
+        'bill_counts': bill_counts,
+    }
+    if split is not None:
+        series['split'] = split
+        series['series'] = fold_split(split_amounts, limit)
+    return series
+
+
+def fold_split(split_amounts, limit):
+    """
+    Keep the ``limit`` largest split keys and sum the rest into ``Other``
+    """
+    ranked = sorted(split_amounts.items(), key=lambda entry: (-sum(entry[1]), entry[0]))
+    kept = dict(ranked[:limit]) if limit else dict(ranked)
+    rest = ranked[len(kept):]
+    if rest:
+        other = kept.setdefault(OTHER, [0.0] * len(ranked[0][1]))
+        for _, amounts in rest:
+            for position, amount in enumerate(amounts):
+                other[position] += amount
+    return {key: [round(amount, 2) for amount in amounts] for key, amounts in kept.items()}
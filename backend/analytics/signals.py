@@ -0,0 +1,25 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from billagent_backend.versioning import bump_data_version_on_commit
+from bills.signals import bills_changed
+from .models import Suggestion
+from .rollups import schedule_refresh
+
+
+@receiver(bills_changed)
+def refresh_rollups(sender, user_id, days, **kwargs):
+    """
+    Rebuild the daily rollups touched by a bill or item write
+    """
+    schedule_refresh(user_id, days)
+
+
+@receiver(post_save, sender=Suggestion)
+@receiver(post_delete, sender=Suggestion)
+def bump_version_on_suggestion(sender, instance, raw=False, **kwargs):
+    """
+    Invalidate the user's conditional GETs when their suggestions change
+    """
+    if not raw:
+        bump_data_version_on_commit(instance.user_id)
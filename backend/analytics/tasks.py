@@ -0,0 +1,24 @@
+from jobs.registry import task
+
+from .analyses import recompute_dirty
+from .insights import generate_suggestions as detect_suggestions
+from .rollups import rebuild_users, schedule_recompute
+
+RECOMPUTE_BATCH_SIZE = 500
+
+
+@task('analytics.recompute_dirty')
+def recompute_dirty_analyses(limit=RECOMPUTE_BATCH_SIZE):
+    if recompute_dirty(limit=limit) >= limit:
+        schedule_recompute()
+
+
+@task('analytics.rebuild_rollups', priority=-10, timeout=60 * 60)
+def rebuild_rollups(user_ids, batch_size=1000):
+    rebuild_users(user_ids, batch_size=batch_size)
+    schedule_recompute()
+
+
+@task('analytics.generate_suggestions', priority=-10, timeout=60 * 60)
+def generate_suggestions(user_ids=None, as_of=None):
+    detect_suggestions(user_ids=user_ids, as_of=as_of)
@@ -1,3 +1,373 @@
-from django.test import TestCase
+import io
+import json
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from PIL import Image
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from billagent_backend.caches import cache_config
+from billagent_backend.database import database_config
+from billagent_backend.routers import ReplicaRouter, replica_alias, use_primary
+from bills.models import Bill, BillItem
+from jobs.queue import claim, enqueue, run_job
+from . import async_views
+from .analyses import get_monthly_analysis, get_weekly_analysis
+from .insights import generate_suggestions
+from .models import DailyRollup, MonthlyAnalysis, Suggestion, WeeklyAnalysis
+from .rollups import summarize
+from .series import spend_series
+
+
+User = get_user_model()
+
+
+def make_user(username='alice', **kwargs):
+    return User.objects.create_user(username=username, password='test-password-123', **kwargs)
+
+
+def client_for(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+def make_bill(user, amount='10.00', tax='1.00', status='pending', day=date(2026, 10, 12), vendor='D-Mart',
+              items=(), **kwargs):
+    """
+    Create a bill with ``items`` given as (name, price, category) tuples
+    """
+    bill = Bill.objects.create(user=user, total_amount=Decimal(amount), tax_amount=Decimal(tax), status=status,
+                               date=day, vendor_name=vendor, image='bills/test.png', **kwargs)
+    for name, price, category in items:
+        BillItem.objects.create(bill=bill, name=name, unit_price=Decimal(price), total_price=Decimal(price),
+                                category=category)
+    return bill
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.api = client_for(self.user)
+    
+    def week(self):
+        return summarize(self.user.pk, date(2026, 10, 12), date(2026, 10, 18))
+    
+    def test_summary_follows_bill_and_item_writes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = make_bill(self.user, '30.00', '3.00', day=date(2026, 10, 12), vendor='A',
+                              items=[('x', '10', 'Food'), ('y', '20', '')])
+            second = make_bill(self.user, '50.00', '5.00', day=date(2026, 10, 13), vendor='B',
+                               items=[('z', '50', 'Food')])
+        summary = self.week()
+        self.assertEqual(summary['total_bills'], 2)
+        self.assertEqual(float(summary['total_amount']), 80.0)
+        self.assertEqual(summary['category_breakdown'], {'Food': 60.0, 'Uncategorized': 20.0})
+        self.assertEqual(summary['top_vendors'][0]['vendor_name'], 'B')
+        self.assertEqual(summary['top_vendors'][0]['total'], 50.0)
+        
+        # Moving a bill to another day refreshes both days
+        with self.captureOnCommitCallbacks(execute=True):
+            second.date = date(2026, 11, 2)
+            second.save()
+        self.assertEqual(self.week()['category_breakdown'], {'Food': 10.0, 'Uncategorized': 20.0})
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            BillItem.objects.get(name='x').delete()
+        self.assertEqual(self.week()['category_breakdown'], {'Uncategorized': 20.0})
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(self.week()['total_bills'], 0)
+        
+        response = self.api.get('/api/analytics/summary/?start_date=2026-11-01&end_date=2026-11-30')
+        self.assertEqual(response.json()['total_bills'], 1)
+    
+    def test_summary_rejects_bad_dates(self):
+        response = self.api.get('/api/analytics/summary/?start_date=2026-13-01&end_date=2026-11-30')
+        self.assertEqual(response.status_code, 400)
+    
+    def test_backfill_rollups(self):
+        make_bill(self.user, day=date(2026, 10, 12))
+        make_bill(self.user, day=date(2026, 10, 13))
+        DailyRollup.objects.all().delete()
+        call_command('backfill_rollups', stdout=io.StringIO())
+        self.assertEqual(DailyRollup.objects.count(), 2)
+        self.assertEqual(self.api.get('/api/analytics/weekly/').status_code, 200)
+        self.assertIn('total_bills', self.api.get('/api/analytics/monthly/').json())
+    
+    def test_created_bill_is_rolled_up(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (2, 2)).save(buffer, 'PNG')
+        image = SimpleUploadedFile('bill.png', buffer.getvalue(), 'image/png')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.api.post('/api/bills/', {'image': image, 'date': '2026-10-12', 'total_amount': '5'},
+                                     format='multipart')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(DailyRollup.objects.count(), 1)
+
+
+class DirtyAnalysisTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.api = client_for(self.user)
+    
+    def test_bill_writes_mark_analyses_dirty(self):
+        self.assertEqual(self.api.get('/api/analytics/weekly/').json()['total_bills'], 0)
+        self.api.get('/api/analytics/monthly/')
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            make_bill(self.user, '12.00', day=timezone.now().date(), items=[('a', '12', 'Food')])
+        self.assertTrue(WeeklyAnalysis.objects.get().is_dirty)
+        self.assertTrue(MonthlyAnalysis.objects.get().is_dirty)
+        
+        weekly = self.api.get('/api/analytics/weekly/').json()
+        self.assertEqual(weekly['total_bills'], 1)
+        self.assertEqual(weekly['category_breakdown'], {'Food': 12.0})
+        self.assertFalse(WeeklyAnalysis.objects.get().is_dirty)
+        
+        call_command('recompute_analyses', stdout=io.StringIO())
+        monthly = MonthlyAnalysis.objects.get()
+        self.assertFalse(monthly.is_dirty)
+        self.assertEqual(float(monthly.total_amount), 12.0)
+    
+    def test_clean_analysis_is_served_without_recomputing(self):
+        self.api.get('/api/analytics/weekly/')
+        with self.assertNumQueries(1):
+            self.api.get('/api/analytics/weekly/')
+
+
+class DashboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.api = client_for(self.user)
+    
+    def test_dashboard_is_one_query_and_cached_per_data_version(self):
+        with self.assertNumQueries(1):
+            data = self.api.get('/api/analytics/dashboard/').json()
+        self.assertEqual(data['all_time']['total_bills'], 0)
+        with self.assertNumQueries(0):
+            self.api.get('/api/analytics/dashboard/')
+        
+        today = timezone.now().date()
+        with self.captureOnCommitCallbacks(execute=True):
+            make_bill(self.user, '12.00', day=today)
+            make_bill(self.user, '8.00', day=today.replace(year=today.year - 1))
+        with self.assertNumQueries(1):
+            data = self.api.get('/api/analytics/dashboard/').json()
+        self.assertEqual(data['current_month'], {'total_bills': 1, 'total_amount': 12.0})
+        self.assertEqual(data['all_time'], {'total_bills': 2, 'total_amount': 20.0})
+        self.assertEqual(data['last_7_days']['total_bills'], 1)
+
+
+class SuggestionTests(TestCase):
+    # A Wednesday
+    as_of = date(2026, 10, 14)
+    
+    def rollup(self, user, day, amount, vendor='V', category=''):
+        return DailyRollup(user=user, day=day, vendor_name=vendor, category=category, amount=Decimal(amount),
+                           bill_count=1)
+    
+    def test_anomaly_trend_and_vendor_spike(self):
+        user = make_user()
+        steady = make_user('steady')
+        rows = []
+        for days_ago in range(1, 120):
+            day = self.as_of - timedelta(days=days_ago)
+            amount = 1000 + (days_ago % 3) * 10
+            rows += [self.rollup(user, day, amount), self.rollup(steady, day, amount)]
+        # One day far above the usual daily spend
+        rows.append(self.rollup(user, self.as_of, 9000, vendor='Spike'))
+        # Dairy rising by a quarter every week for eight full weeks
+        this_week = self.as_of - timedelta(days=self.as_of.weekday())
+        for week in range(8):
+            week_start = this_week - timedelta(weeks=8 - week)
+            rows.append(self.rollup(user, week_start, 1000 * (1 + 0.25 * week), category='Dairy'))
+            rows.append(self.rollup(steady, week_start, 1000, category='Dairy'))
+        # A vendor at 500 a week whose last four weeks jumped to 3000
+        for weeks_ago in range(1, 45):
+            day = this_week - timedelta(weeks=weeks_ago) + timedelta(days=1)
+            rows.append(self.rollup(user, day, 3000 if weeks_ago <= 4 else 500, vendor='Acme'))
+        DailyRollup.objects.bulk_create(rows)
+        
+        created = generate_suggestions(as_of=self.as_of)
+        types = set(Suggestion.objects.filter(user=user).values_list('suggestion_type', flat=True))
+        self.assertEqual(types, {'anomaly', 'trend', 'cost_saving'})
+        self.assertFalse(Suggestion.objects.filter(user=steady).exists())
+        
+        # Existing suggestions, dismissed or not, are not repeated
+        self.assertEqual(generate_suggestions(as_of=self.as_of), 0)
+        Suggestion.objects.update(is_dismissed=True)
+        enqueue('analytics.generate_suggestions', {'as_of': self.as_of.isoformat()})
+        [job] = claim('worker-1')
+        self.assertTrue(run_job(job))
+        self.assertEqual(Suggestion.objects.count(), created)
+    
+    def test_no_data(self):
+        make_user()
+        self.assertEqual(generate_suggestions(), 0)
+        self.assertEqual(generate_suggestions(user_ids=[]), 0)
+
+
+class SpendSeriesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.api = client_for(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            make_bill(self.user, '10', day=date(2026, 3, 2), vendor='A', items=[('r', '6', 'G'), ('m', '4', 'D')])
+            make_bill(self.user, '5', day=date(2026, 3, 4), vendor='B', items=[('r', '5', 'G')])
+            make_bill(self.user, '7', day=date(2026, 4, 20), vendor='A')
+    
+    def test_daily_series_is_one_query_with_empty_buckets(self):
+        with self.assertNumQueries(1):
+            series = spend_series(self.user.pk, date(2026, 3, 1), date(2026, 3, 5), 'day')
+        self.assertEqual(series['totals'], [0, 10, 0, 5, 0])
+        self.assertEqual(series['bill_counts'], [0, 1, 0, 1, 0])
+    
+    def test_weekly_split_by_vendor(self):
+        series = spend_series(self.user.pk, date(2026, 3, 1), date(2026, 4, 30), 'week', 'vendor')
+        # Weeks start on Monday, so the first bucket starts before the range
+        self.assertEqual(series['buckets'][0], '2026-02-23')
+        self.assertEqual(series['totals'][1], 15)
+        self.assertEqual(series['series']['A'][1], 10)
+        self.assertEqual(sum(series['series']['A']), 17)
+    
+    def test_split_limit_folds_the_rest_into_other(self):
+        series = spend_series(self.user.pk, date(2026, 1, 1), date(2026, 12, 31), 'month', 'category', limit=1)
+        self.assertEqual(len(series['buckets']), 12)
+        self.assertEqual(series['series'], {'G': [0, 0, 11] + [0] * 9, 'Other': [0, 0, 4] + [0] * 9})
+        self.assertEqual(series['totals'][2:4], [15, 7])
+    
+    def test_endpoint(self):
+        response = self.api.get('/api/analytics/series/?start_date=2026-03-01&end_date=2026-03-31'
+                                '&granularity=week&split=category')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['series']['G'][1], 11)
+        self.assertEqual(self.api.get('/api/analytics/series/').status_code, 200)
+        for query in ('granularity=year', 'start_date=2000-01-01&end_date=2026-01-01', 'limit=x'):
+            self.assertEqual(self.api.get(f'/api/analytics/series/?{query}').status_code, 400, query)
+    
+    def test_analyses_have_trend_data(self):
+        weekly = get_weekly_analysis(self.user, date(2026, 3, 2))
+        self.assertEqual(weekly.trend_data['totals'], [10, 0, 5, 0, 0, 0, 0])
+        monthly = get_monthly_analysis(self.user, 2026, 3)
+        self.assertEqual(monthly.trend_data['granularity'], 'week')
+        self.assertEqual(monthly.trend_data['totals'][1], 15)
+
+
+class DatabaseConfigTests(SimpleTestCase):
+    def test_sqlite(self):
+        config = database_config('sqlite:///db.sqlite3', '/srv/app')
+        self.assertEqual(config['ENGINE'], 'billagent_backend.sqlite')
+        self.assertEqual(str(config['NAME']), '/srv/app/db.sqlite3')
+        self.assertEqual(config['OPTIONS']['pragmas']['journal_mode'], 'WAL')
+        self.assertEqual(str(database_config('sqlite:////data/db.sqlite3', '/srv/app')['NAME']),
+                         '/data/db.sqlite3')
+    
+    def test_postgres(self):
+        config = database_config('postgres://bill:s%40cret@db:6432/billagent?sslmode=require', '/srv/app',
+                                 pgbouncer=True)
+        self.assertEqual((config['USER'], config['PASSWORD'], config['HOST'], config['PORT'], config['NAME']),
+                         ('bill', 's@cret', 'db', '6432', 'billagent'))
+        self.assertTrue(config['DISABLE_SERVER_SIDE_CURSORS'])
+        self.assertEqual(config['OPTIONS']['sslmode'], 'require')
+    
+    def test_unknown_scheme(self):
+        with self.assertRaises(ImproperlyConfigured):
+            database_config('mysql://db/billagent', '/srv/app')
+
+
+class CacheConfigTests(SimpleTestCase):
+    def test_backends(self):
+        self.assertEqual(cache_config('locmem://billagent'), {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'billagent',
+        })
+        redis = cache_config('redis://:secret@cache:6379/1', workers=4)
+        self.assertEqual(redis['BACKEND'], 'django.core.cache.backends.redis.RedisCache')
+        self.assertEqual(redis['LOCATION'], 'redis://:secret@cache:6379/1')
+        self.assertEqual(cache_config('memcached://a:11211,b:11211')['LOCATION'], ['a:11211', 'b:11211'])
+    
+    def test_instrumented(self):
+        config = cache_config('redis://cache:6379/0', instrument='monitoring.cache.InstrumentedCache')
+        self.assertEqual(config['BACKEND'], 'monitoring.cache.InstrumentedCache')
+        self.assertEqual(config['CACHE_BACKEND'], 'django.core.cache.backends.redis.RedisCache')
+    
+    def test_process_local_cache_refused_with_several_workers(self):
+        with self.assertRaises(ImproperlyConfigured):
+            cache_config('locmem://billagent', workers=4)
+        with self.assertRaises(ImproperlyConfigured):
+            cache_config('file:///tmp/cache')
+
+
+@mock.patch('billagent_backend.routers.replica_configured', return_value=True)
+class ReplicaRouterTests(SimpleTestCase):
+    def test_analytics_reads_go_to_the_replica(self, configured):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(DailyRollup), 'replica')
+        self.assertEqual(router.db_for_write(DailyRollup), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'analytics'))
+    
+    def test_use_primary(self, configured):
+        with use_primary():
+            self.assertEqual(replica_alias(), 'default')
+        self.assertEqual(replica_alias(), 'replica')
+
+
+class AsyncAnalyticsViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.api = client_for(self.user)
+        today = timezone.now().date()
+        with self.captureOnCommitCallbacks(execute=True):
+            make_bill(self.user, amount='10.00', day=today, items=[('a', '4', 'Food')])
+            make_bill(self.user, amount='5.00', day=today - timedelta(days=3))
+            make_bill(self.user, amount='7.00', day=date(2020, 1, 1))
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        self.factory = AsyncRequestFactory()
+    
+    def call(self, view, path, **headers):
+        return async_to_sync(view)(self.factory.get(path, headers={**self.headers, **headers}))
+    
+    def test_payloads_match_the_sync_views(self):
+        for name, view in (('dashboard', async_views.dashboard), ('weekly', async_views.weekly),
+                           ('monthly', async_views.monthly)):
+            expected = self.api.get(f'/api/analytics/{name}/').json()
+            cache.clear()
+            response = self.call(view, f'/api/analytics/{name}/')
+            self.assertEqual(response.status_code, 200, response.content)
+            data = json.loads(response.content)
+            for field in ('created_at', 'updated_at'):
+                expected.pop(field, None)
+                data.pop(field, None)
+            self.assertEqual(data, expected, name)
+            response = self.call(view, f'/api/analytics/{name}/', **{'If-None-Match': response['ETag']})
+            self.assertEqual(response.status_code, 304)
+    
+    def test_errors(self):
+        response = async_to_sync(async_views.dashboard)(self.factory.get('/api/analytics/dashboard/'))
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('Bearer', response['WWW-Authenticate'])
+        response = async_to_sync(async_views.weekly)(self.factory.post('/api/analytics/weekly/',
+                                                                        headers=self.headers))
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(self.call(async_views.weekly, '/api/analytics/weekly/?week_offset=x').status_code, 400)
+    
+    def test_dirty_analysis_is_recomputed(self):
+        before = json.loads(self.call(async_views.weekly, '/api/analytics/weekly/').content)
+        with self.captureOnCommitCallbacks(execute=True):
+            make_bill(self.user, amount='100.00', day=timezone.now().date())
+        after = json.loads(self.call(async_views.weekly, '/api/analytics/weekly/').content)
+        self.assertEqual(float(after['total_amount']), float(before['total_amount']) + 100)
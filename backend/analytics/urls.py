@@ -1,11 +1,23 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from . import async_views
 from .views import AnalyticsViewSet, SuggestionViewSet
 
 router = DefaultRouter()
 router.register(r'suggestions', SuggestionViewSet, basename='suggestion')
 router.register(r'', AnalyticsViewSet, basename='analytics')
 
-urlpatterns = [
+urlpatterns = []
+
+# Under an ASGI server the async views take over these endpoints
+if settings.ANALYTICS_ASYNC_VIEWS:
+    urlpatterns += [
+        path('dashboard/', async_views.dashboard, name='analytics-dashboard-async'),
+        path('weekly/', async_views.weekly, name='analytics-weekly-async'),
+        path('monthly/', async_views.monthly, name='analytics-monthly-async'),
+    ]
+
+urlpatterns += [
     path('', include(router.urls)),
 ]
@@ -2,19 +2,37 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Sum, Avg, Count
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
 from django.utils import timezone
-from datetime import timedelta, datetime
-from .models import WeeklyAnalysis, MonthlyAnalysis, Suggestion
+from django.utils.dateparse import parse_date
+from datetime import timedelta
+from .analyses import get_monthly_analysis, get_weekly_analysis
+from .models import Suggestion
+from .rollups import month_bounds, summarize
+from .series import DEFAULT_SPLIT_LIMIT, SeriesError, spend_series
 from .serializers import WeeklyAnalysisSerializer, MonthlyAnalysisSerializer, SuggestionSerializer
 from bills.models import Bill
+from billagent_backend.conditional import ConditionalGetMixin
+from billagent_backend.routers import ReadYourWritesMixin, replica_alias
+from billagent_backend.versioning import get_data_version
 
 
-class AnalyticsViewSet(viewsets.ViewSet):
+def dashboard_cache_key(user_id, version, today):
+    return f'dashboard:{user_id}:{version}:{today.isoformat()}'
+
+
+class AnalyticsViewSet(ReadYourWritesMixin, ConditionalGetMixin, viewsets.ViewSet):
     """
     ViewSet for analytics endpoints
     """
     permission_classes = [IsAuthenticated]
+    conditional_actions = ('weekly', 'monthly', 'summary', 'series', 'dashboard')
+    
+    def is_conditional(self, request):
+        # An explicit refresh always regenerates the analysis
+        return super().is_conditional(request) and request.query_params.get('refresh') != 'true'
     
     @action(detail=False, methods=['get'])
     def weekly(self, request):
@@ -26,45 +44,11 @@ class AnalyticsViewSet(viewsets.ViewSet):
         
         today = timezone.now().date()
         week_start = today - timedelta(days=today.weekday() + (7 * week_offset))
-        week_end = week_start + timedelta(days=6)
         
-        # Try to get existing analysis
-        analysis, created = WeeklyAnalysis.objects.get_or_create(
-            user=request.user,
-            week_start=week_start,
-            defaults={'week_end': week_end}
+        analysis = get_weekly_analysis(
+            request.user, week_start, refresh=request.query_params.get('refresh') == 'true'
         )
         
-        if created or request.query_params.get('refresh') == 'true':
-            # Generate analysis
-            bills = Bill.objects.filter(
-                user=request.user,
-                date__gte=week_start,
-                date__lte=week_end
-            )
-            
-            analysis.total_bills = bills.count()
-            analysis.total_amount = bills.aggregate(Sum('total_amount'))['total_amount__sum'] or 0
-            analysis.total_tax = bills.aggregate(Sum('tax_amount'))['tax_amount__sum'] or 0
-            analysis.average_bill_amount = bills.aggregate(Avg('total_amount'))['total_amount__avg'] or 0
-            
-            # Category breakdown
-            category_breakdown = {}
-            for bill in bills:
-                for item in bill.items.all():
-                    category = item.category or 'Uncategorized'
-                    category_breakdown[category] = category_breakdown.get(category, 0) + float(item.total_price)
-            analysis.category_breakdown = category_breakdown
-            
-            # Top vendors
-            vendor_totals = bills.values('vendor_name').annotate(
-                total=Sum('total_amount'),
-                count=Count('id')
-            ).order_by('-total')[:5]
-            analysis.top_vendors = list(vendor_totals)
-            
-            analysis.save()
-        
         serializer = WeeklyAnalysisSerializer(analysis)
         return Response(serializer.data)
     
@@ -81,98 +65,121 @@ class AnalyticsViewSet(viewsets.ViewSet):
         year = target_date.year
         month = target_date.month
         
-        # Try to get existing analysis
-        analysis, created = MonthlyAnalysis.objects.get_or_create(
-            user=request.user,
-            year=year,
-            month=month
+        analysis = get_monthly_analysis(
+            request.user, year, month, refresh=request.query_params.get('refresh') == 'true'
         )
         
-        if created or request.query_params.get('refresh') == 'true':
-            # Generate analysis
-            bills = Bill.objects.filter(
-                user=request.user,
-                date__year=year,
-                date__month=month
-            )
-            
-            analysis.total_bills = bills.count()
-            analysis.total_amount = bills.aggregate(Sum('total_amount'))['total_amount__sum'] or 0
-            analysis.total_tax = bills.aggregate(Sum('tax_amount'))['tax_amount__sum'] or 0
-            analysis.average_bill_amount = bills.aggregate(Avg('total_amount'))['total_amount__avg'] or 0
-            
-            # Category breakdown
-            category_breakdown = {}
-            for bill in bills:
-                for item in bill.items.all():
-                    category = item.category or 'Uncategorized'
-                    category_breakdown[category] = category_breakdown.get(category, 0) + float(item.total_price)
-            analysis.category_breakdown = category_breakdown
-            
-            # Top vendors
-            vendor_totals = bills.values('vendor_name').annotate(
-                total=Sum('total_amount'),
-                count=Count('id')
-            ).order_by('-total')[:5]
-            analysis.top_vendors = list(vendor_totals)
-            
-            # Calculate growth
-            prev_month = month - 1 if month > 1 else 12
-            prev_year = year if month > 1 else year - 1
-            prev_analysis = MonthlyAnalysis.objects.filter(
-                user=request.user,
-                year=prev_year,
-                month=prev_month
-            ).first()
-            
-            if prev_analysis and prev_analysis.total_amount > 0:
-                growth = ((analysis.total_amount - prev_analysis.total_amount) / prev_analysis.total_amount) * 100
-                analysis.growth_percentage = growth
-            
-            analysis.save()
-        
         serializer = MonthlyAnalysisSerializer(analysis)
         return Response(serializer.data)
     
     @action(detail=False, methods=['get'])
-    def dashboard(self, request):
+    def summary(self, request):
         """
-        Get dashboard overview data
+        Get analysis for an arbitrary date range
+        """
+        try:
+            start_date = parse_date(request.query_params.get('start_date', ''))
+            end_date = parse_date(request.query_params.get('end_date', ''))
+        except ValueError:
+            start_date = end_date = None
+        if not start_date or not end_date or start_date > end_date:
+            return Response(
+                {'error': 'start_date and end_date (YYYY-MM-DD, start <= end) are required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        summary = summarize(request.user.pk, start_date, end_date)
+        return Response({
+            'start_date': start_date,
+            'end_date': end_date,
+            'total_bills': summary['total_bills'],
+            'total_amount': float(summary['total_amount']),
+            'total_tax': float(summary['total_tax']),
+            'average_bill_amount': float(summary['average_bill_amount']),
+            'category_breakdown': summary['category_breakdown'],
+            'top_vendors': summary['top_vendors'],
+        })
+    
+    @action(detail=False, methods=['get'])
+    def series(self, request):
+        """
+        Get spend over a date range in day, week or month buckets
+        
+        Query parameters: ``start_date``/``end_date`` (default: the last 30
+        days), ``granularity`` (day, week or month), ``split`` (category or
+        vendor) and ``limit`` (split keys kept before folding into Other).
         """
-        user = request.user
         today = timezone.now().date()
+        try:
+            start_date = parse_date(request.query_params.get('start_date') or '') or today - timedelta(days=29)
+            end_date = parse_date(request.query_params.get('end_date') or '') or today
+            limit = int(request.query_params.get('limit', DEFAULT_SPLIT_LIMIT))
+        except ValueError:
+            return Response(
+                {'error': 'start_date/end_date must be YYYY-MM-DD and limit an integer'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        granularity = request.query_params.get('granularity', 'day')
+        split = request.query_params.get('split') or None
         
-        # Current month stats
-        current_month_bills = Bill.objects.filter(
-            user=user,
-            date__year=today.year,
-            date__month=today.month
+        cache_key = (
+            f'series:{request.user.pk}:{get_data_version(request.user.pk)}:'
+            f'{start_date}:{end_date}:{granularity}:{split}:{limit}'
         )
+        data = cache.get(cache_key)
+        if data is None:
+            try:
+                data = spend_series(request.user.pk, start_date, end_date, granularity, split, limit)
+            except SeriesError as exc:
+                return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+            cache.set(cache_key, data, settings.ANALYTICS_SERIES_CACHE_TIMEOUT)
         
-        # Last 7 days
-        week_ago = today - timedelta(days=7)
-        recent_bills = Bill.objects.filter(
-            user=user,
-            date__gte=week_ago
-        )
+        return Response(data)
+    
+    @action(detail=False, methods=['get'])
+    def dashboard(self, request):
+        """
+        Get dashboard overview data
+        """
+        user = request.user
+        today = timezone.now().date()
         
-        return Response({
-            'current_month': {
-                'total_bills': current_month_bills.count(),
-                'total_amount': float(current_month_bills.aggregate(Sum('total_amount'))['total_amount__sum'] or 0),
-            },
-            'last_7_days': {
-                'total_bills': recent_bills.count(),
-                'total_amount': float(recent_bills.aggregate(Sum('total_amount'))['total_amount__sum'] or 0),
-            },
-            'all_time': {
-                'total_bills': Bill.objects.filter(user=user).count(),
-                'total_amount': float(Bill.objects.filter(user=user).aggregate(Sum('total_amount'))['total_amount__sum'] or 0),
+        cache_key = dashboard_cache_key(user.pk, get_data_version(user.pk), today)
+        data = cache.get(cache_key)
+        if data is None:
+            current_month = Q(date__gte=today.replace(day=1), date__lte=month_bounds(today.year, today.month)[1])
+            last_7_days = Q(date__gte=today - timedelta(days=7))
+            
+            # One conditional-aggregation query for all three windows, on the
+            # read replica when there is one
+            totals = Bill.objects.using(replica_alias()).filter(user=user).aggregate(
+                month_bills=Count('id', filter=current_month),
+                month_amount=Sum('total_amount', filter=current_month),
+                week_bills=Count('id', filter=last_7_days),
+                week_amount=Sum('total_amount', filter=last_7_days),
+                all_bills=Count('id'),
+                all_amount=Sum('total_amount'),
+            )
+            data = {
+                'current_month': {
+                    'total_bills': totals['month_bills'],
+                    'total_amount': float(totals['month_amount'] or 0),
+                },
+                'last_7_days': {
+                    'total_bills': totals['week_bills'],
+                    'total_amount': float(totals['week_amount'] or 0),
+                },
+                'all_time': {
+                    'total_bills': totals['all_bills'],
+                    'total_amount': float(totals['all_amount'] or 0),
+                }
             }
-        })
+            cache.set(cache_key, data, settings.DASHBOARD_CACHE_TIMEOUT)
+        
+        return Response(data)
 
 
-class SuggestionViewSet(viewsets.ModelViewSet):
+class SuggestionViewSet(ReadYourWritesMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     """
     ViewSet for AI suggestions
     """
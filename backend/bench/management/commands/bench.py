@@ -0,0 +1,54 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from bench.suite import ENDPOINTS, BenchRunner, default_user
+
+
+class Command(BaseCommand):
+    help = 'Time the bill and analytics API endpoints and check their query and latency budgets'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Benchmark as this username (default: the user with most bills)')
+        parser.add_argument('--only', action='append', default=[],
+                            help='Only endpoints whose name starts with this (may be repeated)')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per endpoint')
+        parser.add_argument('--warmup', type=int, default=1, help='Untimed runs per endpoint first')
+        parser.add_argument('--cold', action='store_true', help='Clear the cache before every run')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    
+    def handle(self, *args, **options):
+        if options['user']:
+            user = get_user_model().objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f"No user named {options['user']}")
+        else:
+            user = default_user()
+        runner = user and BenchRunner(user, repeat=options['repeat'], warmup=options['warmup'],
+                                      cold=options['cold'])
+        if not runner or runner.fixtures is None:
+            raise CommandError('No bills with items to benchmark against; run seed_bench first')
+        
+        endpoints = [
+            endpoint for endpoint in ENDPOINTS
+            if not options['only'] or endpoint.name.startswith(tuple(options['only']))
+        ]
+        results = runner.run(endpoints)
+        failed = [result for result in results if result['failures']]
+        
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self.stdout.write(f'Benchmarking as {user.username}, {runner.repeat} runs per endpoint')
+            self.stdout.write(f"{'endpoint':<24} {'status':>6} {'median ms':>10} {'max ms':>8} "
+                              f"{'queries':>8} {'db ms':>8}  budget")
+            for result in results:
+                line = (f"{result['name']:<24} {result['status']:>6} {result['median_ms']:>10.1f} "
+                        f"{result['max_ms']:>8.1f} {result['queries']:>8} {result['db_ms']:>8.1f}  ")
+                if result['failures']:
+                    self.stdout.write(line + self.style.ERROR('; '.join(result['failures'])))
+                else:
+                    self.stdout.write(line + self.style.SUCCESS('ok'))
+        if failed:
+            raise CommandError(f'{len(failed)} of {len(results)} endpoints over budget')
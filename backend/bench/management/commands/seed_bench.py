@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from bench.seed import BENCH_PASSWORD, BenchSeeder
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic users, bills, items and corrections for benchmarking'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10, help='Users to create')
+        parser.add_argument('--bills', type=int, default=1000, help='Bills per user')
+        parser.add_argument('--items', type=int, default=4, help='Average line items per bill')
+        parser.add_argument('--days', type=int, default=365, help='Spread bill dates over this many past days')
+        parser.add_argument('--prefix', default='bench', help='Username prefix of the generated users')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed (same seed, same data)')
+        parser.add_argument('--clear', action='store_true',
+                            help='Delete users from an earlier run with the same prefix first')
+    
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['bills'] < 0 or options['items'] < 1:
+            raise CommandError('--users and --items must be at least 1 and --bills not negative')
+        seeder = BenchSeeder(
+            options['users'], options['bills'], options['items'],
+            days=options['days'], prefix=options['prefix'], seed=options['seed'],
+        )
+        if options['clear']:
+            deleted = seeder.clear()
+            self.stdout.write(f'Deleted {deleted} rows from earlier runs')
+        elif seeder.existing().exists():
+            raise CommandError(f"Users named {options['prefix']}_* already exist; pass --clear or another --prefix")
+        created = seeder.run()
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {created['users']} users, {created['bills']} bills, {created['items']} items "
+            f"and {created['corrections']} corrections (password: {BENCH_PASSWORD})"
+        ))
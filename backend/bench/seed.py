@@ -0,0 +1,255 @@
+"""
+Synthetic users, bills, items and corrections for benchmarking.
+
+Data is drawn from fixed pools with skewed distributions, so endpoint timings
+are taken against realistic shapes: a few stores get most of the visits (and
+appear under several OCR spellings), bills cluster on weekends and in recent
+months, item prices depend on the category and a share of bills carries
+corrections. Rows are written with ``bulk_create`` in batches, the way the
+bulk importer writes them, and totals, vendors, rollups and the search index
+are kept up to date through the same hooks.
+"""
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from bills.models import Bill, BillCorrection, BillItem
+from bills.signals import bills_changed
+from bills.totals import record_bulk_create
+from bills.vendors import VendorResolver
+
+User = get_user_model()
+
+BENCH_PASSWORD = 'bench-password'
+
+# Stores with the spellings OCR produces for them, most visited first
+VENDORS = (
+    ('D-Mart', 'DMART', 'D Mart Ltd.'),
+    ('Reliance Fresh', 'RELIANCE FRESH', 'Reliance Fresh Pvt Ltd'),
+    ('More Supermarket', 'MORE', 'More Super Market'),
+    ('Big Bazaar', 'BIG BAZAAR', 'Big Bazar'),
+    ('Spencer\'s', 'Spencers', 'SPENCERS RETAIL'),
+    ('Nilgiris', 'The Nilgiris', 'NILGIRIS 1905'),
+    ('Star Bazaar', 'STAR BAZAAR'),
+    ('Apollo Pharmacy', 'APOLLO PHARMACY', 'Apollo Pharmacy Ltd'),
+    ('MedPlus', 'MEDPLUS', 'Med Plus'),
+    ('Croma', 'CROMA'),
+    ('Reliance Digital', 'RELIANCE DIGITAL'),
+    ('Indian Oil', 'INDIAN OIL CORP', 'IOCL'),
+    ('Bharat Petroleum', 'BPCL', 'Bharat Petroleum Corp'),
+    ('Cafe Coffee Day', 'CCD', 'Cafe Coffee Day Ltd'),
+    ('Domino\'s Pizza', 'DOMINOS', 'Dominos Pizza'),
+    ('Haldiram\'s', 'HALDIRAMS'),
+    ('Decathlon', 'DECATHLON SPORTS'),
+    ('Lifestyle', 'LIFESTYLE STORES'),
+    ('Pantaloons', 'PANTALOONS'),
+    ('Crossword', 'CROSSWORD BOOKSTORES'),
+    ('Sri Krishna Sweets', 'SRI KRISHNA SWEETS'),
+    ('Ratnadeep', 'RATNADEEP SUPERMARKET'),
+    ('Vijetha', 'VIJETHA SUPERMARKETS'),
+    ('Heritage Fresh', 'HERITAGE FRESH'),
+    ('Zudio', 'ZUDIO'),
+)
+
+# Category -> (products, unit price range in paise)
+CATALOG = {
+    'Groceries': (('Rice 5kg', 'Atta 10kg', 'Toor Dal 1kg', 'Sunflower Oil 1L', 'Sugar 1kg', 'Salt 1kg'),
+                  (4000, 60000)),
+    'Dairy': (('Milk 1L', 'Curd 500g', 'Paneer 200g', 'Butter 100g', 'Cheese Slices'), (2500, 12000)),
+    'Produce': (('Tomatoes 1kg', 'Onions 1kg', 'Bananas 1 dozen', 'Apples 1kg', 'Potatoes 1kg'),
+                (2000, 25000)),
+    'Household': (('Detergent 1kg', 'Dishwash Gel', 'Floor Cleaner', 'Toilet Paper', 'Garbage Bags'),
+                  (5000, 45000)),
+    'Personal Care': (('Shampoo 340ml', 'Toothpaste', 'Soap Pack', 'Face Wash', 'Hair Oil'), (4000, 40000)),
+    'Beverages': (('Tea 500g', 'Coffee 200g', 'Juice 1L', 'Soft Drink 2L'), (4000, 60000)),
+    'Snacks': (('Biscuits', 'Chips', 'Namkeen 400g', 'Chocolate'), (1000, 20000)),
+    'Medicines': (('Paracetamol', 'Cough Syrup', 'Vitamin C', 'Antiseptic Liquid', 'Bandages'), (2000, 50000)),
+    'Electronics': (('USB Cable', 'Earphones', 'Power Bank', 'LED Bulb', 'Extension Board'), (20000, 300000)),
+    'Fuel': (('Petrol', 'Diesel'), (9000, 11000)),
+    'Dining': (('Cappuccino', 'Veg Pizza', 'Sandwich', 'Thali', 'Cold Coffee'), (10000, 60000)),
+    'Clothing': (('T-Shirt', 'Jeans', 'Kurta', 'Socks Pack', 'Jacket'), (30000, 300000)),
+    'Stationery': (('Notebook', 'Pens Pack', 'Novel', 'Sketch Pens'), (3000, 60000)),
+}
+
+# The categories each store mostly sells; anything else is a rare extra
+VENDOR_CATEGORIES = {
+    'Apollo Pharmacy': ('Medicines', 'Personal Care'),
+    'MedPlus': ('Medicines', 'Personal Care'),
+    'Croma': ('Electronics',),
+    'Reliance Digital': ('Electronics',),
+    'Indian Oil': ('Fuel',),
+    'Bharat Petroleum': ('Fuel',),
+    'Cafe Coffee Day': ('Dining',),
+    'Domino\'s Pizza': ('Dining',),
+    'Haldiram\'s': ('Dining', 'Snacks'),
+    'Sri Krishna Sweets': ('Snacks',),
+    'Decathlon': ('Clothing',),
+    'Lifestyle': ('Clothing',),
+    'Pantaloons': ('Clothing',),
+    'Zudio': ('Clothing',),
+    'Crossword': ('Stationery',),
+}
+GROCERY_CATEGORIES = ('Groceries', 'Dairy', 'Produce', 'Household', 'Personal Care', 'Beverages', 'Snacks')
+
+STATUSES = ('pending', 'verified', 'corrected')
+STATUS_WEIGHTS = (30, 55, 15)
+TAX_RATES = (Decimal('0.05'), Decimal('0.12'), Decimal('0.18'))
+
+# Zipf-like store popularity: the n-th store is visited about 1/n as often
+VENDOR_WEIGHTS = [1 / rank for rank in range(1, len(VENDORS) + 1)]
+
+
+class BenchSeeder:
+    """
+    Generate synthetic data for ``users`` users with ``bills`` bills each
+    
+    Bills get ``items`` line items on average (at least one), dated within
+    the last ``days`` days. The same ``seed`` always produces the same data.
+    """
+    def __init__(self, users, bills, items, days=365, prefix='bench', seed=0, batch_size=None):
+        self.users = users
+        self.bills = bills
+        self.items = items
+        self.days = max(days, 1)
+        self.prefix = prefix
+        self.rng = random.Random(seed)
+        self.batch_size = max(int(batch_size or settings.BILL_IMPORT_BATCH_SIZE), 1)
+        self.today = timezone.localdate()
+        self.created = {'users': 0, 'bills': 0, 'items': 0, 'corrections': 0}
+    
+    def usernames(self):
+        width = len(str(self.users))
+        return [f'{self.prefix}_{number:0{width}d}' for number in range(1, self.users + 1)]
+    
+    def existing(self):
+        return User.objects.filter(username__startswith=f'{self.prefix}_')
+    
+    def clear(self):
+        """
+        Delete the users (and, by cascade, the data) of an earlier seed run
+        """
+        deleted, _ = self.existing().delete()
+        return deleted
+    
+    def run(self):
+        # Hashing is deliberately slow: every bench user shares one hash
+        password = make_password(BENCH_PASSWORD)
+        users = User.objects.bulk_create([
+            User(username=username, email=f'{username}@bench.local', password=password)
+            for username in self.usernames()
+        ])
+        self.created['users'] = len(users)
+        for user in users:
+            self.seed_user(user)
+        return self.created
+    
+    def seed_user(self, user):
+        resolver = VendorResolver(user.pk)
+        days = set()
+        bill_ids = set()
+        remaining = self.bills
+        while remaining > 0:
+            count = min(remaining, self.batch_size)
+            with transaction.atomic():
+                bills = self.write_batch(user, resolver, count)
+            remaining -= count
+            days.update(bill.date for bill in bills)
+            bill_ids.update(bill.pk for bill in bills)
+        if bill_ids:
+            # Rollups, the search index and the data version, once per user
+            bills_changed.send(sender=Bill, user_id=user.pk, days=days, bill_ids=bill_ids)
+    
+    def write_batch(self, user, resolver, count):
+        bills = []
+        items_per_bill = []
+        for _ in range(count):
+            bill, items = self.make_bill(user)
+            bill.vendor = resolver.resolve(bill.vendor_name)
+            bills.append(bill)
+            items_per_bill.append(items)
+        Bill.objects.bulk_create(bills)
+        
+        items = []
+        corrections = []
+        for bill, bill_items in zip(bills, items_per_bill):
+            for item in bill_items:
+                item.bill = bill
+            items.extend(bill_items)
+        BillItem.objects.bulk_create(items, batch_size=self.batch_size)
+        for bill, bill_items in zip(bills, items_per_bill):
+            if bill.status == 'corrected':
+                corrections.extend(self.make_corrections(bill, bill_items))
+        BillCorrection.objects.bulk_create(corrections, batch_size=self.batch_size)
+        record_bulk_create(user.pk, bills)
+        
+        self.created['bills'] += len(bills)
+        self.created['items'] += len(items)
+        self.created['corrections'] += len(corrections)
+        return bills
+    
+    def bill_date(self):
+        # Recent months are busier (triangular towards today), weekends more so
+        while True:
+            day = self.today - timedelta(days=int(self.rng.triangular(0, self.days, 0)))
+            if day.weekday() >= 5 or self.rng.random() < 0.7:
+                return day
+    
+    def make_bill(self, user):
+        rng = self.rng
+        spellings = rng.choices(VENDORS, weights=VENDOR_WEIGHTS)[0]
+        # Mostly the canonical spelling, sometimes an OCR variant
+        vendor_name = spellings[0] if rng.random() < 0.7 else rng.choice(spellings)
+        categories = VENDOR_CATEGORIES.get(spellings[0], GROCERY_CATEGORIES)
+        
+        items = []
+        for _ in range(max(1, round(rng.gauss(self.items, self.items / 3)))):
+            category = rng.choice(categories) if rng.random() < 0.9 else rng.choice(tuple(CATALOG))
+            products, (low, high) = CATALOG[category]
+            quantity = Decimal(rng.choices((1, 2, 3, 4), weights=(70, 20, 7, 3))[0])
+            # Skewed towards the cheap end of the category's range
+            unit_price = Decimal(low + int((high - low) * rng.betavariate(1.5, 4))) / 100
+            items.append(BillItem(name=rng.choice(products), quantity=quantity, unit_price=unit_price,
+                                  total_price=quantity * unit_price, category=category))
+        
+        subtotal = sum(item.total_price for item in items)
+        tax = (subtotal * rng.choice(TAX_RATES)).quantize(Decimal('0.01'))
+        status = rng.choices(STATUSES, weights=STATUS_WEIGHTS)[0]
+        bill_date = self.bill_date()
+        bill = Bill(
+            user=user,
+            bill_number=f'INV-{rng.randrange(16 ** 8):08X}',
+            vendor_name=vendor_name,
+            date=bill_date,
+            total_amount=subtotal + tax,
+            tax_amount=tax,
+            image=f'bills/bench-{user.pk}.png',
+            status=status,
+            notes=rng.choice(('', '', '', 'Paid by card', 'Paid in cash', 'Reimbursable')),
+            ocr_data={
+                'overall_confidence': rng.randint(70, 99),
+                'raw_text': '\n'.join([vendor_name, bill_date.isoformat(),
+                                       *(f'{item.name} {item.total_price}' for item in items)]),
+            },
+        )
+        return bill, items
+    
+    def make_corrections(self, bill, items):
+        rng = self.rng
+        corrections = [BillCorrection(bill=bill, field_name='total_amount',
+                                      original_value=str(bill.total_amount + rng.randint(1, 9)),
+                                      corrected_value=str(bill.total_amount))]
+        if rng.random() < 0.5:
+            corrections.append(BillCorrection(bill=bill, field_name='vendor_name',
+                                              original_value=bill.vendor_name.upper(),
+                                              corrected_value=bill.vendor_name))
+        if items and rng.random() < 0.3:
+            item = rng.choice(items)
+            corrections.append(BillCorrection(bill=bill, field_name='items.category',
+                                              original_value='Misc', corrected_value=item.category))
+        return corrections
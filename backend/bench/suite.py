@@ -0,0 +1,265 @@
+"""
+In-process benchmark of the bill and analytics API endpoints.
+
+Every ``BillViewSet`` and ``AnalyticsViewSet`` action is requested through the
+full Django/DRF stack (JWT authentication included) as one user, a few times
+each, recording the latency, the number of SQL queries and the time spent in
+the database. Write actions run inside a transaction that is rolled back
+afterwards, with the work they defer to commit (rollups, search index) run
+before the rollback so it is measured, which leaves the data unchanged for the
+next run. Each endpoint has a query and latency budget; ``BENCH_BUDGETS``
+overrides them per endpoint.
+"""
+import io
+import json
+import math
+import statistics
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from bills.export import EXPORT_CHUNK_SIZE
+from bills.models import Bill
+from bills.vendors import normalize_vendor_name
+from monitoring.instrumentation import QueryRecorder
+
+User = get_user_model()
+
+
+class Endpoint:
+    """
+    One benchmarked request and its query and latency budgets
+    
+    ``path`` and ``data`` may hold ``{bill}``, ``{item}``, ``{vendor}``,
+    ``{initial}``, ``{split_bill}`` and date placeholders, or ``data`` may be
+    a callable taking the fixtures. So may ``queries``, for endpoints whose
+    query count grows with the user's data.
+    """
+    def __init__(self, name, method, path, data=None, format='json', write=False, queries=None, ms=None):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.data = data
+        self.format = format
+        self.write = write
+        self.queries = queries
+        self.ms = ms
+    
+    def budget(self, fixtures):
+        override = getattr(settings, 'BENCH_BUDGETS', {}).get(self.name, {})
+        queries = override.get('queries', self.queries)
+        if callable(queries):
+            queries = queries(fixtures)
+        return queries, override.get('ms', self.ms)
+    
+    def request_args(self, fixtures):
+        if callable(self.data):
+            data = self.data(fixtures)
+        elif isinstance(self.data, dict):
+            data = {key: value.format(**fixtures) if isinstance(value, str) else value
+                    for key, value in self.data.items()}
+        else:
+            data = self.data
+        kwargs = {}
+        if isinstance(data, bytes):
+            kwargs.update(data=data, content_type='application/x-ndjson')
+        elif data is not None:
+            kwargs.update(data=data, format=self.format)
+        return self.path.format(**fixtures), kwargs
+
+
+def _png(fixtures):
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), 'white').save(buffer, 'PNG')
+    buffer.seek(0)
+    buffer.name = 'bench.png'
+    return {'image': buffer, 'vendor_name': fixtures['vendor'], 'total_amount': '10.00'}
+
+
+def _import_body(fixtures, count=100):
+    lines = []
+    for number in range(count):
+        lines.append(json.dumps({
+            'bill_number': f'BENCH-{number}',
+            'vendor_name': fixtures['vendor'],
+            'date': fixtures['today'],
+            'total_amount': '150.00',
+            'tax_amount': '7.50',
+            'items': [{'name': 'Milk 1L', 'unit_price': '60.00', 'total_price': '120.00',
+                       'quantity': '2', 'category': 'Dairy'},
+                      {'name': 'Biscuits', 'unit_price': '22.50', 'total_price': '22.50',
+                       'category': 'Snacks'}],
+        }))
+    return ('\n'.join(lines) + '\n').encode()
+
+
+ENDPOINTS = (
+    # BillViewSet
+    Endpoint('bills.list', 'get', '/api/bills/', queries=4, ms=250),
+    Endpoint('bills.list.cursor', 'get', '/api/bills/?pagination=cursor', queries=3, ms=250),
+    Endpoint('bills.list.sparse', 'get', '/api/bills/?fields=id,vendor_name,date,total_amount',
+             queries=3, ms=150),
+    # Searches are held to the plain list's budget: the index must narrow
+    # the bills down, not cost more than listing them
+    Endpoint('bills.list.search', 'get', '/api/bills/?search={vendor}', queries=4, ms=250),
+    # One letter: matches most of the user's bills
+    Endpoint('bills.list.search.broad', 'get', '/api/bills/?search={initial}', queries=4, ms=250),
+    Endpoint('bills.retrieve', 'get', '/api/bills/{bill}/', queries=4, ms=100),
+    Endpoint('bills.stats', 'get', '/api/bills/stats/', queries=2, ms=100),
+    Endpoint('bills.stats.filtered', 'get', '/api/bills/stats/?start_date={month_ago}', queries=2, ms=250),
+    # The bills query, then one items query per chunk of bills
+    Endpoint('bills.export', 'get', '/api/bills/export/?file_type=ndjson', ms=5000,
+             queries=lambda fixtures: 2 + math.ceil(fixtures['bill_count'] / EXPORT_CHUNK_SIZE)),
+    Endpoint('bills.create', 'post', '/api/bills/', data=_png, format='multipart', write=True,
+             queries=35, ms=500),
+    Endpoint('bills.update', 'put', '/api/bills/{bill}/', write=True, queries=35, ms=500, data={
+        'vendor_name': '{vendor}', 'total_amount': '99.00', 'tax_amount': '4.95', 'notes': 'Benchmarked',
+    }),
+    Endpoint('bills.partial_update', 'patch', '/api/bills/{bill}/', data={'notes': 'Benchmarked'},
+             write=True, queries=35, ms=500),
+    Endpoint('bills.destroy', 'delete', '/api/bills/{bill}/', write=True, queries=35, ms=500),
+    Endpoint('bills.correct', 'post', '/api/bills/{bill}/correct/', write=True, queries=35, ms=500,
+             data={'field_name': 'notes', 'original_value': 'x', 'corrected_value': 'Benchmarked'}),
+    Endpoint('bills.correct_batch', 'post', '/api/bills/{bill}/correct_batch/', write=True,
+             queries=35, ms=500, data=lambda fixtures: {'corrections': [
+                 {'field_name': 'notes', 'corrected_value': 'Benchmarked'},
+                 {'field_name': 'items.category', 'item': fixtures['item'], 'corrected_value': 'Groceries'},
+             ]}),
+    # Moves every bill with the spelling: the rollups of all their days are
+    # rebuilt, which SQLite inserts in batches of ~100 rows
+    Endpoint('bills.split_vendor', 'post', '/api/bills/{split_bill}/split_vendor/', write=True,
+             queries=50, ms=500),
+    Endpoint('bills.extract', 'post', '/api/bills/{bill}/extract/', write=True, queries=10, ms=250),
+    Endpoint('bills.extract_batch', 'post', '/api/bills/extract/', write=True, queries=10, ms=250,
+             data=lambda fixtures: {'bill_ids': fixtures['bill_ids']}),
+    Endpoint('bills.import', 'post', '/api/bills/import/?file_type=ndjson', data=_import_body,
+             write=True, queries=40, ms=3000),
+    # AnalyticsViewSet
+    Endpoint('analytics.weekly', 'get', '/api/analytics/weekly/', queries=3, ms=100),
+    Endpoint('analytics.monthly', 'get', '/api/analytics/monthly/', queries=3, ms=100),
+    Endpoint('analytics.summary', 'get', '/api/analytics/summary/?start_date={quarter_ago}&end_date={today}',
+             queries=4, ms=250),
+    Endpoint('analytics.series', 'get',
+             '/api/analytics/series/?start_date={year_ago}&granularity=week&split=category',
+             queries=2, ms=250),
+    Endpoint('analytics.dashboard', 'get', '/api/analytics/dashboard/', queries=2, ms=100),
+)
+
+
+def default_user():
+    """
+    Return the user with the most bills (the natural benchmark subject)
+    """
+    return User.objects.annotate(bill_count=Count('bills')).order_by('-bill_count', 'pk').first()
+
+
+def fixtures_for(user):
+    """
+    Ids and values the endpoint paths and payloads are filled in with
+    """
+    bill = Bill.objects.filter(user=user, items__isnull=False).order_by('-created_at').first()
+    if bill is None:
+        return None
+    today = timezone.localdate()
+    # A bill matched to a vendor under another spelling, for split_vendor
+    split_bill = next((
+        pk for pk, name, key in Bill.objects.filter(user=user, vendor__isnull=False)
+        .order_by('-created_at').values_list('id', 'vendor_name', 'vendor__normalized_name').iterator()
+        if normalize_vendor_name(name) != key
+    ), bill.pk)
+    return {
+        'bill': bill.pk,
+        'split_bill': split_bill,
+        'item': bill.items.order_by('id').values_list('id', flat=True).first(),
+        'vendor': bill.vendor_name.split()[0] if bill.vendor_name else 'bench',
+        'initial': bill.vendor_name[:1] or 'b',
+        'bill_count': Bill.objects.filter(user=user).count(),
+        'bill_ids': list(Bill.objects.filter(user=user).order_by('-created_at').values_list('id', flat=True)[:20]),
+        'today': today.isoformat(),
+        'month_ago': (today - timedelta(days=30)).isoformat(),
+        'quarter_ago': (today - timedelta(days=90)).isoformat(),
+        'year_ago': (today - timedelta(days=364)).isoformat(),
+    }
+
+
+class BenchRunner:
+    """
+    Time each endpoint ``repeat`` times (after ``warmup`` untimed runs)
+    """
+    def __init__(self, user, repeat=5, warmup=1, cold=False):
+        self.user = user
+        self.repeat = max(repeat, 1)
+        self.warmup = max(warmup, 0)
+        self.cold = cold
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        self.fixtures = fixtures_for(user)
+    
+    def request(self, endpoint):
+        path, kwargs = endpoint.request_args(self.fixtures)
+        response = getattr(self.client, endpoint.method)(path, **kwargs)
+        if response.streaming:
+            # Streaming bodies are produced (and queried) while being read
+            for _ in response.streaming_content:
+                pass
+        return response
+    
+    def measure(self, endpoint):
+        if self.cold:
+            cache.clear()
+        recorder = QueryRecorder(slowest=0)
+        with recorder.capture():
+            start = time.perf_counter()
+            if endpoint.write:
+                with transaction.atomic():
+                    # Runs what a commit would (rollups, search index, cache
+                    # versions) before the rollback
+                    with TestCase.captureOnCommitCallbacks(execute=True):
+                        response = self.request(endpoint)
+                    transaction.set_rollback(True)
+            else:
+                response = self.request(endpoint)
+            elapsed = time.perf_counter() - start
+        return response.status_code, elapsed, recorder
+    
+    def run_endpoint(self, endpoint):
+        for _ in range(self.warmup):
+            self.measure(endpoint)
+        runs = [self.measure(endpoint) for _ in range(self.repeat)]
+        statuses = {status_code for status_code, _, _ in runs}
+        timings = [elapsed * 1000 for _, elapsed, _ in runs]
+        result = {
+            'name': endpoint.name,
+            'status': max(statuses),
+            'median_ms': round(statistics.median(timings), 2),
+            'max_ms': round(max(timings), 2),
+            'queries': max(recorder.count for _, _, recorder in runs),
+            'db_ms': round(statistics.median(recorder.duration * 1000 for _, _, recorder in runs), 2),
+        }
+        query_budget, ms_budget = endpoint.budget(self.fixtures)
+        result['query_budget'] = query_budget
+        result['ms_budget'] = ms_budget
+        result['failures'] = failures = []
+        if any(status_code >= 400 for status_code in statuses):
+            failures.append(f'HTTP {max(statuses)}')
+        if query_budget is not None and result['queries'] > query_budget:
+            failures.append(f"{result['queries']} queries > {query_budget}")
+        if ms_budget is not None and result['median_ms'] > ms_budget:
+            failures.append(f"{result['median_ms']} ms > {ms_budget} ms")
+        return result
+    
+    def run(self, endpoints=ENDPOINTS):
+        # The in-process client talks to the 'testserver' host
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            return [self.run_endpoint(endpoint) for endpoint in endpoints]
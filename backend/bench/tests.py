@@ -0,0 +1,48 @@
+import io
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+
+from analytics.models import DailyRollup
+from analytics.views import AnalyticsViewSet
+from bills.models import Bill, BillItem, BillTotals, Vendor
+from bills.views import BillViewSet
+from .suite import ENDPOINTS
+
+
+class BenchTests(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('seed_bench', users=2, bills=60, items=3, stdout=io.StringIO())
+    
+    def test_seed_bench(self):
+        self.assertEqual(Bill.objects.count(), 120)
+        self.assertTrue(Vendor.objects.exists())
+        self.assertTrue(DailyRollup.objects.exists())
+        self.assertEqual(sum(BillTotals.objects.values_list('bill_count', flat=True)), 120)
+        # Seeding the same users twice needs --clear
+        with self.assertRaises(CommandError):
+            call_command('seed_bench', users=1, bills=1, stdout=io.StringIO())
+    
+    def test_bench_leaves_data_unchanged(self):
+        before = (Bill.objects.count(), BillItem.objects.count())
+        output = io.StringIO()
+        call_command('bench', repeat=1, warmup=1, stdout=output)
+        self.assertEqual((Bill.objects.count(), BillItem.objects.count()), before)
+        self.assertIn('analytics.dashboard', output.getvalue())
+    
+    @override_settings(BENCH_BUDGETS={'bills.stats': {'queries': 0}})
+    def test_over_budget_fails(self):
+        with self.assertRaises(CommandError):
+            call_command('bench', only=['bills.stats'], repeat=1, warmup=0, stdout=io.StringIO())
+    
+    def test_every_action_has_a_query_budget(self):
+        budgeted = {endpoint.name for endpoint in ENDPOINTS if endpoint.queries is not None}
+        crud = ('list', 'retrieve', 'create', 'update', 'partial_update', 'destroy')
+        for prefix, viewset in (('bills', BillViewSet), ('analytics', AnalyticsViewSet)):
+            # Endpoints are named after the action or its URL
+            actions = [{action.__name__, action.url_path} for action in viewset.get_extra_actions()]
+            actions += [{name} for name in crud if hasattr(viewset, name)]
+            for names in actions:
+                self.assertTrue({f'{prefix}.{name}' for name in names} & budgeted, names)
@@ -0,0 +1,57 @@
+"""
+Cache profiles built from URLs.
+
+``locmem://name`` (per process), ``redis://host:6379/0`` (or ``rediss://``),
+``memcached://host:11211`` (several hosts separated by commas) and
+``dummy://`` are understood. Data versions, the learned-correction maps and
+the authenticated-user cache are only invalidated across worker processes
+when the backend is shared between them, so the per-process ``locmem``
+backend is refused when more than one worker is configured.
+"""
+from urllib.parse import urlsplit
+
+from django.core.exceptions import ImproperlyConfigured
+
+BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+    'rediss': 'django.core.cache.backends.redis.RedisCache',
+    'memcached': 'django.core.cache.backends.memcached.PyMemcacheCache',
+    'dummy': 'django.core.cache.backends.dummy.DummyCache',
+}
+
+# Backends whose entries are private to one process
+PROCESS_LOCAL = ('locmem',)
+
+
+def cache_config(url, workers=1, instrument=None):
+    """
+    Build a ``CACHES`` entry from a cache URL
+    
+    ``workers`` is the number of server processes sharing the settings.
+    ``instrument`` names a wrapping backend (such as
+    ``monitoring.cache.InstrumentedCache``) that is given the real one in its
+    ``CACHE_BACKEND`` parameter.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in BACKENDS:
+        raise ImproperlyConfigured(f'Unsupported cache URL scheme: {parts.scheme!r}')
+    if parts.scheme in PROCESS_LOCAL and workers > 1:
+        raise ImproperlyConfigured(
+            f'{url!r} is private to each process but {workers} workers are configured; '
+            'point CACHE_URL at a shared cache (redis:// or memcached://)'
+        )
+    if parts.scheme in ('redis', 'rediss'):
+        location = url
+    elif parts.scheme == 'memcached':
+        location = parts.netloc.split(',')
+    else:
+        location = parts.netloc
+    config = {
+        'BACKEND': BACKENDS[parts.scheme],
+        'LOCATION': location,
+    }
+    if instrument:
+        config['CACHE_BACKEND'] = config['BACKEND']
+        config['BACKEND'] = instrument
+    return config
@@ -0,0 +1,100 @@
+"""
+Conditional GET for the read-heavy API views.
+
+Responses carry an ETag built from the user's data version (see
+``versioning``), the request path and query string, the negotiated format and
+today's date. A client that sends the tag back in ``If-None-Match`` gets an
+empty 304 before the view touches the database, as long as none of its data
+has changed since. When the cache can't keep the version (``dummy://``),
+responses go out untagged and are never answered with a 304.
+"""
+import hashlib
+
+from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from .versioning import get_data_version
+
+
+class NotModified(Exception):
+    """
+    The client's cached copy of the response is still current
+    """
+
+
+def data_etag(request):
+    """
+    Return the ETag for a request against the user's current data version
+    
+    None when there is no version to tag against, as a tag that never
+    changes would keep answering 304 after writes.
+    """
+    version = get_data_version(request.user.pk)
+    if version is None:
+        return None
+    raw = '|'.join((
+        str(version),
+        request.get_full_path(),
+        request.META.get('HTTP_ACCEPT', ''),
+        # Date-relative views (this week, this month) roll over at midnight
+        timezone.localdate().isoformat(),
+    ))
+    return quote_etag(hashlib.md5(raw.encode()).hexdigest())
+
+
+def etag_matches(etag, if_none_match):
+    """
+    Weak comparison of an ETag against an If-None-Match header
+    """
+    if not if_none_match:
+        return False
+    tags = parse_etags(if_none_match)
+    if tags == ['*']:
+        return True
+    strip = lambda tag: tag[2:] if tag.startswith('W/') else tag
+    return strip(etag) in {strip(tag) for tag in tags}
+
+
+def patch_conditional_headers(response, etag):
+    """
+    Tag a 200 or 304 response and mark it private and revalidate-only
+    """
+    if etag and response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+        response['ETag'] = etag
+        # Per-user data: shared caches must not reuse it, browsers must revalidate
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ('Accept', 'Authorization'))
+    return response
+
+
+class ConditionalGetMixin:
+    """
+    Answer repeated GETs of unchanged data with 304 Not Modified
+    
+    Applies to the view actions named in ``conditional_actions``.
+    """
+    conditional_actions = ('list', 'retrieve')
+    
+    def is_conditional(self, request):
+        return (request.method in ('GET', 'HEAD') and self.action in self.conditional_actions
+                and request.user.is_authenticated)
+    
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.etag = None
+        if self.is_conditional(request):
+            self.etag = data_etag(request)
+            if self.etag and etag_matches(self.etag, request.META.get('HTTP_IF_NONE_MATCH')):
+                raise NotModified()
+    
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return Response(status=status.HTTP_304_NOT_MODIFIED)
+        return super().handle_exception(exc)
+    
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        return patch_conditional_headers(response, getattr(self, 'etag', None))
@@ -0,0 +1,103 @@
+"""
+Read-replica routing.
+
+When a ``replica`` database is configured (``DATABASE_REPLICA_URL``), reads of
+the ``analytics`` app (rollups, analyses, suggestions) go to it, as do heavy
+aggregates that ask for ``replica_alias()`` explicitly. Writes always go to
+the primary. Reads stay on the primary inside transactions, inside
+``use_primary()`` blocks (recomputes that must see the latest rollups) and,
+for a short window after a user writes, for that user's requests, so
+replication lag never ends up in a response cached under a fresh data version.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_DB_ALIAS = 'replica'
+
+_primary_only = ContextVar('primary_only', default=False)
+
+
+def replica_configured():
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+def replica_alias():
+    """
+    Return the alias read-only queries should use right now
+    """
+    if (not replica_configured() or _primary_only.get()
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+        return DEFAULT_DB_ALIAS
+    return REPLICA_DB_ALIAS
+
+
+@contextmanager
+def use_primary():
+    """
+    Route every read in the block to the primary (also usable as a decorator)
+    """
+    token = _primary_only.set(True)
+    try:
+        yield
+    finally:
+        _primary_only.reset(token)
+
+
+def _recent_write_key(user_id):
+    return f'recent-write:{user_id}'
+
+
+def record_write(user_id):
+    """
+    Keep the user's reads on the primary until the replica has caught up
+    """
+    if replica_configured():
+        cache.set(_recent_write_key(user_id), True, settings.DATABASE_REPLICA_LAG_WINDOW)
+
+
+def wrote_recently(user_id):
+    return replica_configured() and bool(cache.get(_recent_write_key(user_id)))
+
+
+class ReadYourWritesMixin:
+    """
+    View mixin that serves a user from the primary right after they write
+    """
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.user.is_authenticated and wrote_recently(request.user.pk):
+            self._primary_token = _primary_only.set(True)
+    
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_primary_token', None)
+        if token is not None:
+            _primary_only.reset(token)
+            self._primary_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class ReplicaRouter:
+    """
+    Send reads of ``replica_apps`` to the replica and all writes to the primary
+    """
+    replica_apps = ('analytics',)
+    
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in self.replica_apps:
+            return replica_alias()
+        return None
+    
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+    
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica is a copy of the primary, so objects may relate freely
+        return True
+    
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica receives its schema through replication
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,22 @@
+"""
+SQLite backend that tunes every new connection with PRAGMAs.
+
+Configured through ``OPTIONS['pragmas']`` (a name -> value mapping), e.g. WAL
+journaling, ``synchronous=NORMAL`` and memory-mapped reads for single-node
+deployments. Everything else behaves exactly like Django's SQLite backend.
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        # Not a sqlite3.connect() argument: applied once the connection is open
+        self.pragmas = params.pop('pragmas', {})
+        return params
+    
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
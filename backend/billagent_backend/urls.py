@@ -10,6 +10,7 @@ urlpatterns = [
     path('api/auth/', include('accounts.urls')),
     path('api/bills/', include('bills.urls')),
     path('api/analytics/', include('analytics.urls')),
+    path('api/metrics/', include('monitoring.urls')),
 ]
 
 # Serve media files in development
@@ -0,0 +1,53 @@
+"""
+Per-user data versions for cache keys.
+
+Every write to a user's bills bumps their version, so any cache entry keyed on
+the version is implicitly invalidated without having to track or delete it.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .routers import record_write
+
+
+def _key(user_id):
+    return f'data-version:{user_id}'
+
+
+def _fresh_version():
+    # Seeded from the clock so a version lost to cache eviction never comes
+    # back lower than one that was already handed out
+    return time.time_ns() // 1000
+
+
+def get_data_version(user_id):
+    """
+    Return the current data version for a user
+    """
+    version = cache.get(_key(user_id))
+    if version is None:
+        cache.add(_key(user_id), _fresh_version(), timeout=None)
+        version = cache.get(_key(user_id))
+    return version
+
+
+def bump_data_version(user_id):
+    """
+    Invalidate everything cached against the user's current data version
+    """
+    record_write(user_id)
+    try:
+        return cache.incr(_key(user_id))
+    except ValueError:
+        version = _fresh_version()
+        cache.set(_key(user_id), version, timeout=None)
+        return version
+
+
+def bump_data_version_on_commit(user_id):
+    """
+    Bump the user's data version once the current transaction commits
+    """
+    transaction.on_commit(lambda: bump_data_version(user_id))
@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Bill, BillItem, BillCorrection
+from .models import (
+    Bill, BillItem, BillCorrection, BillTotals, ExtractionJob, ExtractionResult, UploadSession, Vendor
+)
 
 
 class BillItemInline(admin.TabularInline):
@@ -13,7 +15,14 @@ class BillAdmin(admin.ModelAdmin):
     list_filter = ['status', 'date', 'created_at']
     search_fields = ['bill_number', 'vendor_name', 'user__username']
     inlines = [BillItemInline]
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['vendor', 'image_hash', 'created_at', 'updated_at']
+
+
+@admin.register(Vendor)
+class VendorAdmin(admin.ModelAdmin):
+    list_display = ['name', 'normalized_name', 'user', 'ngram_count', 'created_at']
+    search_fields = ['name', 'normalized_name', 'user__username']
+    readonly_fields = ['normalized_name', 'ngram_count', 'created_at']
 
 
 @admin.register(BillCorrection)
@@ -21,3 +30,34 @@ class BillCorrectionAdmin(admin.ModelAdmin):
     list_display = ['bill', 'field_name', 'original_value', 'corrected_value', 'created_at']
     list_filter = ['field_name', 'created_at']
     search_fields = ['bill__bill_number']
+
+
+@admin.register(BillTotals)
+class BillTotalsAdmin(admin.ModelAdmin):
+    list_display = ['user', 'status', 'bill_count', 'total_amount', 'total_tax']
+    list_filter = ['status']
+    search_fields = ['user__username']
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ['filename', 'user', 'received', 'total_size', 'status', 'bill', 'created_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['filename', 'user__username', 'sha256']
+    readonly_fields = ['created_at', 'updated_at']
+
+
+@admin.register(ExtractionJob)
+class ExtractionJobAdmin(admin.ModelAdmin):
+    list_display = ['bill', 'status', 'attempts', 'cached', 'created_at', 'finished_at']
+    list_filter = ['status', 'cached', 'created_at']
+    search_fields = ['bill__bill_number', 'bill__user__username', 'error']
+    readonly_fields = ['created_at', 'started_at', 'finished_at']
+
+
+@admin.register(ExtractionResult)
+class ExtractionResultAdmin(admin.ModelAdmin):
+    list_display = ['image_hash', 'extractor', 'created_at']
+    list_filter = ['extractor']
+    search_fields = ['image_hash']
+    readonly_fields = ['created_at']
@@ -0,0 +1,187 @@
+"""
+Batch bill corrections and the per-user correction map.
+
+A batch applies any number of bill and item field corrections in one
+transaction: items are written with one ``bulk_update``, the bill with one
+``save(update_fields=...)`` and the correction records with one
+``bulk_create``. Corrections to the fields listed in ``LEARNED_FIELDS`` are
+also compiled into a per-user map (original value -> corrected value), kept in
+the cache, which new extractions are run through before they are stored.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework import serializers
+
+from .models import BillCorrection, BillItem
+from .serializers import BillItemSerializer, BillUpdateSerializer
+
+ITEM_PREFIX = 'items.'
+
+BILL_FIELDS = ('bill_number', 'vendor_name', 'date', 'total_amount', 'tax_amount', 'notes')
+ITEM_FIELDS = ('name', 'quantity', 'unit_price', 'total_price', 'category')
+
+# Fields whose corrections carry over to other bills of the same user
+LEARNED_FIELDS = ('vendor_name', 'items.name', 'items.category')
+
+
+def normalize_value(value):
+    """
+    Matching key for a field value: trimmed, single-spaced and case-folded
+    """
+    return ' '.join(str(value or '').split()).casefold()
+
+
+def _text(value):
+    return '' if value is None else str(value)
+
+
+def _invalid(index, message):
+    return serializers.ValidationError({'corrections': {index: message}})
+
+
+@transaction.atomic
+def apply_correction_batch(bill, entries):
+    """
+    Apply validated correction entries to a bill and its items
+    
+    Each entry has ``field_name`` (a bill field, or ``items.<field>`` together
+    with ``item``), ``corrected_value`` and optionally ``original_value``,
+    which defaults to the value being replaced. Returns the created
+    ``BillCorrection`` rows; raises ``ValidationError`` without writing
+    anything if any entry is invalid.
+    """
+    items = {item.pk: item for item in bill.items.all()}
+    bill_changes = {}
+    item_changes = {}
+    originals = []
+    for index, entry in enumerate(entries):
+        field_name = entry['field_name']
+        if field_name.startswith(ITEM_PREFIX):
+            field = field_name[len(ITEM_PREFIX):]
+            item = items.get(entry.get('item'))
+            if field not in ITEM_FIELDS:
+                raise _invalid(index, f'Item field must be one of {", ".join(ITEM_FIELDS)}')
+            if item is None:
+                raise _invalid(index, 'item must be the id of one of this bill\'s items')
+            item_changes.setdefault(item.pk, {})[field] = entry['corrected_value']
+            current = getattr(item, field)
+        else:
+            if field_name not in BILL_FIELDS:
+                raise _invalid(index, f'Bill field must be one of {", ".join(BILL_FIELDS)}')
+            bill_changes[field_name] = entry['corrected_value']
+            current = getattr(bill, field_name)
+        originals.append(entry['original_value'] if 'original_value' in entry else _text(current))
+    
+    # Values are parsed by the same serializers as regular edits
+    bill_serializer = BillUpdateSerializer(bill, data=bill_changes, partial=True)
+    if not bill_serializer.is_valid():
+        raise serializers.ValidationError({'corrections': bill_serializer.errors})
+    updated_items = []
+    item_fields = set()
+    for item_id, changes in item_changes.items():
+        item_serializer = BillItemSerializer(items[item_id], data=changes, partial=True)
+        if not item_serializer.is_valid():
+            raise serializers.ValidationError({'corrections': {f'item {item_id}': item_serializer.errors}})
+        for field, value in item_serializer.validated_data.items():
+            setattr(items[item_id], field, value)
+        item_fields.update(item_serializer.validated_data)
+        updated_items.append(items[item_id])
+    
+    if updated_items:
+        BillItem.objects.bulk_update(updated_items, sorted(item_fields))
+    for field, value in bill_serializer.validated_data.items():
+        setattr(bill, field, value)
+    bill.status = 'corrected'
+    # Item changes reach the rollups through this save's change notification
+    bill.save(update_fields=[*bill_serializer.validated_data, 'status', 'updated_at'])
+    
+    corrections = BillCorrection.objects.bulk_create([
+        BillCorrection(
+            bill=bill, field_name=entry['field_name'],
+            original_value=original, corrected_value=entry['corrected_value'],
+        )
+        for entry, original in zip(entries, originals)
+    ])
+    if any(correction.field_name in LEARNED_FIELDS for correction in corrections):
+        invalidate_correction_map(bill.user_id)
+    return corrections
+
+
+def _cache_key(user_id):
+    return f'correction-map:{user_id}'
+
+
+def build_correction_map(user_id):
+    """
+    Compile a user's learned corrections into {field: {original key: corrected}}
+    """
+    corrections = {}
+    rows = (
+        BillCorrection.objects.filter(bill__user_id=user_id, field_name__in=LEARNED_FIELDS)
+        .order_by('created_at', 'id')
+        .values_list('field_name', 'original_value', 'corrected_value')
+    )
+    for field_name, original, corrected in rows.iterator():
+        key = normalize_value(original)
+        if not key:
+            continue
+        field_map = corrections.setdefault(field_name, {})
+        if normalize_value(corrected) == key:
+            # Corrected back to what was extracted: forget the older correction
+            field_map.pop(key, None)
+        else:
+            field_map[key] = corrected
+    return corrections
+
+
+def correction_map(user_id):
+    """
+    Return the user's compiled correction map, from the cache when possible
+    """
+    corrections = cache.get(_cache_key(user_id))
+    if corrections is None:
+        corrections = build_correction_map(user_id)
+        cache.set(_cache_key(user_id), corrections, settings.CORRECTION_MAP_CACHE_TIMEOUT)
+    return corrections
+
+
+def invalidate_correction_map(user_id):
+    """
+    Drop the user's cached correction map once the current transaction commits
+    """
+    transaction.on_commit(lambda: cache.delete(_cache_key(user_id)))
+
+
+def apply_learned_corrections(data, corrections):
+    """
+    Return a copy of extractor output with the user's learned corrections applied
+    
+    The corrections made are listed under ``applied_corrections``.
+    """
+    if not corrections:
+        return data
+    data = dict(data)
+    applied = []
+    
+    def correct(field_name, value):
+        corrected = corrections.get(field_name, {}).get(normalize_value(value))
+        if corrected is None:
+            return value
+        applied.append({'field_name': field_name, 'original_value': value, 'corrected_value': corrected})
+        return corrected
+    
+    if data.get('vendor_name'):
+        data['vendor_name'] = correct('vendor_name', data['vendor_name'])
+    items = []
+    for item in data.get('items') or []:
+        item = dict(item)
+        for field in ('name', 'category'):
+            if item.get(field):
+                item[field] = correct(ITEM_PREFIX + field, item[field])
+        items.append(item)
+    if 'items' in data:
+        data['items'] = items
+    if applied:
+        data['applied_corrections'] = applied
+    return data
@@ -0,0 +1,128 @@
+"""
+Streaming CSV and NDJSON export of bills with their line items.
+
+Bills are read with ``.iterator(chunk_size=...)`` and the items of each chunk
+are fetched with one extra query, so an export costs two queries per chunk and
+never holds more than one chunk in memory. The CSV layout matches the bulk
+import format (one row per item, grouped by ``bill_ref``), so an export can
+be imported again as-is.
+"""
+import csv
+import json
+import zlib
+from itertools import islice
+
+from rest_framework.renderers import BaseRenderer
+
+from .importer import CSV_BILL_COLUMNS, CSV_ITEM_COLUMNS
+from .models import BillItem
+
+EXPORT_CHUNK_SIZE = 1000
+
+BILL_FIELDS = ('id',) + CSV_BILL_COLUMNS + ('created_at',)
+ITEM_FIELDS = tuple(CSV_ITEM_COLUMNS.values())
+CSV_HEADER = ('bill_ref',) + CSV_BILL_COLUMNS + ('created_at',) + tuple(CSV_ITEM_COLUMNS)
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class ExportRenderer(BaseRenderer):
+    """
+    Accept any media type for export downloads; error payloads render as JSON
+    """
+    media_type = '*/*'
+    format = 'export'
+    charset = None
+    
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data).encode()
+
+
+class Echo:
+    """
+    File-like object whose write() hands back the written line
+    """
+    def write(self, value):
+        return value
+
+
+def iter_bill_chunks(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield lists of ``(bill_values, items)`` for a bill queryset, chunk by chunk
+    """
+    bills = queryset.prefetch_related(None).values_list(*BILL_FIELDS).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(bills, chunk_size))
+        if not chunk:
+            return
+        items = {}
+        for bill_id, *values in BillItem.objects.filter(bill_id__in=[row[0] for row in chunk]).order_by(
+            'bill_id', 'id'
+        ).values_list('bill_id', *ITEM_FIELDS):
+            items.setdefault(bill_id, []).append(values)
+        yield [(row, items.get(row[0], ())) for row in chunk]
+
+
+def _plain(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def csv_lines(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield the CSV export one chunk of bills at a time
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    empty_item = ('',) * len(ITEM_FIELDS)
+    for chunk in iter_bill_chunks(queryset, chunk_size):
+        lines = []
+        for bill, items in chunk:
+            bill = [_plain(value) for value in bill]
+            for item in items or (empty_item,):
+                lines.append(writer.writerow(bill + [_plain(value) for value in item]))
+        yield ''.join(lines)
+
+
+def ndjson_lines(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield the NDJSON export (one bill per line, items nested) chunk by chunk
+    """
+    for chunk in iter_bill_chunks(queryset, chunk_size):
+        lines = []
+        for bill, items in chunk:
+            record = {field: _plain(value) for field, value in zip(BILL_FIELDS, bill)}
+            record['id'] = bill[0]
+            record['items'] = [
+                {field: _plain(value) for field, value in zip(ITEM_FIELDS, item)} for item in items
+            ]
+            lines.append(json.dumps(record) + '\n')
+        yield ''.join(lines)
+
+
+def gzip_stream(chunks):
+    """
+    Gzip a stream of text chunks on the fly
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(queryset, file_type, compress=False, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Return an iterator over the encoded export body
+    """
+    lines = csv_lines(queryset, chunk_size) if file_type == 'csv' else ndjson_lines(queryset, chunk_size)
+    if compress:
+        return gzip_stream(lines)
+    return (chunk.encode() for chunk in lines)
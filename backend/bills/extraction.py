@@ -0,0 +1,337 @@
+"""
+Server-side OCR extraction of bill images.
+
+Bills are queued as ``ExtractionJob`` rows; workers claim batches of jobs and
+run the extractor calls on a bounded thread pool. The extractor is pluggable
+(``settings.BILL_EXTRACTOR``) and its output is cached by image content hash,
+so re-uploads and retries of the same receipt reuse the first extraction
+instead of paying for another one. A claimed job is leased for
+``BILL_EXTRACTION_TIMEOUT`` seconds, after which it is presumed lost and
+claimed again; failed attempts are retried with exponential backoff. Results
+are written to ``Bill.ocr_data`` and, for bills without items yet, to
+``BillItem`` rows.
+"""
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Min, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .corrections import apply_learned_corrections, correction_map
+from .models import Bill, BillItem, ExtractionJob, ExtractionResult
+from .serializers import BillItemSerializer
+from .storage import content_hash
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+
+class ExtractionError(Exception):
+    """
+    The extractor could not produce a usable result for an image
+    """
+
+
+class BaseExtractor:
+    """
+    Turn a bill image into structured data
+    
+    ``extract`` returns a dict with ``vendor_name``, ``bill_number``, ``date``
+    (ISO format), ``total_amount``, ``tax_amount``, ``overall_confidence`` and
+    ``items`` (each with ``name``, ``quantity``, ``unit_price``,
+    ``total_price`` and ``category``); amounts are strings so the result is
+    JSON-serializable. Subclasses must be thread-safe.
+    """
+    name = None
+    
+    def extract(self, image, image_hash, context=None):
+        raise NotImplementedError
+
+
+class StubExtractor(BaseExtractor):
+    """
+    Deterministic local extractor for development and tests
+    
+    Derives a plausible receipt from the image hash alone, so the same image
+    always yields the same result and nothing leaves the machine.
+    """
+    name = 'stub'
+    vendors = ('D-Mart', 'Reliance Fresh', 'More Supermarket', 'Big Bazaar', 'Spencer\'s')
+    products = (
+        ('Rice 5kg', 'Groceries'), ('Sunflower Oil 1L', 'Groceries'), ('Milk 1L', 'Dairy'),
+        ('Paneer 200g', 'Dairy'), ('Detergent 1kg', 'Household'), ('Notebook', 'Stationery'),
+        ('Tea 500g', 'Beverages'), ('Biscuits', 'Snacks'),
+    )
+    
+    def extract(self, image, image_hash, context=None):
+        rng = random.Random(image_hash)
+        items = []
+        for name, category in rng.sample(self.products, rng.randint(1, 5)):
+            quantity = Decimal(rng.randint(1, 4))
+            unit_price = Decimal(rng.randint(1000, 50000)) / 100
+            items.append({
+                'name': name,
+                'quantity': str(quantity),
+                'unit_price': str(unit_price),
+                'total_price': str(quantity * unit_price),
+                'category': category,
+            })
+        subtotal = sum(Decimal(item['total_price']) for item in items)
+        tax = (subtotal * Decimal('0.05')).quantize(Decimal('0.01'))
+        return {
+            'vendor_name': rng.choice(self.vendors),
+            'bill_number': f'INV-{image_hash[:8].upper()}',
+            'date': (date(2025, 1, 1) + timedelta(days=rng.randint(0, 364))).isoformat(),
+            'total_amount': str(subtotal + tax),
+            'tax_amount': str(tax),
+            'overall_confidence': rng.randint(80, 99),
+            'items': items,
+        }
+
+
+@lru_cache(maxsize=None)
+def get_extractor(path=None):
+    """
+    Return the configured extractor instance (shared across threads)
+    """
+    return import_string(path or settings.BILL_EXTRACTOR)()
+
+
+def queue_extraction(bills):
+    """
+    Queue extraction jobs for bills that have no job queued or running
+    
+    Returns the jobs for all given bills, new and already active.
+    """
+    bills = list(bills)
+    active = {
+        job.bill_id: job
+        for job in ExtractionJob.objects.filter(bill__in=bills, status__in=ACTIVE_STATUSES)
+    }
+    new_jobs = ExtractionJob.objects.bulk_create([
+        ExtractionJob(bill=bill) for bill in bills if bill.pk not in active
+    ])
+    return list(active.values()) + new_jobs
+
+
+def cached_results(extractor, image_hashes):
+    """
+    Map image hash to cached extractor output for the given hashes
+    """
+    return dict(
+        ExtractionResult.objects.filter(extractor=extractor.name, image_hash__in=set(image_hashes))
+        .values_list('image_hash', 'data')
+    )
+
+
+def _extract(extractor, bill):
+    # Runs on a pool thread: reads the image file only, never the database
+    try:
+        with bill.image.open('rb') as image:
+            return extractor.extract(image, bill.image_hash, context=bill.user.store_type), None
+    except Exception as exc:
+        return None, exc
+
+
+@transaction.atomic
+def apply_result(bill, data, corrections=None):
+    """
+    Store an extraction on its bill, filling only fields the user left empty
+    
+    The user's learned corrections (``corrections``, default: their cached
+    correction map) are applied to the extracted values first.
+    """
+    if corrections is None:
+        corrections = correction_map(bill.user_id)
+    data = apply_learned_corrections(data, corrections)
+    items = BillItemSerializer(data=data.get('items') or [], many=True)
+    if not items.is_valid():
+        raise ExtractionError(f'Extractor returned invalid items: {items.errors}')
+    
+    if not bill.items.exists():
+        # Written before the bill save below, whose change notification
+        # refreshes rollups and the search index with these items included
+        BillItem.objects.bulk_create([BillItem(bill=bill, **item) for item in items.validated_data])
+    
+    update_fields = ['ocr_data', 'updated_at']
+    for field in ('vendor_name', 'bill_number'):
+        if not getattr(bill, field) and data.get(field):
+            setattr(bill, field, data[field][:bill._meta.get_field(field).max_length])
+            update_fields.append(field)
+    if bill.date is None and data.get('date'):
+        try:
+            bill.date = date.fromisoformat(data['date'])
+            update_fields.append('date')
+        except ValueError:
+            pass
+    for field in ('total_amount', 'tax_amount'):
+        if not getattr(bill, field) and data.get(field):
+            setattr(bill, field, Decimal(str(data[field])))
+            update_fields.append(field)
+    bill.ocr_data = data
+    bill.save(update_fields=update_fields)
+
+
+def claimable_jobs(now):
+    """
+    Jobs a worker may claim at ``now``
+    
+    Queued jobs whose retry delay is over, and running jobs whose worker has
+    held them longer than ``BILL_EXTRACTION_TIMEOUT`` (presumed lost) and
+    that have attempts left.
+    """
+    expired = now - timedelta(seconds=settings.BILL_EXTRACTION_TIMEOUT)
+    return ExtractionJob.objects.filter(
+        Q(status='queued', run_at__lte=now) |
+        Q(status='running', started_at__lt=expired, attempts__lt=settings.BILL_EXTRACTION_MAX_ATTEMPTS)
+    )
+
+
+def expire_abandoned(now):
+    """
+    Fail running jobs presumed lost on their last allowed attempt
+    """
+    expired = now - timedelta(seconds=settings.BILL_EXTRACTION_TIMEOUT)
+    return ExtractionJob.objects.filter(
+        status='running', started_at__lt=expired, attempts__gte=settings.BILL_EXTRACTION_MAX_ATTEMPTS
+    ).update(status='failed', error='Extraction timed out', finished_at=now)
+
+
+def claim_jobs(limit=None):
+    """
+    Mark up to ``limit`` claimable jobs as running for this worker and return them
+    """
+    now = timezone.now()
+    expire_abandoned(now)
+    candidates = claimable_jobs(now).order_by('created_at', 'pk').values_list('pk', flat=True)
+    claimed = []
+    for job_id in (candidates[:limit] if limit else candidates):
+        # Conditional update: a job another worker already took is skipped
+        if claimable_jobs(now).filter(pk=job_id).update(
+            status='running', started_at=now, attempts=F('attempts') + 1
+        ):
+            claimed.append(job_id)
+    return list(ExtractionJob.objects.filter(pk__in=claimed).select_related('bill__user').order_by('pk'))
+
+
+def next_run_at():
+    """
+    When a queued job next becomes due or a running one is presumed lost (or None)
+    """
+    due = ExtractionJob.objects.filter(status='queued').aggregate(at=Min('run_at'))['at']
+    started = ExtractionJob.objects.filter(status='running').aggregate(at=Min('started_at'))['at']
+    if started is not None:
+        lease_end = started + timedelta(seconds=settings.BILL_EXTRACTION_TIMEOUT)
+        due = lease_end if due is None else min(due, lease_end)
+    return due
+
+
+def finish_job(job, data=None, error=None, corrections=None):
+    """
+    Apply a job's extraction result and record its outcome
+    
+    A failed attempt is retried after ``BILL_EXTRACTION_RETRY_BACKOFF``
+    seconds, doubled per attempt, until the attempt budget is spent.
+    """
+    if error is None:
+        try:
+            apply_result(job.bill, data, corrections)
+        except Exception as exc:
+            error = exc
+    job.finished_at = timezone.now()
+    if error is None:
+        job.status = 'succeeded'
+        job.error = ''
+    else:
+        job.error = f'{type(error).__name__}: {error}'
+        if job.attempts < settings.BILL_EXTRACTION_MAX_ATTEMPTS:
+            job.status = 'queued'
+            delay = settings.BILL_EXTRACTION_RETRY_BACKOFF * 2 ** (job.attempts - 1)
+            job.run_at = job.finished_at + timedelta(seconds=delay)
+        else:
+            job.status = 'failed'
+    # Only while still ours: a job presumed lost may have been claimed again
+    ExtractionJob.objects.filter(pk=job.pk, status='running', started_at=job.started_at).update(
+        status=job.status, error=job.error, cached=job.cached, run_at=job.run_at, finished_at=job.finished_at
+    )
+
+
+def run_jobs(jobs, workers=None, extractor=None):
+    """
+    Extract a batch of claimed jobs with at most ``workers`` extractions in flight
+    
+    Only the extractor calls run on the pool; cache lookups and result writes
+    stay on the calling thread, so the pool never contends for database locks
+    and each distinct image in the batch is extracted once.
+    """
+    workers = max(int(workers or settings.BILL_EXTRACTION_WORKERS), 1)
+    extractor = extractor or get_extractor()
+    
+    count = len(jobs)
+    readable = []
+    for job in jobs:
+        bill = job.bill
+        if not bill.image_hash:
+            # Imported bills have no image file at all
+            image_hash = None
+            if bill.image:
+                try:
+                    with bill.image.open('rb') as image:
+                        image_hash = content_hash(image)
+                except OSError:
+                    pass
+            if image_hash is None:
+                finish_job(job, error=ExtractionError('Bill image is missing'))
+                continue
+            bill.image_hash = image_hash
+            Bill.objects.filter(pk=bill.pk).update(image_hash=image_hash)
+        readable.append(job)
+    jobs = readable
+    
+    results = cached_results(extractor, [job.bill.image_hash for job in jobs])
+    for job in jobs:
+        job.cached = job.bill.image_hash in results
+    
+    pending = {}
+    for job in jobs:
+        if not job.cached:
+            pending.setdefault(job.bill.image_hash, job.bill)
+    errors = {}
+    if pending:
+        with ThreadPoolExecutor(max_workers=min(workers, len(pending)), thread_name_prefix='extraction') as pool:
+            outcomes = pool.map(lambda bill: _extract(extractor, bill), pending.values())
+            for image_hash, (data, error) in zip(pending, outcomes):
+                if error is None:
+                    results[image_hash] = data
+                else:
+                    errors[image_hash] = error
+        # ignore_conflicts: another worker may have cached the same image
+        ExtractionResult.objects.bulk_create([
+            ExtractionResult(image_hash=image_hash, extractor=extractor.name, data=results[image_hash])
+            for image_hash in pending if image_hash in results
+        ], ignore_conflicts=True)
+    
+    # One correction map per user in the batch, not one lookup per bill
+    corrections = {user_id: correction_map(user_id) for user_id in {job.bill.user_id for job in jobs}}
+    for job in jobs:
+        image_hash = job.bill.image_hash
+        if image_hash in results:
+            finish_job(job, data=results[image_hash], corrections=corrections[job.bill.user_id])
+        else:
+            finish_job(job, error=errors[image_hash])
+    return count
+
+
+def process_pending(workers=None, limit=None):
+    """
+    Claim and run queued jobs; returns how many were run
+    """
+    jobs = claim_jobs(limit)
+    if not jobs:
+        return 0
+    return run_jobs(jobs, workers=workers)
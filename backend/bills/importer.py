@@ -0,0 +1,165 @@
+"""
+Bulk bill import from NDJSON or CSV streams.
+
+Uploads are read line by line, each bill is validated with the regular bill
+serializers and valid bills are written with ``bulk_create`` in batches, one
+transaction per batch. Totals are updated with each batch; rollups, the search
+index and caches are refreshed once at the end through ``bills_changed``.
+"""
+import codecs
+import csv
+import json
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework import serializers
+
+from .models import Bill, BillItem
+from .serializers import BillImportSerializer
+from .signals import bills_changed
+from .totals import record_bulk_create
+from .vendors import VendorResolver
+
+# CSV layout: one row per line item; consecutive rows sharing a bill_ref (or
+# bill_number when there is no bill_ref column) belong to the same bill
+CSV_BILL_COLUMNS = ('bill_number', 'vendor_name', 'date', 'total_amount', 'tax_amount',
+                    'status', 'notes')
+CSV_ITEM_COLUMNS = {
+    'item_name': 'name',
+    'item_quantity': 'quantity',
+    'item_unit_price': 'unit_price',
+    'item_total_price': 'total_price',
+    'item_category': 'category',
+}
+
+
+def iter_text_lines(byte_lines):
+    """
+    Decode an iterable of byte lines as UTF-8 (tolerating a BOM)
+    """
+    return codecs.iterdecode(byte_lines, 'utf-8-sig')
+
+
+def iter_ndjson_records(lines):
+    """
+    Yield ``(line_number, record_or_errors, parsed)`` for each non-blank line
+    """
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            yield line_number, {'non_field_errors': [f'Invalid JSON: {exc}']}, False
+            continue
+        if not isinstance(record, dict):
+            yield line_number, {'non_field_errors': ['Expected a JSON object']}, False
+            continue
+        yield line_number, record, True
+
+
+def iter_csv_records(lines):
+    """
+    Yield ``(row_number, record, True)`` per bill, grouping its item rows
+    """
+    reader = csv.DictReader(lines)
+    group_column = 'bill_ref' if 'bill_ref' in (reader.fieldnames or ()) else 'bill_number'
+    current_key = None
+    current = None
+    first_row = None
+    for row in reader:
+        row_number = reader.line_num
+        key = row.get(group_column) or f'row-{row_number}'
+        if current is not None and key != current_key:
+            yield first_row, current, True
+            current = None
+        if current is None:
+            current_key, first_row = key, row_number
+            current = {column: row[column] for column in CSV_BILL_COLUMNS if row.get(column)}
+            current['items'] = []
+        if row.get('item_name'):
+            current['items'].append({
+                field: row[column] for column, field in CSV_ITEM_COLUMNS.items() if row.get(column)
+            })
+    if current is not None:
+        yield first_row, current, True
+
+
+class BillImporter:
+    """
+    Validate and insert a stream of bill records for one user
+    """
+    def __init__(self, user, batch_size=None):
+        self.user = user
+        self.batch_size = max(int(batch_size or settings.BILL_IMPORT_BATCH_SIZE), 1)
+        self.max_errors = settings.BILL_IMPORT_MAX_ERRORS
+        # One bound serializer reused for every row: validating through
+        # run_validation() skips the per-instance field copying
+        self.serializer = BillImportSerializer()
+        # bulk_create skips Bill.save(), so vendors are resolved here instead
+        self.vendors = VendorResolver(user.pk)
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+        self._batch = []
+        self._days = set()
+        self._bill_ids = set()
+    
+    def run(self, records):
+        try:
+            for row_number, record, parsed in records:
+                if not parsed:
+                    self._fail(row_number, record)
+                    continue
+                try:
+                    validated = self.serializer.run_validation(record)
+                except serializers.ValidationError as exc:
+                    self._fail(row_number, exc.detail)
+                    continue
+                self._batch.append(validated)
+                if len(self._batch) >= self.batch_size:
+                    self._flush()
+            self._flush()
+        finally:
+            self._notify()
+        return self.report()
+    
+    def report(self):
+        return {
+            'created': self.created,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+        }
+    
+    def _fail(self, row_number, detail):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'row': row_number, 'errors': detail})
+    
+    def _flush(self):
+        if not self._batch:
+            return
+        batch, self._batch = self._batch, []
+        with transaction.atomic():
+            bills = []
+            items_per_bill = []
+            for validated in batch:
+                items_per_bill.append(validated.pop('items', []))
+                bills.append(Bill(user=self.user, vendor=self.vendors.resolve(validated.get('vendor_name')),
+                                  **validated))
+            Bill.objects.bulk_create(bills)
+            BillItem.objects.bulk_create(
+                [BillItem(bill=bill, **item) for bill, items in zip(bills, items_per_bill) for item in items],
+                batch_size=self.batch_size,
+            )
+            record_bulk_create(self.user.pk, bills)
+        self.created += len(bills)
+        self._days.update(bill.date for bill in bills)
+        self._bill_ids.update(bill.pk for bill in bills)
+    
+    def _notify(self):
+        # Rollups and the search index are refreshed once for the whole import
+        # rather than per batch, so each day is re-aggregated a single time
+        if self._bill_ids:
+            bills_changed.send(sender=Bill, user_id=self.user.pk, days=self._days, bill_ids=self._bill_ids)
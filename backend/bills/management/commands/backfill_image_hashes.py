@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from bills.models import Bill
+from bills.storage import content_hash
+
+
+class Command(BaseCommand):
+    help = 'Compute the content hash of bill images stored before hashing was added'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Bills loaded per query')
+    
+    def handle(self, *args, **options):
+        bills = Bill.objects.filter(image_hash='').exclude(image='').only('id', 'image')
+        hashed = missing = 0
+        for bill in bills.iterator(chunk_size=options['batch_size']):
+            try:
+                with bill.image.open('rb') as image:
+                    digest = content_hash(image)
+            except FileNotFoundError:
+                missing += 1
+                continue
+            Bill.objects.filter(pk=bill.pk).update(image_hash=digest)
+            hashed += 1
+        self.stdout.write(self.style.SUCCESS(f'Hashed {hashed} images ({missing} files missing)'))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from bills.models import Bill
+from bills.signals import bills_changed
+from bills.vendors import VendorResolver
+
+
+class Command(BaseCommand):
+    help = 'Link bills stored before vendor canonicalization to their canonical vendors'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='usernames', default=[],
+                            help='Only backfill this username (may be repeated)')
+    
+    def handle(self, *args, **options):
+        unlinked = Bill.objects.filter(vendor__isnull=True).exclude(vendor_name='')
+        if options['usernames']:
+            unlinked = unlinked.filter(user__username__in=options['usernames'])
+        user_ids = list(unlinked.order_by('user_id').values_list('user_id', flat=True).distinct())
+        
+        linked = 0
+        for user_id in user_ids:
+            user_bills = unlinked.filter(user_id=user_id)
+            resolver = VendorResolver(user_id)
+            days = set(user_bills.values_list('date', flat=True).distinct())
+            bill_ids = set(user_bills.values_list('id', flat=True))
+            with transaction.atomic():
+                for name in user_bills.order_by('vendor_name').values_list('vendor_name', flat=True).distinct():
+                    vendor = resolver.resolve(name)
+                    if vendor is not None:
+                        linked += user_bills.filter(vendor_name=name).update(vendor=vendor)
+                # Rebuilds the user's rollups for those days on commit
+                bills_changed.send(sender=Bill, user_id=user_id, days=days, bill_ids=bill_ids)
+        self.stdout.write(self.style.SUCCESS(f'Linked {linked} bills for {len(user_ids)} users'))
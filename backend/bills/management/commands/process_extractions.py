@@ -0,0 +1,30 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from bills.extraction import process_pending
+
+
+class Command(BaseCommand):
+    help = 'Run queued OCR extraction jobs on a pool of worker threads'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.BILL_EXTRACTION_WORKERS,
+                            help='Bills extracted in parallel')
+        parser.add_argument('--limit', type=int, default=100,
+                            help='Maximum jobs run per pass')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running, polling for queued jobs')
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Seconds to sleep between passes when idle (with --loop)')
+    
+    def handle(self, *args, **options):
+        while True:
+            count = process_pending(workers=options['workers'], limit=options['limit'])
+            if count:
+                self.stdout.write(f'Processed {count} extraction jobs')
+            if not options['loop']:
+                break
+            if count < options['limit']:
+                time.sleep(options['interval'])
@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from bills.models import UploadSession
+from bills.uploads import discard_partial
+
+
+class Command(BaseCommand):
+    help = 'Delete abandoned or finished image upload sessions and their partial files'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24,
+                            help='Purge sessions not touched for this many hours')
+    
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        stale = UploadSession.objects.filter(updated_at__lt=cutoff)
+        count = 0
+        for session in stale.iterator():
+            discard_partial(session)
+            count += 1
+        stale.delete()
+        self.stdout.write(self.style.SUCCESS(f'Purged {count} upload sessions'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from bills.search import ensure_search_index, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Create the bill full-text index if needed and reindex every bill'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default',
+                            help='Database alias to index')
+    
+    def handle(self, *args, **options):
+        ensure_search_index(options['database'])
+        count = rebuild_search_index(options['database'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} bills'))
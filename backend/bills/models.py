@@ -1,9 +1,54 @@
+import os
+import uuid
+
+from django.conf import settings
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from .storage import content_addressed_storage
 
 User = get_user_model()
 
 
+class Vendor(models.Model):
+    """
+    Canonical vendor that a user's differently spelled vendor names map to
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='vendors')
+    
+    name = models.CharField(max_length=255)
+    normalized_name = models.CharField(max_length=255)
+    ngram_count = models.IntegerField(default=0)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['name']
+        unique_together = ['user', 'normalized_name']
+    
+    def __str__(self):
+        return f"{self.name} - {self.user_id}"
+
+
+class VendorNgram(models.Model):
+    """
+    Character n-gram of a vendor's normalized name, for fuzzy name lookup
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    vendor = models.ForeignKey(Vendor, on_delete=models.CASCADE, related_name='ngrams')
+    ngram = models.CharField(max_length=10)
+    
+    class Meta:
+        unique_together = ['vendor', 'ngram']
+        indexes = [
+            models.Index(fields=['user', 'ngram']),
+        ]
+    
+    def __str__(self):
+        return f"{self.ngram} - {self.vendor_id}"
+
+
 class Bill(models.Model):
     """
     Bill model to store bill information
@@ -19,12 +64,16 @@ class Bill(models.Model):
     # Bill details
     bill_number = models.CharField(max_length=100, blank=True)
     vendor_name = models.CharField(max_length=255, blank=True)
+    # Resolved from vendor_name on save; groups spellings of the same store
+    vendor = models.ForeignKey(Vendor, on_delete=models.SET_NULL, null=True, blank=True,
+                               related_name='bills', editable=False)
     date = models.DateField(null=True, blank=True)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     tax_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     
-    # Image
-    image = models.ImageField(upload_to='bills/')
+    # Image (stored by content hash, so identical uploads share one file)
+    image = models.ImageField(upload_to='bills/', storage=content_addressed_storage)
+    image_hash = models.CharField(max_length=64, blank=True, editable=False)
     
     # OCR data
     ocr_data = models.JSONField(default=dict, blank=True)
@@ -42,10 +91,20 @@ class Bill(models.Model):
         indexes = [
             models.Index(fields=['user', '-created_at']),
             models.Index(fields=['date']),
+            models.Index(fields=['user', 'image_hash']),
         ]
     
     def __str__(self):
         return f"Bill {self.bill_number} - {self.vendor_name} - ${self.total_amount}"
+    
+    def save(self, *args, **kwargs):
+        # Keep the canonical vendor in step with the free-text vendor name
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'vendor_name' in update_fields:
+            from .vendors import assign_vendor
+            if assign_vendor(self) and update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'vendor'}
+        super().save(*args, **kwargs)
 
 
 class BillItem(models.Model):
@@ -87,3 +146,108 @@ class BillCorrection(models.Model):
     
     def __str__(self):
         return f"Correction for {self.bill.bill_number} - {self.field_name}"
+
+
+class BillTotals(models.Model):
+    """
+    Running bill totals per user and status, kept in sync on every bill write
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='bill_totals')
+    status = models.CharField(max_length=20)
+    
+    bill_count = models.IntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_tax = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        unique_together = ['user', 'status']
+        verbose_name_plural = 'bill totals'
+    
+    def __str__(self):
+        return f"Totals for {self.user_id} ({self.status}) - {self.bill_count} bills"
+
+
+class ExtractionJob(models.Model):
+    """
+    Queued server-side OCR extraction of a bill image
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+    
+    bill = models.ForeignKey(Bill, on_delete=models.CASCADE, related_name='extraction_jobs')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    
+    # True when the result came from the extraction cache
+    cached = models.BooleanField(default=False)
+    
+    # Not claimed before this time (pushed back after a failed attempt)
+    run_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"Extraction of bill {self.bill_id} - {self.status}"
+
+
+class ExtractionResult(models.Model):
+    """
+    Extractor output cached by image content hash
+    """
+    image_hash = models.CharField(max_length=64)
+    extractor = models.CharField(max_length=100)
+    data = models.JSONField(default=dict)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        unique_together = ['image_hash', 'extractor']
+    
+    def __str__(self):
+        return f"{self.extractor} result for {self.image_hash[:12]}"
+
+
+class UploadSession(models.Model):
+    """
+    Resumable, chunked upload of a bill image
+    """
+    STATUS_CHOICES = [
+        ('open', 'Open'),
+        ('complete', 'Complete'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    
+    filename = models.CharField(max_length=255)
+    total_size = models.BigIntegerField()
+    received = models.BigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True)
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='open')
+    bill = models.ForeignKey(Bill, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"Upload {self.filename} - {self.received}/{self.total_size} bytes"
+    
+    @property
+    def partial_path(self):
+        return os.path.join(settings.BILL_UPLOAD_TEMP_DIR, f'{self.pk}.part')
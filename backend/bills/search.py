@@ -0,0 +1,232 @@
+"""
+Full-text search over bills and their line items.
+
+The index lives in a side table keyed by bill id: an FTS5 virtual table on
+SQLite and a tsvector column with a GIN index on PostgreSQL. Other databases
+fall back to the original ``icontains`` filters. Writes queue the touched bill
+ids and reindex them once the transaction commits.
+"""
+import re
+import threading
+
+from django.db import connections, transaction
+from django.db.models import Q
+
+from .models import Bill, BillItem
+
+INDEX_TABLE = 'bills_bill_search'
+REINDEX_CHUNK_SIZE = 500
+
+_pending = threading.local()
+
+
+def search_terms(query):
+    """
+    Split a user query into lowercase word tokens
+    """
+    return re.findall(r'\w+', query.lower())
+
+
+def _documents(using, bill_ids):
+    """
+    Yield (id, user_id, bill_number, vendor_name, notes, items_text) per bill
+    """
+    items = {}
+    for bill_id, name, category in BillItem.objects.using(using).filter(bill_id__in=bill_ids).order_by().values_list(
+        'bill_id', 'name', 'category'
+    ):
+        items.setdefault(bill_id, []).append(f'{name} {category}'.strip())
+    for bill in Bill.objects.using(using).filter(id__in=bill_ids).order_by().values(
+        'id', 'user_id', 'bill_number', 'vendor_name', 'notes'
+    ):
+        yield (bill['id'], bill['user_id'], bill['bill_number'], bill['vendor_name'],
+               bill['notes'], ' '.join(items.get(bill['id'], ())))
+
+
+class IcontainsSearchBackend:
+    """
+    Unindexed fallback for databases without a full-text engine
+    """
+    def ensure_schema(self, connection):
+        return False
+    
+    def reindex(self, connection, bill_ids):
+        pass
+    
+    def clear(self, connection):
+        pass
+    
+    def filter(self, queryset, user_id, query):
+        return queryset.filter(
+            Q(bill_number__icontains=query) |
+            Q(vendor_name__icontains=query) |
+            Q(notes__icontains=query) |
+            Q(items__name__icontains=query)
+        ).distinct()
+
+
+class SQLiteSearchBackend:
+    """
+    FTS5 virtual table whose rowid is the bill id, with the owner unindexed
+    """
+    def ensure_schema(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA table_info({INDEX_TABLE})')
+            columns = [row[1] for row in cursor.fetchall()]
+            if columns and 'user_id' not in columns:
+                # Index from before the owner column: recreated and refilled
+                cursor.execute(f'DROP TABLE {INDEX_TABLE}')
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {INDEX_TABLE} USING fts5('
+                'bill_number, vendor_name, notes, items, user_id UNINDEXED, '
+                "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+            )
+        return 'user_id' not in columns
+    
+    def reindex(self, connection, bill_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {INDEX_TABLE} WHERE rowid = %s', [(pk,) for pk in bill_ids])
+            cursor.executemany(
+                f'INSERT INTO {INDEX_TABLE} (rowid, bill_number, vendor_name, notes, items, user_id) '
+                'VALUES (%s, %s, %s, %s, %s, %s)',
+                [(pk, number, vendor, notes, items, user_id)
+                 for pk, user_id, number, vendor, notes, items in _documents(connection.alias, bill_ids)],
+            )
+    
+    def clear(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {INDEX_TABLE}')
+    
+    def filter(self, queryset, user_id, query):
+        # Every term must match, each as a prefix: "d mar" finds "D-Mart"
+        expression = ' '.join(f'"{term}"*' for term in search_terms(query))
+        # The MATCH runs once, in a subquery, over the user's entries only.
+        # Joined to bills_bill instead, SQLite may scan the user's bills first
+        # and rerun the MATCH for each one (seconds for a short, common term),
+        # which is also why matches are not ordered by FTS rank here.
+        return queryset.extra(
+            where=[f'bills_bill.id IN (SELECT rowid FROM {INDEX_TABLE} '
+                   f'WHERE {INDEX_TABLE} MATCH %s AND user_id = %s)'],
+            params=[expression, user_id],
+        ).order_by('-created_at')
+
+
+class PostgresSearchBackend:
+    """
+    tsvector side table with a GIN index, weighted towards number and vendor
+    """
+    def ensure_schema(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT to_regclass(%s)', [INDEX_TABLE])
+            exists = cursor.fetchone()[0] is not None
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {INDEX_TABLE} ('
+                'bill_id bigint PRIMARY KEY, user_id bigint NOT NULL, document tsvector NOT NULL)'
+            )
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {INDEX_TABLE}_document ON {INDEX_TABLE} USING GIN (document)'
+            )
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {INDEX_TABLE}_user ON {INDEX_TABLE} (user_id)'
+            )
+        return not exists
+    
+    def reindex(self, connection, bill_ids):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {INDEX_TABLE} WHERE bill_id = ANY(%s)', [list(bill_ids)])
+            cursor.executemany(
+                f'INSERT INTO {INDEX_TABLE} (bill_id, user_id, document) VALUES (%s, %s, '
+                "setweight(to_tsvector('simple', %s), 'A') || "
+                "setweight(to_tsvector('simple', %s), 'A') || "
+                "setweight(to_tsvector('simple', %s), 'C') || "
+                "setweight(to_tsvector('simple', %s), 'B'))",
+                list(_documents(connection.alias, bill_ids)),
+            )
+    
+    def clear(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE {INDEX_TABLE}')
+    
+    def filter(self, queryset, user_id, query):
+        expression = ' & '.join(f'{term}:*' for term in search_terms(query))
+        return queryset.extra(
+            select={'search_rank': f"ts_rank({INDEX_TABLE}.document, to_tsquery('simple', %s))"},
+            select_params=[expression],
+            tables=[INDEX_TABLE],
+            where=[
+                f'{INDEX_TABLE}.bill_id = bills_bill.id',
+                f'{INDEX_TABLE}.user_id = %s',
+                f"{INDEX_TABLE}.document @@ to_tsquery('simple', %s)",
+            ],
+            params=[user_id, expression],
+        ).order_by('-search_rank', '-created_at')
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend(),
+    'postgresql': PostgresSearchBackend(),
+}
+
+
+def get_backend(connection):
+    return BACKENDS.get(connection.vendor, IcontainsSearchBackend())
+
+
+def ensure_search_index(using='default'):
+    """
+    Create the index table if needed (run after migrate), indexing existing bills
+    """
+    connection = connections[using]
+    if get_backend(connection).ensure_schema(connection):
+        rebuild_search_index(using=using)
+
+
+def search_bills(queryset, user_id, query):
+    """
+    Restrict a bill queryset to full-text matches for ``query``, best first
+    """
+    connection = connections[queryset.db]
+    if not search_terms(query):
+        return IcontainsSearchBackend().filter(queryset, user_id, query)
+    return get_backend(connection).filter(queryset, user_id, query)
+
+
+def reindex_bills(bill_ids, using='default'):
+    """
+    Rebuild the index entries for the given bills (missing bills are dropped)
+    """
+    connection = connections[using]
+    backend = get_backend(connection)
+    bill_ids = sorted(bill_ids)
+    for offset in range(0, len(bill_ids), REINDEX_CHUNK_SIZE):
+        with transaction.atomic(using=using):
+            backend.reindex(connection, bill_ids[offset:offset + REINDEX_CHUNK_SIZE])
+
+
+def rebuild_search_index(using='default'):
+    """
+    Reindex every bill from scratch; returns the number of bills indexed
+    """
+    connection = connections[using]
+    get_backend(connection).clear(connection)
+    bill_ids = list(Bill.objects.using(using).order_by('id').values_list('id', flat=True))
+    reindex_bills(bill_ids, using=using)
+    return len(bill_ids)
+
+
+def schedule_reindex(bill_ids):
+    """
+    Queue bills for reindexing once the current transaction commits
+    """
+    if not hasattr(_pending, 'bill_ids'):
+        _pending.bill_ids = set()
+    _pending.bill_ids.update(bill_ids)
+    transaction.on_commit(flush_pending)
+
+
+def flush_pending():
+    bill_ids = getattr(_pending, 'bill_ids', None)
+    if not bill_ids:
+        return
+    _pending.bill_ids = set()
+    reindex_bills(bill_ids)
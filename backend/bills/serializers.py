@@ -1,5 +1,9 @@
+import re
+
+from django.conf import settings
+from django.db import transaction
 from rest_framework import serializers
-from .models import Bill, BillItem, BillCorrection
+from .models import Bill, BillItem, BillCorrection, ExtractionJob, UploadSession
 
 
 class BillItemSerializer(serializers.ModelSerializer):
@@ -12,7 +16,26 @@ class BillItemSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'created_at')
 
 
-class BillSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """
+    Serializer mixin for request-driven sparse fieldsets
+    
+    ``fields`` limits the output to the named fields; ``expand`` adds fields
+    listed in ``Meta.expandable_fields``, which are left out by default.
+    Unknown names are ignored.
+    """
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        expandable = set(getattr(self.Meta, 'expandable_fields', ()))
+        if fields:
+            keep = set(fields) | set(expand or ())
+        else:
+            keep = (set(self.fields) - expandable) | (expandable & set(expand or ()))
+        for name in set(self.fields) - keep:
+            self.fields.pop(name)
+
+
+class BillSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Serializer for bills
     """
@@ -21,10 +44,21 @@ class BillSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Bill
-        fields = ('id', 'user', 'user_name', 'bill_number', 'vendor_name', 'date',
+        fields = ('id', 'user', 'user_name', 'bill_number', 'vendor_name', 'vendor', 'date',
                   'total_amount', 'tax_amount', 'image', 'ocr_data', 'status',
                   'notes', 'items', 'created_at', 'updated_at')
-        read_only_fields = ('id', 'user', 'created_at', 'updated_at')
+        read_only_fields = ('id', 'user', 'vendor', 'created_at', 'updated_at')
+
+
+class BillListSerializer(BillSerializer):
+    """
+    Lightweight serializer for bill lists
+    
+    The OCR payload, nested items and the owner's username are only included
+    when asked for with ``?expand=ocr_data,items,user_name``.
+    """
+    class Meta(BillSerializer.Meta):
+        expandable_fields = ('user_name', 'ocr_data', 'items')
 
 
 class BillCreateSerializer(serializers.ModelSerializer):
@@ -38,28 +72,49 @@ class BillCreateSerializer(serializers.ModelSerializer):
         fields = ('bill_number', 'vendor_name', 'date', 'total_amount', 'tax_amount',
                   'image', 'ocr_data', 'status', 'notes', 'items')
     
+    @transaction.atomic
     def create(self, validated_data):
         items_data = validated_data.pop('items', [])
         bill = Bill.objects.create(**validated_data)
         
-        for item_data in items_data:
-            BillItem.objects.create(bill=bill, **item_data)
+        # One INSERT for all items; the bill's own save already queued the
+        # rollup/search refresh, which runs after this transaction commits
+        BillItem.objects.bulk_create([BillItem(bill=bill, **item_data) for item_data in items_data])
         
         return bill
 
 
+class BillImportSerializer(BillCreateSerializer):
+    """
+    Serializer for validating bulk-imported bills (no image upload)
+    """
+    class Meta(BillCreateSerializer.Meta):
+        fields = ('bill_number', 'vendor_name', 'date', 'total_amount', 'tax_amount',
+                  'ocr_data', 'status', 'notes', 'items')
+
+
+class BillItemUpdateSerializer(BillItemSerializer):
+    """
+    Serializer for bill items on update; ``id`` identifies an existing item
+    """
+    id = serializers.IntegerField(required=False)
+
+
 class BillUpdateSerializer(serializers.ModelSerializer):
     """
     Serializer for updating bills
     """
-    items = BillItemSerializer(many=True, required=False)
+    items = BillItemUpdateSerializer(many=True, required=False)
     
     class Meta:
         model = Bill
         fields = ('bill_number', 'vendor_name', 'date', 'total_amount', 'tax_amount',
                   'status', 'notes', 'items')
     
+    @transaction.atomic
     def update(self, instance, validated_data):
+        from .signals import items_reported_by_bill
+        
         items_data = validated_data.pop('items', None)
         
         # Update bill fields
@@ -67,15 +122,44 @@ class BillUpdateSerializer(serializers.ModelSerializer):
             setattr(instance, attr, value)
         instance.save()
         
-        # Update items if provided
+        # Update items if provided; the bill's save above reports them
         if items_data is not None:
-            # Delete existing items
-            instance.items.all().delete()
-            # Create new items
-            for item_data in items_data:
-                BillItem.objects.create(bill=instance, **item_data)
+            with items_reported_by_bill(instance.pk):
+                self.update_items(instance, items_data)
         
         return instance
+    
+    def update_items(self, instance, items_data):
+        """
+        Diff incoming items against the stored ones by id: update changed rows,
+        create new ones and delete only those that were left out
+        """
+        existing = {item.pk: item for item in instance.items.all()}
+        to_create = []
+        to_update = []
+        changed_fields = set()
+        kept = set()
+        
+        for item_data in items_data:
+            item = existing.get(item_data.pop('id', None))
+            if item is None or item.pk in kept:
+                to_create.append(BillItem(bill=instance, **item_data))
+                continue
+            kept.add(item.pk)
+            changed = [field for field, value in item_data.items() if getattr(item, field) != value]
+            if changed:
+                for field in changed:
+                    setattr(item, field, item_data[field])
+                changed_fields.update(changed)
+                to_update.append(item)
+        
+        removed = [pk for pk in existing if pk not in kept]
+        if removed:
+            instance.items.filter(pk__in=removed).delete()
+        if to_update:
+            BillItem.objects.bulk_update(to_update, sorted(changed_fields))
+        if to_create:
+            BillItem.objects.bulk_create(to_create)
 
 
 class BillCorrectionSerializer(serializers.ModelSerializer):
@@ -86,3 +170,57 @@ class BillCorrectionSerializer(serializers.ModelSerializer):
         model = BillCorrection
         fields = ('id', 'bill', 'field_name', 'original_value', 'corrected_value', 'created_at')
         read_only_fields = ('id', 'created_at')
+
+
+class BillCorrectionEntrySerializer(serializers.Serializer):
+    """
+    One correction in a batch; item fields are named ``items.<field>``
+    """
+    field_name = serializers.CharField(max_length=100)
+    item = serializers.IntegerField(required=False)
+    original_value = serializers.CharField(required=False, allow_blank=True)
+    corrected_value = serializers.CharField(allow_blank=True)
+
+
+class BillCorrectionBatchSerializer(serializers.Serializer):
+    """
+    Serializer for a batch of corrections to one bill
+    """
+    corrections = BillCorrectionEntrySerializer(many=True, allow_empty=False)
+
+
+class ExtractionJobSerializer(serializers.ModelSerializer):
+    """
+    Serializer for OCR extraction jobs
+    """
+    class Meta:
+        model = ExtractionJob
+        fields = ('id', 'bill', 'status', 'attempts', 'error', 'cached', 'run_at', 'created_at',
+                  'started_at', 'finished_at')
+        read_only_fields = fields
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    """
+    Serializer for resumable image upload sessions
+    """
+    class Meta:
+        model = UploadSession
+        fields = ('id', 'filename', 'total_size', 'received', 'sha256', 'status', 'bill',
+                  'created_at', 'updated_at')
+        read_only_fields = ('id', 'received', 'status', 'bill', 'created_at', 'updated_at')
+    
+    def validate_total_size(self, value):
+        if value <= 0:
+            raise serializers.ValidationError('total_size must be positive')
+        if value > settings.BILL_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(
+                f'total_size may not exceed {settings.BILL_UPLOAD_MAX_SIZE} bytes'
+            )
+        return value
+    
+    def validate_sha256(self, value):
+        value = value.lower()
+        if value and not re.fullmatch(r'[0-9a-f]{64}', value):
+            raise serializers.ValidationError('sha256 must be 64 hex characters')
+        return value
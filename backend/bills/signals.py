@@ -0,0 +1,174 @@
+import threading
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import Signal, receiver
+
+from billagent_backend.versioning import bump_data_version_on_commit
+from .corrections import LEARNED_FIELDS, invalidate_correction_map
+from .models import Bill, BillCorrection, BillItem
+from .search import schedule_reindex
+from .totals import record_bill_change
+
+User = get_user_model()
+
+# Sent whenever bills or their items change, with ``user_id``, ``days`` (the
+# set of bill dates affected, which may include None) and ``bill_ids``. Bulk
+# writes that bypass model signals send it explicitly. The user's data version
+# is bumped by analytics once the rollups are rebuilt after commit, so a
+# response cached under the new version never holds the old rollups.
+bills_changed = Signal()
+
+# Bills whose item writes are reported by their own bill save meanwhile
+_covered = threading.local()
+
+# Bill fields whose previous values the write hooks need to see
+TRACKED_FIELDS = ('user_id', 'status', 'total_amount', 'tax_amount', 'date', 'vendor_name')
+
+
+def snapshot(instance):
+    """
+    Capture the tracked field values currently held by a bill instance
+    """
+    return {field: instance.__dict__.get(field) for field in TRACKED_FIELDS}
+
+
+def deleted_with_user(origin):
+    """
+    True when a bill delete is part of a cascade from its owner being deleted
+    """
+    return _origin_is(origin, User)
+
+
+def _origin_is(origin, model):
+    origin_model = origin._meta.model if hasattr(origin, '_meta') else getattr(origin, 'model', None)
+    return origin_model is not None and issubclass(origin_model, model)
+
+
+def notify_changed(bill_id, *values):
+    """
+    Send ``bills_changed`` for the users and dates in the given snapshots
+    """
+    days_by_user = {}
+    for value in values:
+        if value:
+            days_by_user.setdefault(value['user_id'], set()).add(value['date'])
+    for user_id, days in days_by_user.items():
+        bills_changed.send(sender=Bill, user_id=user_id, days=days, bill_ids={bill_id})
+
+
+@contextmanager
+def items_reported_by_bill(bill_id):
+    """
+    Skip the item signals of ``bill_id`` in the block
+    
+    For writes that also save the bill: its ``bills_changed`` already covers
+    them, as the index and rollups are only rebuilt after commit.
+    """
+    if not hasattr(_covered, 'bill_ids'):
+        _covered.bill_ids = set()
+    added = bill_id not in _covered.bill_ids
+    _covered.bill_ids.add(bill_id)
+    try:
+        yield
+    finally:
+        if added:
+            _covered.bill_ids.discard(bill_id)
+
+
+@receiver(post_init, sender=Bill)
+def remember_loaded_values(sender, instance, **kwargs):
+    """
+    Remember the values a bill was loaded with so saves can compute deltas
+    """
+    if instance.pk is None:
+        instance._loaded_values = None
+    elif all(field in instance.__dict__ for field in TRACKED_FIELDS):
+        instance._loaded_values = snapshot(instance)
+    else:
+        # Deferred fields: fall back to reading the row in pre_save
+        instance._loaded_values = None
+
+
+@receiver(pre_save, sender=Bill)
+def capture_previous_values(sender, instance, raw=False, **kwargs):
+    """
+    Resolve the pre-write values of an existing bill
+    """
+    if raw or instance._state.adding or instance.pk is None:
+        instance._previous_values = None
+        return
+    previous = getattr(instance, '_loaded_values', None)
+    if previous is None:
+        previous = Bill.objects.filter(pk=instance.pk).values(*TRACKED_FIELDS).first()
+    instance._previous_values = previous
+
+
+@receiver(post_save, sender=Bill)
+def update_totals_on_save(sender, instance, created, raw=False, **kwargs):
+    """
+    Move the bill's contribution in the per-user totals
+    """
+    if raw:
+        return
+    previous = None if created else getattr(instance, '_previous_values', None)
+    current = snapshot(instance)
+    record_bill_change(previous, current)
+    notify_changed(instance.pk, previous, current)
+    instance._loaded_values = current
+
+
+@receiver(pre_delete, sender=Bill)
+def capture_deleted_values(sender, instance, **kwargs):
+    """
+    Make sure a bill loaded with deferred fields still knows its stored values
+    """
+    if getattr(instance, '_loaded_values', None) is None:
+        instance._loaded_values = Bill.objects.filter(pk=instance.pk).values(*TRACKED_FIELDS).first()
+
+
+@receiver(post_delete, sender=Bill)
+def update_totals_on_delete(sender, instance, origin=None, **kwargs):
+    """
+    Remove a deleted bill from the per-user totals
+    """
+    if deleted_with_user(origin) or instance._loaded_values is None:
+        return
+    record_bill_change(instance._loaded_values, None)
+    notify_changed(instance.pk, instance._loaded_values)
+
+
+@receiver(post_save, sender=BillItem)
+@receiver(post_delete, sender=BillItem)
+def notify_item_changed(sender, instance, origin=None, raw=False, **kwargs):
+    """
+    Report item writes made on their own (not as part of a bill delete)
+    """
+    if raw or _origin_is(origin, Bill) or _origin_is(origin, User):
+        return
+    if instance.bill_id in getattr(_covered, 'bill_ids', ()):
+        return
+    bill = instance.bill
+    bills_changed.send(sender=BillItem, user_id=bill.user_id, days={bill.date}, bill_ids={bill.pk})
+
+
+@receiver(post_save, sender=BillCorrection)
+@receiver(post_delete, sender=BillCorrection)
+def bump_version_on_correction(sender, instance, origin=None, raw=False, **kwargs):
+    """
+    Corrections are part of the bill representation, so they change the version too
+    """
+    if raw or _origin_is(origin, Bill) or _origin_is(origin, User):
+        return
+    bump_data_version_on_commit(instance.bill.user_id)
+    if instance.field_name in LEARNED_FIELDS:
+        invalidate_correction_map(instance.bill.user_id)
+
+
+@receiver(bills_changed)
+def reindex_on_change(sender, bill_ids=(), **kwargs):
+    """
+    Refresh the full-text index entries of the changed bills after commit
+    """
+    schedule_reindex(bill_ids)
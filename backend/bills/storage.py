@@ -0,0 +1,62 @@
+"""
+Content-addressed storage for bill images.
+
+Files are named after the SHA-256 of their bytes and sharded two levels deep
+(``bills/ab/cd/abcd....jpg``) so no directory grows unbounded. Saving bytes
+that are already stored is a no-op that returns the existing name, which makes
+retried uploads free.
+"""
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def content_hash(content):
+    """
+    Return the hex SHA-256 of a file-like object, leaving it rewound
+    """
+    cached = getattr(content, 'content_hash', None)
+    if cached:
+        return cached
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    if hasattr(content, 'chunks'):
+        for chunk in content.chunks(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    else:
+        for chunk in iter(lambda: content.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    # Remembered on the file so the storage does not hash it a second time
+    content.content_hash = digest.hexdigest()
+    return content.content_hash
+
+
+def hashed_name(prefix, digest, original_name):
+    """
+    Build the sharded storage name for a digest, keeping the original extension
+    """
+    extension = os.path.splitext(original_name)[1].lower()
+    return '/'.join(part for part in (prefix, digest[:2], digest[2:4], digest + extension) if part)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage that names files by their content hash
+    """
+    def _save(self, name, content):
+        prefix = os.path.dirname(name).replace('\\', '/')
+        name = hashed_name(prefix, content_hash(content), os.path.basename(name))
+        if self.exists(name):
+            return name
+        return super()._save(name, content)
+
+
+content_addressed_storage = ContentAddressedStorage()
@@ -0,0 +1,33 @@
+from django.utils import timezone
+
+from jobs.models import Job
+from jobs.queue import enqueue
+from jobs.registry import task
+
+from .extraction import next_run_at, process_pending
+
+EXTRACTION_BATCH_SIZE = 100
+
+
+def schedule_extractions(run_at=None):
+    """
+    Make sure a worker will pick up queued extraction jobs (at ``run_at``, default now)
+    """
+    run_at = run_at or timezone.now()
+    job = enqueue('bills.process_extractions', run_at=run_at, dedupe_key='bills.process_extractions')
+    if job.run_at > run_at:
+        # Coalesced into a later follow-up (a retry's): bring it forward
+        Job.objects.filter(pk=job.pk, status='queued').update(run_at=run_at)
+    return job
+
+
+@task('bills.process_extractions', priority=10, timeout=15 * 60)
+def process_extractions(limit=EXTRACTION_BATCH_SIZE, workers=None):
+    # One batch per job; a full batch queues a follow-up for the rest, else
+    # one for when the next retry is due or a running job's lease runs out
+    if process_pending(workers=workers, limit=limit) >= limit:
+        schedule_extractions()
+        return
+    run_at = next_run_at()
+    if run_at is not None:
+        schedule_extractions(run_at)
@@ -1,3 +1,914 @@
-from django.test import TestCase
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from PIL import Image
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from analytics.models import DailyRollup, Suggestion
+from analytics.rollups import summarize
+from billagent_backend.versioning import bump_data_version
+from jobs.models import Job
+from jobs.queue import claim, run_job
+from .corrections import apply_learned_corrections, correction_map
+from .export import export_stream
+from .extraction import StubExtractor, apply_result, claim_jobs, finish_job, process_pending
+from .models import (
+    Bill, BillCorrection, BillItem, BillTotals, ExtractionJob, ExtractionResult, UploadSession, Vendor,
+)
+from .search import ensure_search_index, search_bills
+from .signals import bills_changed
+from .vendors import assign_vendor, distinguishing_words, normalize_vendor_name, resolve_vendor
+
+
+User = get_user_model()
+
+
+def make_user(username='alice', **kwargs):
+    return User.objects.create_user(username=username, password='test-password-123', **kwargs)
+
+
+def client_for(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+def make_bill(user, amount='10.00', tax='1.00', status='pending', day=date(2026, 10, 12), vendor='D-Mart',
+              items=(), **kwargs):
+    """
+    Create a bill with ``items`` given as (name, price, category) tuples
+    """
+    bill = Bill.objects.create(user=user, total_amount=Decimal(amount), tax_amount=Decimal(tax), status=status,
+                               date=day, vendor_name=vendor, image='bills/test.png', **kwargs)
+    for name, price, category in items:
+        BillItem.objects.create(bill=bill, name=name, unit_price=Decimal(price), total_price=Decimal(price),
+                                category=category)
+    return bill
+
+
+class BillStatsTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.api = client_for(self.user)
+    
+    def stats(self, query=''):
+        return self.api.get(f'/api/bills/stats/{query}').json()
+    
+    def test_stats_follow_bill_writes(self):
+        self.assertEqual(self.stats()['total_bills'], 0)
+        first = make_bill(self.user, '10.00', '1.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            second = make_bill(self.user, '20.00', '2.00', status='verified', notes='hello')
+        self.assertEqual(self.stats(), {'total_bills': 2, 'total_amount': 30.0, 'total_tax': 3.0,
+                                        'average_amount': 15.0})
+        
+        first.status = 'verified'
+        first.total_amount = '15.50'
+        first.save()
+        self.assertEqual(self.stats('?status=verified')['total_amount'], 35.5)
+        self.assertEqual(self.stats('?status=pending')['total_bills'], 0)
+        self.assertEqual(self.stats('?search=hello')['total_bills'], 1)
+        
+        response = self.api.post(f'/api/bills/{second.pk}/correct/', {
+            'field_name': 'total_amount', 'original_value': '20', 'corrected_value': '25.00',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.stats()['total_amount'], 40.5)
+        self.assertEqual(self.stats('?status=corrected')['total_amount'], 25.0)
+        
+        Bill.objects.get(pk=first.pk).delete()
+        self.assertEqual(self.stats()['total_amount'], 25.0)
+        # Deleting a partially loaded instance still finds its old totals
+        Bill.objects.only('id').get(pk=second.pk).delete()
+        self.assertEqual(self.stats()['total_bills'], 0)
+    
+    def test_unfiltered_stats_read_one_row(self):
+        make_bill(self.user)
+        with self.assertNumQueries(1):
+            self.api.get('/api/bills/stats/')
+    
+    def test_totals_seeded_for_existing_bills(self):
+        make_bill(self.user)
+        BillTotals.objects.all().delete()
+        make_bill(self.user, '5.00')
+        self.assertEqual(self.stats()['total_amount'], 15.0)
+    
+    def test_totals_removed_with_user(self):
+        make_bill(self.user)
+        self.user.delete()
+        self.assertEqual(BillTotals.objects.count(), 0)
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.api = client_for(self.user)
+        # Newest first
+        self.ids = [make_bill(self.user).pk for _ in range(7)][::-1]
+    
+    def page_ids(self, page):
+        return [bill['id'] for bill in page['results']]
+    
+    def test_walk_forward_and_back(self):
+        first = self.api.get('/api/bills/?pagination=cursor&page_size=3').json()
+        self.assertEqual(self.page_ids(first), self.ids[:3])
+        self.assertIsNone(first['previous'])
+        second = self.api.get(first['next']).json()
+        self.assertEqual(self.page_ids(second), self.ids[3:6])
+        last = self.api.get(second['next']).json()
+        self.assertEqual(self.page_ids(last), self.ids[6:])
+        self.assertIsNone(last['next'])
+        
+        back = self.api.get(last['previous']).json()
+        self.assertEqual(self.page_ids(back), self.ids[3:6])
+        back = self.api.get(back['previous']).json()
+        self.assertEqual(self.page_ids(back), self.ids[:3])
+        self.assertIsNone(back['previous'])
+    
+    def test_cursor_page_skips_count(self):
+        first = self.api.get('/api/bills/?pagination=cursor&page_size=3').json()
+        with CaptureQueriesContext(connection) as queries:
+            self.api.get(first['next'])
+        self.assertFalse([query for query in queries if 'COUNT(' in query['sql']])
+    
+    def test_invalid_cursor_and_default_pagination(self):
+        self.assertEqual(self.api.get('/api/bills/?cursor=zzz').status_code, 404)
+        self.assertIn('count', self.api.get('/api/bills/').json())
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.api = client_for(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rice_bill = make_bill(self.user, vendor='D-Mart Ltd', bill_number='INV-0123',
+                                       items=[('Basmati Rice', '10', 'Grocery')])
+            self.cash_bill = make_bill(self.user, vendor='Reliance Fresh', notes='paid cash')
+            make_bill(make_user('bob'), vendor='D-Mart')
+    
+    def search(self, term, **params):
+        response = self.api.get('/api/bills/', {'search': term, **params})
+        return [bill['id'] for bill in response.json()['results']]
+    
+    def test_matches_bill_and_item_fields_by_prefix(self):
+        self.assertEqual(self.search('d mar'), [self.rice_bill.pk])
+        self.assertEqual(self.search('dmar'), [])
+        self.assertEqual(self.search('basm'), [self.rice_bill.pk])
+        self.assertEqual(self.search('0123'), [self.rice_bill.pk])
+        self.assertEqual(self.search('cash'), [self.cash_bill.pk])
+        self.assertEqual(self.search('grocery'), [self.rice_bill.pk])
+        self.assertEqual(self.search('rice', pagination='cursor'), [self.rice_bill.pk])
+        self.assertEqual(self.search('--'), [])
+        stats = self.api.get('/api/bills/stats/', {'search': 'cash'}).json()
+        self.assertEqual(stats['total_bills'], 1)
+    
+    def test_index_follows_writes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            BillItem.objects.create(bill=self.cash_bill, name='Toor Dal', unit_price=1, total_price=1)
+        self.assertEqual(self.search('toor'), [self.cash_bill.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cash_bill.delete()
+        self.assertEqual(self.search('toor'), [])
+    
+    def test_rebuild_search_index(self):
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        self.assertEqual(self.search('basm'), [self.rice_bill.pk])
+    
+    def test_broad_term_newest_first_and_own_bills_only(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            newer = make_bill(self.user, vendor='Dosa Corner')
+        self.assertEqual(self.search('d'), [newer.pk, self.rice_bill.pk])
+        matches = search_bills(Bill.objects.all(), self.user.pk, 'd mar')
+        self.assertEqual(list(matches.values_list('pk', flat=True)), [self.rice_bill.pk])
+    
+    def test_outdated_index_is_recreated_and_refilled(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE bills_bill_search')
+            cursor.execute('CREATE VIRTUAL TABLE bills_bill_search USING fts5('
+                           'bill_number, vendor_name, notes, items)')
+        ensure_search_index()
+        self.assertEqual(self.search('basm'), [self.rice_bill.pk])
+
+
+class BulkImportTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.api = client_for(self.user)
+    
+    def test_ndjson_reports_bad_rows_and_imports_the_rest(self):
+        lines = [
+            json.dumps({'bill_number': 'A1', 'vendor_name': 'D-Mart', 'date': '2026-10-01', 'total_amount': '10.50',
+                        'items': [{'name': 'rice', 'unit_price': '10.50', 'total_price': '10.50',
+                                   'category': 'Food'}]}),
+            '{bad json',
+            json.dumps({'total_amount': 'abc'}),
+            '',
+            json.dumps({'bill_number': 'A2', 'total_amount': '5'}),
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.api.post('/api/bills/import/?file_type=ndjson', data='\n'.join(lines),
+                                     content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 201, response.content)
+        report = response.json()
+        self.assertEqual((report['created'], report['failed']), (2, 2))
+        self.assertEqual([error['row'] for error in report['errors']], [2, 3])
+        self.assertEqual(BillItem.objects.count(), 1)
+        # Totals, rollups and the search index are kept up to date
+        self.assertEqual(self.api.get('/api/bills/stats/').json()['total_amount'], 15.5)
+        self.assertEqual(DailyRollup.objects.count(), 2)
+        self.assertEqual(len(self.api.get('/api/bills/', {'search': 'rice'}).json()['results']), 1)
+    
+    def test_csv_groups_item_rows_by_bill_ref(self):
+        data = (
+            'bill_ref,bill_number,vendor_name,date,total_amount,item_name,item_unit_price,item_total_price,'
+            'item_category\n'
+            '1,B1,Shop,2026-10-01,30,a,10,10,X\n'
+            '1,B1,Shop,2026-10-01,30,b,20,20,Y\n'
+            '2,B2,Shop2,2026-10-02,5,,,,\n'
+            '3,B3,S,notadate,5,,,,\n'
+        )
+        upload = SimpleUploadedFile('bills.csv', data.encode(), 'text/csv')
+        report = self.api.post('/api/bills/import/', {'file': upload}, format='multipart').json()
+        self.assertEqual((report['created'], report['failed']), (2, 1), report)
+        self.assertEqual(report['errors'][0]['row'], 5)
+        self.assertEqual(Bill.objects.get(bill_number='B1').items.count(), 2)
+
+
+class ItemUpdateTests(TestCase):
+    def test_items_are_diffed_by_id(self):
+        user = make_user()
+        api = client_for(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            bill = make_bill(user, items=[('a', '1', 'X'), ('b', '2', 'Y'), ('c', '3', 'Z')])
+        kept, changed, _ = bill.items.order_by('id')
+        payload = {'items': [
+            {'id': kept.pk, 'name': 'a', 'unit_price': '1.00', 'total_price': '1.00', 'category': 'X',
+             'quantity': '1.00'},
+            {'id': changed.pk, 'name': 'b2', 'unit_price': '2', 'total_price': '5', 'category': 'Y'},
+            {'name': 'new', 'unit_price': '7', 'total_price': '7', 'category': 'N'},
+        ]}
+        with self.captureOnCommitCallbacks(execute=True):
+            response = api.patch(f'/api/bills/{bill.pk}/', payload, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual([item['name'] for item in response.json()['items']], ['a', 'b2', 'new'])
+        
+        items = list(bill.items.order_by('id'))
+        self.assertEqual([item.name for item in items], ['a', 'b2', 'new'])
+        # Unchanged rows keep their identity
+        self.assertEqual(items[0].pk, kept.pk)
+        self.assertEqual(items[0].created_at, kept.created_at)
+        self.assertEqual(items[1].total_price, 5)
+        self.assertEqual(summarize(user.pk, date(2026, 10, 12), date(2026, 10, 12))['category_breakdown'],
+                         {'X': 1.0, 'Y': 5.0, 'N': 7.0})
+    
+    
+    def test_removed_items_cost_no_queries_per_item(self):
+        user = make_user()
+        api = client_for(user)
+        api.get('/api/bills/')
+        sent = []
+        receiver = lambda sender, **kwargs: sent.append(sender)
+        bills_changed.connect(receiver)
+        self.addCleanup(bills_changed.disconnect, receiver)
+        for removed in (1, 4):
+            with self.captureOnCommitCallbacks(execute=True):
+                bill = make_bill(user, items=[(f'item {number}', '1', 'X') for number in range(5)])
+            payload = {'items': [
+                {'id': item.pk, 'name': item.name, 'unit_price': '1.00', 'total_price': '1.00', 'category': 'X',
+                 'quantity': '1.00'} for item in bill.items.order_by('id')[removed:]
+            ]}
+            sent.clear()
+            with self.assertNumQueries(25):
+                with self.captureOnCommitCallbacks(execute=True):
+                    response = api.patch(f'/api/bills/{bill.pk}/', payload, format='json')
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertEqual(bill.items.count(), 5 - removed)
+            # Only the bill's own save reports the change
+            self.assertEqual(sent, [Bill])
+
+
+def png_bytes(color='red', size=(40, 40)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class TemporaryMediaMixin:
+    """
+    Store the files a test uploads in a temporary MEDIA_ROOT
+    """
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media_settings = self.settings(MEDIA_ROOT=self.media_root,
+                                       BILL_UPLOAD_TEMP_DIR=os.path.join(self.media_root, 'parts'))
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+
+class ContentAddressedUploadTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user()
+        self.api = client_for(self.user)
+    
+    def create(self, api, data, name='bill.png'):
+        image = SimpleUploadedFile(name, data, 'image/png')
+        return api.post('/api/bills/', {'image': image, 'total_amount': '5'}, format='multipart')
+    
+    def test_same_image_is_stored_once(self):
+        data = png_bytes()
+        self.assertEqual(self.create(self.api, data).status_code, 201)
+        bill = Bill.objects.get()
+        digest = hashlib.sha256(data).hexdigest()
+        self.assertEqual(bill.image_hash, digest)
+        self.assertEqual(bill.image.name, f'bills/{digest[:2]}/{digest[2:4]}/{digest}.png')
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, bill.image.name)))
+        
+        # The same user uploading it again gets the existing bill back
+        response = self.create(self.api, data, 'again.PNG')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['id'], bill.pk)
+        
+        # Another user gets a bill of their own sharing the stored file
+        response = self.create(client_for(make_user('bob')), data)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Bill.objects.count(), 2)
+        self.assertEqual(len({bill.image.name for bill in Bill.objects.all()}), 1)
+
+
+class ResumableUploadTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user()
+        self.api = client_for(self.user)
+    
+    def start(self, data, **extra):
+        return self.api.post('/api/bills/uploads/', {'filename': 'scan.png', 'total_size': len(data), **extra},
+                             format='json')
+    
+    def put_chunk(self, session_id, chunk, content_range=None):
+        headers = {'HTTP_CONTENT_RANGE': content_range} if content_range else {}
+        return self.api.generic('PUT', f'/api/bills/uploads/{session_id}/chunk/', chunk,
+                                content_type='application/octet-stream', **headers)
+    
+    def complete(self, session_id, data):
+        return self.api.post(f'/api/bills/uploads/{session_id}/complete/', data, format='json')
+    
+    def test_upload_in_chunks(self):
+        data = png_bytes('blue', (300, 300))
+        size = len(data)
+        half = size // 2
+        response = self.start(data)
+        self.assertEqual(response.status_code, 201, response.content)
+        session_id = response.data['id']
+        
+        response = self.put_chunk(session_id, data[:half], f'bytes 0-{half - 1}/{size}')
+        self.assertEqual(response.data['received'], half)
+        # A chunk at the wrong offset is refused with the offset to resume from
+        response = self.put_chunk(session_id, data[:10], f'bytes 0-9/{size}')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['received'], half)
+        self.assertEqual(self.api.get(f'/api/bills/uploads/{session_id}/').data['received'], half)
+        self.assertEqual(self.complete(session_id, {'total_amount': '3'}).status_code, 400)
+        # Overrunning the declared size is refused
+        self.assertEqual(self.put_chunk(session_id, data[half:] + b'xx').status_code, 400)
+        self.assertEqual(UploadSession.objects.get().received, half)
+        
+        response = self.put_chunk(session_id, data[half:], f'bytes {half}-{size - 1}/{size}')
+        self.assertEqual(response.data['received'], size)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.complete(session_id, {
+                'total_amount': '3', 'vendor_name': 'X',
+                'items': [{'name': 'a', 'unit_price': '3', 'total_price': '3'}],
+            })
+        self.assertEqual(response.status_code, 201, response.content)
+        bill = Bill.objects.get()
+        self.assertEqual(bill.image_hash, hashlib.sha256(data).hexdigest())
+        self.assertEqual(bill.items.count(), 1)
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'parts', f'{session_id}.part')))
+        self.assertEqual(self.api.get('/api/bills/stats/').data['total_bills'], 1)
+        
+        # Completing again is idempotent
+        response = self.complete(session_id, {'total_amount': '3'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['id'], bill.pk)
+        # A session for content already stored completes immediately
+        response = self.start(data, sha256=bill.image_hash.upper())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['bill'], bill.pk)
+        self.assertEqual(response.data['status'], 'complete')
+    
+    def test_rejects_bad_content(self):
+        data = b'not an image at all'
+        session_id = self.start(data).data['id']
+        self.put_chunk(session_id, data)
+        self.assertEqual(self.complete(session_id, {}).status_code, 400)
+        
+        session_id = self.start(data, sha256='0' * 64).data['id']
+        self.put_chunk(session_id, data)
+        response = self.complete(session_id, {})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('sha256', response.data['error'])
+        self.assertEqual(self.api.delete(f'/api/bills/uploads/{session_id}/').status_code, 204)
+        
+        response = self.api.post('/api/bills/uploads/', {'filename': 'x.png', 'total_size': 10 ** 12},
+                                 format='json')
+        self.assertEqual(response.status_code, 400)
+    
+    def test_sessions_are_private(self):
+        session_id = self.start(b'data').data['id']
+        other = client_for(make_user('bob'))
+        self.assertEqual(other.get(f'/api/bills/uploads/{session_id}/').status_code, 404)
+
+
+class ExtractionTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user()
+        self.api = client_for(self.user)
+    
+    def upload(self, api, color):
+        image = SimpleUploadedFile('bill.png', png_bytes(color, (20, 20)), 'image/png')
+        with self.captureOnCommitCallbacks(execute=True):
+            api.post('/api/bills/', {'image': image}, format='multipart')
+        return Bill.objects.latest('pk')
+    
+    def test_extraction_fills_the_bill(self):
+        bill = self.upload(self.api, 'red')
+        response = self.api.post(f'/api/bills/{bill.pk}/extract/')
+        self.assertEqual(response.status_code, 202)
+        # Asking again returns the job already queued
+        self.assertEqual(self.api.post(f'/api/bills/{bill.pk}/extract/').data['id'], response.data['id'])
+        with mock.patch.object(StubExtractor, 'extract', wraps=StubExtractor().extract) as extract:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(process_pending(workers=1), 1)
+        self.assertEqual(extract.call_count, 1)
+        
+        bill.refresh_from_db()
+        self.assertTrue(bill.vendor_name)
+        self.assertEqual(bill.ocr_data['bill_number'], bill.bill_number)
+        self.assertGreater(bill.items.count(), 0)
+        self.assertEqual(sum(item.total_price for item in bill.items.all()) + bill.tax_amount, bill.total_amount)
+        stats = self.api.get('/api/bills/stats/').data
+        self.assertEqual(float(stats['total_amount']), float(bill.total_amount))
+        self.assertTrue(DailyRollup.objects.filter(user=self.user, day=bill.date).exists())
+        search = self.api.get('/api/bills/', {'search': bill.items.first().name.split()[0]})
+        self.assertTrue(search.data['count'])
+    
+    def test_result_is_reused_for_the_same_image(self):
+        bill = self.upload(self.api, 'red')
+        self.api.post(f'/api/bills/{bill.pk}/extract/')
+        process_pending(workers=1)
+        
+        other = client_for(make_user('bob'))
+        other_bill = self.upload(other, 'red')
+        # Bills of other users in the batch are ignored
+        response = other.post('/api/bills/extract/', {'bill_ids': [other_bill.pk, bill.pk]}, format='json')
+        self.assertEqual(len(response.data), 1)
+        with mock.patch.object(StubExtractor, 'extract') as extract:
+            process_pending(workers=1)
+        extract.assert_not_called()
+        job = ExtractionJob.objects.get(bill=other_bill)
+        self.assertTrue(job.cached)
+        self.assertEqual(job.status, 'succeeded')
+        self.assertEqual(ExtractionResult.objects.count(), 1)
+        self.assertEqual(other.get('/api/bills/extractions/').data['count'], 1)
+    
+    def test_user_entered_fields_are_kept(self):
+        bill = self.upload(self.api, 'green')
+        Bill.objects.filter(pk=bill.pk).update(vendor_name='Mine')
+        self.api.post(f'/api/bills/{bill.pk}/extract/')
+        process_pending(workers=1)
+        bill.refresh_from_db()
+        self.assertEqual(bill.vendor_name, 'Mine')
+    
+    def test_failed_extraction_is_retried_with_backoff_then_failed(self):
+        bill = self.upload(self.api, 'blue')
+        self.api.post(f'/api/bills/{bill.pk}/extract/')
+        delays = []
+        with mock.patch.object(StubExtractor, 'extract', side_effect=RuntimeError('boom')):
+            for _ in range(3):
+                process_pending(workers=1)
+                job = ExtractionJob.objects.get()
+                delays.append(round((job.run_at - job.finished_at).total_seconds()))
+                # Not due yet: nothing to claim
+                self.assertEqual(process_pending(workers=1), 0)
+                ExtractionJob.objects.update(run_at=timezone.now())
+        self.assertEqual(delays[:2], [60, 120])
+        job = ExtractionJob.objects.get()
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.attempts, 3)
+        self.assertIn('boom', job.error)
+    
+    def test_retry_schedules_a_follow_up_job(self):
+        bill = self.upload(self.api, 'blue')
+        self.api.post(f'/api/bills/{bill.pk}/extract/')
+        with mock.patch.object(StubExtractor, 'extract', side_effect=RuntimeError('boom')):
+            self.assertTrue(run_job(claim('test')[0]))
+        retry_at = ExtractionJob.objects.get().run_at
+        follow_up = Job.objects.get(task='bills.process_extractions', status='queued')
+        self.assertEqual(follow_up.run_at, retry_at)
+        # A new request brings the follow-up forward instead of waiting behind it
+        self.api.post(f'/api/bills/{self.upload(self.api, "red").pk}/extract/')
+        follow_up.refresh_from_db()
+        self.assertLess(follow_up.run_at, retry_at)
+    
+    def test_lost_running_job_is_claimed_again(self):
+        bill = self.upload(self.api, 'white')
+        self.api.post(f'/api/bills/{bill.pk}/extract/')
+        stale = timezone.now() - timedelta(minutes=16)
+        ExtractionJob.objects.update(status='running', started_at=stale, attempts=1)
+        self.assertEqual(process_pending(workers=1), 1)
+        job = ExtractionJob.objects.get()
+        self.assertEqual((job.status, job.attempts), ('succeeded', 2))
+        
+        ExtractionJob.objects.update(status='running', started_at=stale, attempts=3)
+        self.assertEqual(process_pending(workers=1), 0)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), ('failed', 'Extraction timed out'))
+    
+    def test_late_result_of_a_reclaimed_job_is_dropped(self):
+        bill = self.upload(self.api, 'black')
+        self.api.post(f'/api/bills/{bill.pk}/extract/')
+        job = claim_jobs()[0]
+        ExtractionJob.objects.update(started_at=timezone.now() + timedelta(seconds=1))
+        finish_job(job, error=RuntimeError('late'))
+        self.assertEqual(ExtractionJob.objects.get().status, 'running')
+    
+    def test_imported_bill_without_an_image_fails_alone(self):
+        bill = self.upload(self.api, 'red')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.api.post('/api/bills/import/?file_type=ndjson', data=json.dumps({'total_amount': '5'}),
+                          content_type='application/x-ndjson')
+        imported = Bill.objects.latest('pk')
+        self.assertFalse(imported.image)
+        response = self.api.post('/api/bills/extract/', {'bill_ids': [imported.pk, bill.pk]}, format='json')
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(process_pending(workers=1), 2)
+        statuses = dict(ExtractionJob.objects.values_list('bill_id', 'status'))
+        self.assertEqual(statuses, {imported.pk: 'queued', bill.pk: 'succeeded'})
+        self.assertIn('Bill image is missing', ExtractionJob.objects.get(bill=imported).error)
+    
+    def test_batch_requires_a_list_of_ids(self):
+        response = self.api.post('/api/bills/extract/', {'bill_ids': 'x'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ExtractionPoolTests(TemporaryMediaMixin, TransactionTestCase):
+    def test_jobs_run_in_parallel(self):
+        api = client_for(make_user())
+        for color in ('red', 'green', 'blue', 'white', 'black', 'yellow', 'pink', 'gray'):
+            image = SimpleUploadedFile('bill.png', png_bytes(color, (20, 20)), 'image/png')
+            api.post('/api/bills/', {'image': image}, format='multipart')
+        api.post('/api/bills/extract/', {'bill_ids': list(Bill.objects.values_list('pk', flat=True))},
+                 format='json')
+        self.assertEqual(process_pending(workers=4), 8)
+        self.assertEqual(ExtractionJob.objects.filter(status='succeeded').count(), 8)
+        self.assertFalse(Bill.objects.filter(vendor_name='').exists())
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.api = client_for(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            make_bill(self.user, '10', vendor='Alpha', items=[('rice', '4', 'G'), ('oil', '6', 'G')])
+            make_bill(self.user, '20', status='verified', vendor='Beta Mart', day=date(2026, 1, 1))
+            make_bill(make_user('bob'), '99')
+    
+    def body(self, response):
+        return b''.join(response.streaming_content)
+    
+    def csv_rows(self, response):
+        return list(csv.DictReader(io.StringIO(self.body(response).decode())))
+    
+    def test_csv_has_a_row_per_item(self):
+        response = self.api.get('/api/bills/export/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        self.assertEqual(sorted(row['item_name'] for row in self.csv_rows(response)), ['', 'oil', 'rice'])
+    
+    def test_filters_and_formats(self):
+        response = self.api.get('/api/bills/export/?status=verified', HTTP_ACCEPT='text/csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['vendor_name'] for row in self.csv_rows(response)], ['Beta Mart'])
+        
+        response = self.api.get('/api/bills/export/?search=alpha&file_type=ndjson')
+        lines = [json.loads(line) for line in self.body(response).decode().splitlines()]
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(len(lines[0]['items']), 2)
+    
+    def test_gzip(self):
+        response = self.api.get('/api/bills/export/?file_type=ndjson&compression=gzip')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('bills.ndjson.gz', response['Content-Disposition'])
+        self.assertEqual(len(gzip.decompress(self.body(response)).splitlines()), 2)
+    
+    def test_unknown_file_type(self):
+        response = self.api.get('/api/bills/export/?file_type=xml')
+        self.assertEqual(response.status_code, 400, response.content)
+        self.assertIn('error', json.loads(response.content))
+    
+    def test_one_item_query_per_chunk(self):
+        for _ in range(25):
+            make_bill(self.user, '1', items=[('x', '1', 'C')])
+        with CaptureQueriesContext(connection) as queries:
+            data = b''.join(export_stream(Bill.objects.filter(user=self.user), 'csv', chunk_size=10))
+        # The bill iterator plus one item query for each of the three chunks
+        self.assertEqual(len(queries), 1 + 3)
+        self.assertEqual(len(data.splitlines()), 1 + 28)
+    
+    def test_export_can_be_imported(self):
+        data = self.body(self.api.get('/api/bills/export/'))
+        other = make_user('carol')
+        response = client_for(other).post('/api/bills/import/', data, content_type='text/csv')
+        self.assertEqual(response.status_code, 201, response.content)
+        bills = Bill.objects.filter(user=other)
+        self.assertEqual(sorted(bill.items.count() for bill in bills), [0, 2])
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.api = client_for(self.user)
+        for _ in range(5):
+            make_bill(self.user, items=[('a', '1', 'X')], ocr_data={'raw': 'x' * 100})
+    
+    def test_list_leaves_out_heavy_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            row = self.api.get('/api/bills/').json()['results'][0]
+        for field in ('ocr_data', 'items', 'user_name'):
+            self.assertNotIn(field, row)
+        sql = ' '.join(query['sql'] for query in queries)
+        self.assertNotIn('ocr_data', sql)
+        self.assertNotIn('bills_billitem', sql)
+    
+    def test_expand_is_prefetched(self):
+        with CaptureQueriesContext(connection) as queries:
+            rows = self.api.get('/api/bills/?expand=items,user_name').json()['results']
+        self.assertEqual(len(rows[0]['items']), 1)
+        self.assertEqual(rows[0]['user_name'], 'alice')
+        make_bill(self.user, items=[('b', '1', 'X')])
+        with self.assertNumQueries(len(queries)):
+            self.api.get('/api/bills/?expand=items,user_name')
+    
+    def test_fields(self):
+        response = self.api.get('/api/bills/?fields=id,total_amount,ocr_data&pagination=cursor')
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'total_amount', 'ocr_data'})
+        self.assertEqual(self.api.get('/api/bills/?search=mart&fields=id').status_code, 200)
+        
+        pk = response.json()['results'][0]['id']
+        detail = self.api.get(f'/api/bills/{pk}/').json()
+        self.assertIn('ocr_data', detail)
+        self.assertIn('items', detail)
+        self.assertEqual(set(self.api.get(f'/api/bills/{pk}/?fields=id,status').json()), {'id', 'status'})
+        self.assertEqual(self.api.patch(f'/api/bills/{pk}/', {'notes': 'n'}, format='json').status_code, 200)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.api = client_for(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bill = make_bill(self.user)
+    
+    def assertRevalidates(self, url, write):
+        """
+        A repeated GET is a query-free 304 until ``write`` changes the user's data
+        """
+        response = self.api.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.api.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+        with self.captureOnCommitCallbacks(execute=True):
+            write()
+        response = self.api.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+    
+    def test_bill_endpoints(self):
+        self.assertRevalidates('/api/bills/', lambda: make_bill(self.user))
+        self.assertRevalidates(f'/api/bills/{self.bill.pk}/', lambda: self.bill.items.create(
+            name='x', unit_price=1, total_price=1, category='c'))
+        self.assertRevalidates('/api/bills/stats/', lambda: BillCorrection.objects.create(
+            bill=self.bill, field_name='notes', original_value='1', corrected_value='2'))
+    
+    def test_analytics_endpoints(self):
+        self.assertRevalidates('/api/analytics/dashboard/', lambda: make_bill(self.user))
+        self.assertRevalidates('/api/analytics/suggestions/', lambda: Suggestion.objects.create(
+            user=self.user, title='t', description='d', suggestion_type='saving'))
+    
+    def test_no_etag_without_a_data_version(self):
+        # A dummy cache keeps no version to tag responses with
+        with self.settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+            for url in ('/api/bills/', '/api/analytics/dashboard/'):
+                response = self.api.get(url, HTTP_IF_NONE_MATCH='*')
+                self.assertEqual(response.status_code, 200)
+                self.assertNotIn('ETag', response)
+    
+    def test_refresh_is_never_a_304(self):
+        etag = self.api.get('/api/analytics/weekly/')['ETag']
+        response = self.api.get('/api/analytics/weekly/?refresh=true', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+    
+    def test_etags_are_per_user(self):
+        etag = self.api.get('/api/bills/')['ETag']
+        other = client_for(make_user('bob'))
+        self.assertEqual(other.get('/api/bills/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        # Weak comparison, and any tag in the list matches
+        response = self.api.get('/api/bills/', HTTP_IF_NONE_MATCH=f'W/{etag}, "other"')
+        self.assertEqual(response.status_code, 304)
+    
+    def test_version_is_bumped_after_the_rollups_are_rebuilt(self):
+        seen = []
+        
+        def bump(user_id):
+            # What a request arriving with the new version would read
+            seen.append(summarize(user_id, date(2026, 10, 1), date(2026, 10, 31))['total_bills'])
+            return bump_data_version(user_id)
+        
+        with mock.patch('analytics.rollups.bump_data_version', side_effect=bump):
+            with self.captureOnCommitCallbacks(execute=True):
+                make_bill(self.user)
+        self.assertEqual(seen, [2])
+
+
+class VendorTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+    
+    def test_normalize(self):
+        for name in ('D-Mart', 'DMART', 'D Mart Ltd.', 'd.mart'):
+            self.assertEqual(normalize_vendor_name(name), 'dmart')
+        self.assertEqual(normalize_vendor_name('  '), '')
+        self.assertEqual(normalize_vendor_name('सुपर बाज़ार'), normalize_vendor_name('सुपर  बाज़ार!'))
+    
+    def test_resolve_spellings_to_one_vendor(self):
+        dmart = resolve_vendor(self.user.pk, 'D-Mart')
+        self.assertEqual(dmart.name, 'D-Mart')
+        for spelling in ('DMART', 'D Mart Ltd.', 'D.Mart Pvt'):
+            self.assertEqual(resolve_vendor(self.user.pk, spelling), dmart, spelling)
+        self.assertEqual(resolve_vendor(self.user.pk, 'Reliance Fresh'),
+                         resolve_vendor(self.user.pk, 'Reliance Freshh'))
+        self.assertNotEqual(resolve_vendor(self.user.pk, 'Big Bazaar'), dmart)
+        self.assertNotEqual(resolve_vendor(make_user('bob').pk, 'D-Mart'), dmart)
+        self.assertIsNone(resolve_vendor(self.user.pk, ''))
+        self.assertEqual(Vendor.objects.filter(user=self.user).count(), 3)
+    
+    def test_numbers_and_short_words_must_match(self):
+        self.assertEqual(distinguishing_words('Apna Bazaar No. 12'), {'no', '12'})
+        pairs = (('Apna Bazaar Store 12', 'Apna Bazaar Store 13'), ('K Mart Stores', 'D Mart Stores'),
+                 ('Sharma Stores', 'Verma Stores'))
+        for first, second in pairs:
+            self.assertNotEqual(resolve_vendor(self.user.pk, first), resolve_vendor(self.user.pk, second))
+        self.assertEqual(resolve_vendor(self.user.pk, 'Apna Bazaar Store 12'),
+                         resolve_vendor(self.user.pk, 'Apna Bazar Store 12'))
+    
+    def test_split_vendor(self):
+        api = client_for(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            first = make_bill(self.user, '10', vendor='Reliance Fresh')
+            second = make_bill(self.user, '5', vendor='Reliance Freshh', day=date(2026, 10, 13))
+        self.assertEqual(second.vendor_id, first.vendor_id)
+        self.assertEqual(api.post(f'/api/bills/{first.pk}/split_vendor/').status_code, 400)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            response = api.post(f'/api/bills/{second.pk}/split_vendor/')
+        self.assertEqual(response.status_code, 200)
+        second.refresh_from_db()
+        self.assertNotEqual(second.vendor_id, first.vendor_id)
+        self.assertEqual(response.data['vendor'], second.vendor_id)
+        self.assertEqual(resolve_vendor(self.user.pk, 'RELIANCE FRESHH'), second.vendor)
+        vendors = summarize(self.user.pk, date(2026, 10, 1), date(2026, 10, 31))['top_vendors']
+        self.assertEqual(sorted(vendor['total'] for vendor in vendors), [5.0, 10.0])
+    
+    def test_bill_writes_assign_vendors(self):
+        api = client_for(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            bill = make_bill(self.user, '10', vendor='D-Mart')
+            make_bill(self.user, '5', vendor='DMART', items=[('x', '5', 'G')])
+            make_bill(self.user, '2', vendor='')
+        self.assertIsNotNone(bill.vendor_id)
+        top = summarize(self.user.pk, date(2026, 10, 1), date(2026, 10, 31))['top_vendors'][0]
+        self.assertEqual((top['vendor_name'], top['total'], top['count']), ('D-Mart', 15.0, 2))
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            response = api.patch(f'/api/bills/{bill.pk}/', {'vendor_name': 'Big Bazaar'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        bill = Bill.objects.get(pk=bill.pk)
+        self.assertEqual(bill.vendor.name, 'Big Bazaar')
+        # Unchanged names are not resolved again
+        bill.notes = 'x'
+        with self.assertNumQueries(0):
+            self.assertFalse(assign_vendor(bill))
+        
+        response = api.post('/api/bills/import/?file_type=ndjson',
+                            '{"vendor_name": "D MART", "total_amount": "3", "date": "2026-10-12"}\n',
+                            content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(Bill.objects.filter(vendor__name='D-Mart').count(), 2)
+    
+    def test_backfill_vendors(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            make_bill(self.user, '10', vendor='D-Mart')
+            make_bill(self.user, '5', vendor='DMART')
+        Bill.objects.update(vendor=None)
+        Vendor.objects.all().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('backfill_vendors', stdout=io.StringIO())
+        self.assertEqual(Bill.objects.filter(vendor__isnull=False).count(), 2)
+        self.assertEqual(DailyRollup.objects.filter(category='').count(), 1)
+
+
+class CorrectionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.api = client_for(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bill = make_bill(self.user, '10', vendor='DMRT', items=[('Paneer', '4', 'Misc'), ('Rice', '6', 'G')])
+    
+    def correct_batch(self, corrections):
+        return self.api.post(f'/api/bills/{self.bill.pk}/correct_batch/', {'corrections': corrections},
+                             format='json')
+    
+    def test_batch_is_applied_in_bulk(self):
+        paneer = self.bill.items.order_by('id').first()
+        corrections = [
+            {'field_name': 'vendor_name', 'corrected_value': 'D-Mart'},
+            {'field_name': 'total_amount', 'corrected_value': '12.50'},
+            {'field_name': 'date', 'corrected_value': '2026-10-13'},
+            {'field_name': 'items.category', 'item': paneer.pk, 'corrected_value': 'Dairy'},
+            {'field_name': 'items.total_price', 'item': paneer.pk, 'corrected_value': '6.50'},
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.correct_batch(corrections)
+        self.assertEqual(response.status_code, 201, response.content)
+        # One bill update, one correction insert and one item update
+        writes = [query['sql'] for query in queries if query['sql'].startswith(
+            ('UPDATE "bills_bill"', 'INSERT INTO "bills_billcorrection"', 'UPDATE "bills_billitem"'))]
+        self.assertEqual(len(writes), 3, writes)
+        self.assertEqual([correction['original_value'] for correction in response.json()],
+                         ['DMRT', '10.00', '2026-10-12', 'Misc', '4.00'])
+        
+        bill = Bill.objects.get(pk=self.bill.pk)
+        self.assertEqual((bill.vendor_name, str(bill.total_amount), bill.status, bill.vendor.name),
+                         ('D-Mart', '12.50', 'corrected', 'D-Mart'))
+        summary = summarize(self.user.pk, date(2026, 10, 13), date(2026, 10, 13))
+        self.assertEqual(summary['category_breakdown'], {'Dairy': 6.5, 'G': 6.0})
+        self.assertEqual(correction_map(self.user.pk),
+                         {'vendor_name': {'dmrt': 'D-Mart'}, 'items.category': {'misc': 'Dairy'}})
+    
+    def test_invalid_batch_changes_nothing(self):
+        for bad in ({'field_name': 'status', 'corrected_value': 'x'},
+                    {'field_name': 'items.category', 'item': 999, 'corrected_value': 'x'},
+                    {'field_name': 'total_amount', 'corrected_value': 'abc'}):
+            response = self.correct_batch([{'field_name': 'notes', 'corrected_value': 'n'}, bad])
+            self.assertEqual(response.status_code, 400, response.content)
+        self.assertEqual(BillCorrection.objects.count(), 0)
+        self.assertEqual(Bill.objects.get(pk=self.bill.pk).notes, '')
+        self.assertEqual(self.correct_batch([]).status_code, 400)
+    
+    def test_learned_corrections_apply_to_extractions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.api.post(f'/api/bills/{self.bill.pk}/correct/', {
+                'field_name': 'vendor_name', 'original_value': 'DMRT', 'corrected_value': 'D-Mart',
+            }, format='json')
+        self.assertEqual(correction_map(self.user.pk), {'vendor_name': {'dmrt': 'D-Mart'}})
+        with self.assertNumQueries(0):
+            corrections = correction_map(self.user.pk)
+        data = apply_learned_corrections({'vendor_name': ' dmrt ', 'items': [{'name': 'x', 'category': 'c'}]},
+                                         corrections)
+        self.assertEqual(data['vendor_name'], 'D-Mart')
+        self.assertEqual(len(data['applied_corrections']), 1)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            bill = make_bill(self.user, '0', vendor='')
+        apply_result(Bill.objects.get(pk=bill.pk), {'vendor_name': 'DMRT', 'items': []})
+        self.assertEqual(Bill.objects.get(pk=bill.pk).vendor_name, 'D-Mart')
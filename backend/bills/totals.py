@@ -0,0 +1,131 @@
+"""
+Per-user running totals backing the bill stats endpoint.
+
+Every bill write adjusts the matching ``BillTotals`` rows with F() expressions
+inside the writing transaction, so unfiltered stats never scan the bills table.
+Rows are seeded lazily from the bills table the first time a user is touched.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+from .models import Bill, BillTotals
+
+
+def to_decimal(value):
+    """
+    Coerce a model field value (possibly an unsaved string) to Decimal
+    """
+    if value in (None, ''):
+        return Decimal('0')
+    return Decimal(str(value))
+
+
+def rebuild_totals(user_id):
+    """
+    Recompute all totals rows for a user from the bills table
+    """
+    rows = {status: [0, Decimal('0'), Decimal('0')] for status, _ in Bill.STATUS_CHOICES}
+    aggregates = (
+        Bill.objects.filter(user_id=user_id)
+        .order_by()
+        .values('status')
+        .annotate(bill_count=Count('id'), total_amount=Sum('total_amount'), total_tax=Sum('tax_amount'))
+    )
+    for row in aggregates:
+        rows[row['status']] = [row['bill_count'], row['total_amount'] or 0, row['total_tax'] or 0]
+    
+    with transaction.atomic():
+        BillTotals.objects.filter(user_id=user_id).delete()
+        BillTotals.objects.bulk_create([
+            BillTotals(user_id=user_id, status=status, bill_count=count,
+                       total_amount=amount, total_tax=tax)
+            for status, (count, amount, tax) in rows.items()
+        ])
+
+
+def _apply_delta(user_id, status, count, amount, tax):
+    return BillTotals.objects.filter(user_id=user_id, status=status).update(
+        bill_count=F('bill_count') + count,
+        total_amount=F('total_amount') + amount,
+        total_tax=F('total_tax') + tax,
+    )
+
+
+def record_bill_change(old, new):
+    """
+    Move a bill's contribution from ``old`` to ``new``.
+    
+    Both arguments are dicts with ``user_id``, ``status``, ``total_amount`` and
+    ``tax_amount`` keys, or None for a created/deleted bill.
+    """
+    deltas = defaultdict(lambda: [0, Decimal('0'), Decimal('0')])
+    for values, sign in ((old, -1), (new, 1)):
+        if values is None:
+            continue
+        delta = deltas[(values['user_id'], values['status'])]
+        delta[0] += sign
+        delta[1] += sign * to_decimal(values['total_amount'])
+        delta[2] += sign * to_decimal(values['tax_amount'])
+    
+    with transaction.atomic():
+        rebuilt = set()
+        for (user_id, status), (count, amount, tax) in deltas.items():
+            if user_id in rebuilt or not (count or amount or tax):
+                continue
+            if _apply_delta(user_id, status, count, amount, tax):
+                continue
+            # No row yet: the user was never seeded (or the status is new), so
+            # recompute from the bills table, which already reflects this write
+            try:
+                with transaction.atomic():
+                    rebuild_totals(user_id)
+            except IntegrityError:
+                # A concurrent writer seeded the rows first
+                _apply_delta(user_id, status, count, amount, tax)
+            rebuilt.add(user_id)
+
+
+def record_bulk_create(user_id, bills):
+    """
+    Add a batch of newly inserted bills (e.g. from bulk_create) to the totals
+    """
+    deltas = defaultdict(lambda: [0, Decimal('0'), Decimal('0')])
+    for bill in bills:
+        delta = deltas[bill.status]
+        delta[0] += 1
+        delta[1] += to_decimal(bill.total_amount)
+        delta[2] += to_decimal(bill.tax_amount)
+    
+    with transaction.atomic():
+        for status, (count, amount, tax) in deltas.items():
+            if not _apply_delta(user_id, status, count, amount, tax):
+                # Unseeded user or new status: the bills table already has the batch
+                rebuild_totals(user_id)
+                return
+
+
+def get_totals(user_id, status=None):
+    """
+    Return ``(bill_count, total_amount, total_tax)`` for a user, optionally
+    restricted to one status, from the precomputed rows
+    """
+    rows = BillTotals.objects.filter(user_id=user_id)
+    if status:
+        rows = rows.filter(status=status)
+    result = rows.aggregate(
+        rows=Count('id'),
+        bill_count=Sum('bill_count'),
+        total_amount=Sum('total_amount'),
+        total_tax=Sum('total_tax'),
+    )
+    if not result['rows'] and not BillTotals.objects.filter(user_id=user_id).exists():
+        rebuild_totals(user_id)
+        return get_totals(user_id, status)
+    return (
+        result['bill_count'] or 0,
+        result['total_amount'] or Decimal('0'),
+        result['total_tax'] or Decimal('0'),
+    )
@@ -0,0 +1,156 @@
+"""
+Resumable, chunked bill image uploads.
+
+A client opens an ``UploadSession`` with the file name and size, then sends
+the bytes in any number of ``PUT`` requests, each starting where the previous
+one stopped (``Content-Range: bytes <start>-<end>/<total>``). After a dropped
+connection it reads the session back to learn how many bytes arrived and
+resumes from there. Completing the session hashes the assembled file and
+either creates the bill or returns the one that already holds that image.
+"""
+import os
+import re
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from PIL import Image
+
+from .models import Bill, UploadSession
+from .storage import HASH_CHUNK_SIZE, content_hash
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+
+
+class UploadError(Exception):
+    """
+    A chunk or completion request that cannot be applied to the session
+    """
+    def __init__(self, message, conflict=False):
+        super().__init__(message)
+        self.message = message
+        self.conflict = conflict
+
+
+def find_duplicate(user, digest):
+    """
+    Return the user's existing bill for an image hash, if any
+    """
+    if not digest:
+        return None
+    return Bill.objects.filter(user=user, image_hash=digest).order_by('pk').first()
+
+
+def parse_content_range(header, session):
+    """
+    Return the start offset declared by a chunk's Content-Range header
+    """
+    if not header:
+        # A bare PUT continues from the current offset
+        return session.received
+    match = CONTENT_RANGE_RE.match(header.strip())
+    if not match:
+        raise UploadError('Content-Range must look like "bytes <start>-<end>/<total>"')
+    start, end, total = match.groups()
+    if total != '*' and int(total) != session.total_size:
+        raise UploadError('Content-Range total does not match the session size')
+    if int(end) < int(start):
+        raise UploadError('Content-Range end is before its start')
+    return int(start)
+
+
+def append_chunk(session_id, user, start, stream):
+    """
+    Append a request body to the partial file at ``start``; returns the session
+    
+    Bytes that arrive before a connection drops are kept, so the client can
+    resume from ``received``. The session row is locked while writing so two
+    chunks cannot interleave.
+    """
+    overrun = False
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(pk=session_id, user=user)
+        if session.status != 'open':
+            raise UploadError('Upload session is already complete', conflict=True)
+        if start != session.received:
+            raise UploadError(f'Expected offset {session.received}', conflict=True)
+        
+        os.makedirs(settings.BILL_UPLOAD_TEMP_DIR, exist_ok=True)
+        remaining = session.total_size - session.received
+        written = 0
+        with open(session.partial_path, 'ab') as partial:
+            # Drop any bytes written past the last recorded offset
+            partial.truncate(session.received)
+            while stream is not None:
+                try:
+                    chunk = stream.read(HASH_CHUNK_SIZE)
+                except OSError:
+                    # Client went away mid-body: keep what has arrived
+                    break
+                if not chunk:
+                    break
+                if written + len(chunk) > remaining:
+                    overrun = True
+                    break
+                partial.write(chunk)
+                written += len(chunk)
+        if written:
+            session.received += written
+            session.save(update_fields=['received', 'updated_at'])
+    
+    if overrun:
+        raise UploadError('Chunk runs past the declared file size')
+    return session
+
+
+def complete_upload(session, serializer):
+    """
+    Turn a fully received session into a bill, or return the existing duplicate
+    
+    ``serializer`` is a validated serializer for the bill's other fields.
+    Returns ``(bill, created)``; completing a finished session again returns
+    its bill.
+    """
+    with transaction.atomic():
+        # Locked so a retried completion cannot create the bill twice
+        session = UploadSession.objects.select_for_update().select_related('user').get(pk=session.pk)
+        if session.status == 'complete':
+            if session.bill_id is None:
+                raise UploadError('The bill for this upload has been deleted', conflict=True)
+            return session.bill, False
+        if session.received != session.total_size:
+            raise UploadError(f'Upload incomplete: {session.received} of {session.total_size} bytes received')
+        
+        with open(session.partial_path, 'rb') as partial:
+            image = File(partial, name=session.filename)
+            digest = content_hash(image)
+            if session.sha256 and session.sha256 != digest:
+                raise UploadError('Uploaded bytes do not match the declared sha256')
+            
+            bill = find_duplicate(session.user, digest)
+            created = bill is None
+            if created:
+                try:
+                    Image.open(partial).verify()
+                except Exception:
+                    raise UploadError('Upload a valid image. The file you uploaded was either '
+                                      'not an image or a corrupted image.')
+                image.seek(0)
+                bill = serializer.save(user=session.user, image=image, image_hash=digest)
+        
+        session.status = 'complete'
+        session.bill = bill
+        session.save(update_fields=['status', 'bill', 'updated_at'])
+    
+    discard_partial(session)
+    return bill, created
+
+
+def discard_partial(session):
+    """
+    Remove a session's partial file from disk
+    """
+    try:
+        os.remove(session.partial_path)
+    except FileNotFoundError:
+        pass
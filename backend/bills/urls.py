@@ -1,8 +1,10 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import BillViewSet
+from .views import BillViewSet, ExtractionJobViewSet, UploadSessionViewSet
 
 router = DefaultRouter()
+router.register(r'extractions', ExtractionJobViewSet, basename='bill-extraction')
+router.register(r'uploads', UploadSessionViewSet, basename='bill-upload')
 router.register(r'', BillViewSet, basename='bill')
 
 urlpatterns = [
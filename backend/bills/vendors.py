@@ -0,0 +1,190 @@
+"""
+Canonical vendors and fuzzy vendor-name matching.
+
+OCR produces many spellings of one store ("D-Mart", "DMART", "D Mart Ltd.").
+Each user has a dictionary of canonical ``Vendor`` rows, and a bill's
+free-text ``vendor_name`` is mapped to one of them when the bill is written:
+first by exact match on the normalized name, then through a character
+trigram index (``VendorNgram``) that finds the closest existing vendor with
+one indexed query instead of scanning every vendor. A fuzzy match must also
+agree on the words that tell branches and similar names apart (numbers and
+very short words: "Store 12" is not "Store 13", "K Mart" is not "D Mart").
+Names with no close match start a new vendor, and ``split_vendor`` undoes a
+match that merged two different stores.
+"""
+import re
+import unicodedata
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count
+
+from .models import Bill, Vendor, VendorNgram
+from .signals import bills_changed
+
+# Words that do not tell two stores apart
+STOPWORDS = frozenset({
+    'the', 'ltd', 'limited', 'pvt', 'private', 'inc', 'llc', 'llp', 'co', 'corp', 'company',
+})
+
+NGRAM_SIZE = 3
+
+# Minimum Dice similarity of trigram sets for a name to join an existing vendor
+MATCH_THRESHOLD = 0.8
+
+# Words up to this long (and words with digits) must match exactly
+SHORT_WORD_LENGTH = 3
+
+# Vendors sharing the most trigrams that are scored for a fuzzy match
+CANDIDATE_LIMIT = 10
+
+WORD_RE = re.compile(r'[^\W_]+')
+
+
+def vendor_words(name):
+    """
+    Split a vendor name into case-folded words, without stopwords
+    """
+    words = WORD_RE.findall(unicodedata.normalize('NFKC', name or '').casefold())
+    # A name made only of stopwords keeps them rather than becoming empty
+    return [word for word in words if word not in STOPWORDS] or words
+
+
+def normalize_vendor_name(name):
+    """
+    Reduce a vendor name to its matching key: case-folded letters and digits
+    """
+    return ''.join(vendor_words(name))[:255]
+
+
+def distinguishing_words(name):
+    """
+    Return the words of a name that a fuzzy match may not change
+    """
+    return frozenset(
+        word for word in vendor_words(name)
+        if len(word) <= SHORT_WORD_LENGTH or any(char.isdigit() for char in word)
+    )
+
+
+def vendor_ngrams(key):
+    """
+    Return the set of boundary-padded character trigrams of a normalized name
+    """
+    if not key:
+        return set()
+    padded = f'^{key}$'
+    return {padded[i:i + NGRAM_SIZE] for i in range(max(len(padded) - NGRAM_SIZE + 1, 1))}
+
+
+def closest_vendor(user_id, ngrams, words=frozenset()):
+    """
+    Return the user's vendor whose name is most similar to ``ngrams``, if close enough
+    
+    Vendors whose distinguishing words differ from ``words`` never match.
+    """
+    candidates = (
+        VendorNgram.objects.filter(user_id=user_id, ngram__in=ngrams)
+        .values('vendor_id', 'vendor__name', 'vendor__ngram_count')
+        .annotate(shared=Count('id'))
+        .order_by('-shared', 'vendor_id')[:CANDIDATE_LIMIT]
+    )
+    best_id, best_score = None, MATCH_THRESHOLD
+    for candidate in candidates:
+        score = 2 * candidate['shared'] / (len(ngrams) + candidate['vendor__ngram_count'])
+        if score >= best_score and distinguishing_words(candidate['vendor__name']) == words:
+            best_id, best_score = candidate['vendor_id'], score
+    return Vendor.objects.filter(pk=best_id).first() if best_id else None
+
+
+def create_vendor(user_id, name, key, ngrams):
+    """
+    Add a vendor and its n-gram index entries (or return a concurrent twin)
+    """
+    try:
+        with transaction.atomic():
+            vendor = Vendor.objects.create(
+                user_id=user_id, name=name.strip()[:255], normalized_name=key, ngram_count=len(ngrams)
+            )
+            VendorNgram.objects.bulk_create([
+                VendorNgram(user_id=user_id, vendor=vendor, ngram=ngram) for ngram in ngrams
+            ])
+    except IntegrityError:
+        vendor = Vendor.objects.get(user_id=user_id, normalized_name=key)
+    return vendor
+
+
+class VendorResolver:
+    """
+    Map vendor names to a user's canonical vendors, remembering each answer
+    
+    Use one resolver per batch (an import, a backfill) so each distinct
+    spelling is looked up once.
+    """
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self._vendors = {}
+    
+    def resolve(self, name):
+        key = normalize_vendor_name(name)
+        if not key:
+            return None
+        if key not in self._vendors:
+            self._vendors[key] = self._lookup(name, key)
+        return self._vendors[key]
+    
+    def _lookup(self, name, key):
+        vendor = Vendor.objects.filter(user_id=self.user_id, normalized_name=key).first()
+        if vendor is not None:
+            return vendor
+        ngrams = vendor_ngrams(key)
+        return (closest_vendor(self.user_id, ngrams, distinguishing_words(name))
+                or create_vendor(self.user_id, name, key, ngrams))
+
+
+def resolve_vendor(user_id, name):
+    """
+    Return the canonical vendor for a name, or None for a blank name
+    """
+    return VendorResolver(user_id).resolve(name)
+
+
+def assign_vendor(bill):
+    """
+    Point a bill at the vendor for its ``vendor_name``; returns True if it changed
+    """
+    loaded = getattr(bill, '_loaded_values', None)
+    if bill.vendor_id is not None and loaded and loaded['vendor_name'] == bill.vendor_name:
+        return False
+    vendor = resolve_vendor(bill.user_id, bill.vendor_name)
+    if (vendor.pk if vendor else None) == bill.vendor_id:
+        return False
+    bill.vendor = vendor
+    return True
+
+
+def split_vendor(bill):
+    """
+    Move a bill's vendor spelling, and every bill using it, to a vendor of its own
+    
+    Undoes a fuzzy match between different stores: the new vendor holds the
+    spelling as its exact key, so later bills spelled that way resolve to it.
+    Returns the new vendor, or None if the bill's spelling already is its
+    vendor's own.
+    """
+    key = normalize_vendor_name(bill.vendor_name)
+    if not key or bill.vendor_id is None or bill.vendor.normalized_name == key:
+        return None
+    with transaction.atomic():
+        vendor = create_vendor(bill.user_id, bill.vendor_name, key, vendor_ngrams(key))
+        moved = [
+            (pk, day) for pk, name, day in
+            Bill.objects.filter(user_id=bill.user_id, vendor_id=bill.vendor_id)
+            .values_list('id', 'vendor_name', 'date')
+            if normalize_vendor_name(name) == key
+        ]
+        Bill.objects.filter(pk__in=[pk for pk, _ in moved]).update(vendor=vendor)
+        # Rebuilds the rollups (which carry the vendor) for those days on commit
+        bills_changed.send(sender=Bill, user_id=bill.user_id, days={day for _, day in moved},
+                           bill_ids={pk for pk, _ in moved})
+    bill.vendor = vendor
+    return vendor
@@ -1,24 +1,52 @@
-from rest_framework import viewsets, status
+from rest_framework import mixins, viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Q
-from .models import Bill, BillItem, BillCorrection
+from rest_framework.settings import api_settings
+from django.db.models import Count, Sum
+from django.http import StreamingHttpResponse
+from billagent_backend.conditional import ConditionalGetMixin
+from .models import Bill, BillItem, BillCorrection, ExtractionJob, UploadSession
 from .serializers import (
-    BillSerializer, BillCreateSerializer, BillUpdateSerializer,
-    BillCorrectionSerializer
+    BillSerializer, BillListSerializer, BillCreateSerializer, BillUpdateSerializer,
+    BillCorrectionSerializer, BillCorrectionBatchSerializer, BillImportSerializer, ExtractionJobSerializer, UploadSessionSerializer
 )
+from .corrections import apply_correction_batch
+from .export import CONTENT_TYPES, ExportRenderer, export_stream
+from .extraction import queue_extraction
+from .importer import BillImporter, iter_csv_records, iter_ndjson_records, iter_text_lines
+from .pagination import KeysetPagination
+from .search import search_bills
+from .storage import content_hash
+from .tasks import schedule_extractions
+from .totals import get_totals
+from .uploads import (
+    UploadError, append_chunk, complete_upload, discard_partial, find_duplicate, parse_content_range
+)
+from .vendors import split_vendor
 
 
-class BillViewSet(viewsets.ModelViewSet):
+class BillViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing bills
     """
     permission_classes = [IsAuthenticated]
+    conditional_actions = ('list', 'retrieve', 'stats')
     
     def get_queryset(self):
         # Users can only see their own bills
-        queryset = Bill.objects.filter(user=self.request.user).prefetch_related('items')
+        queryset = Bill.objects.filter(user=self.request.user)
+        if self.action in ('list', 'retrieve'):
+            # Load only what the requested representation will read
+            fields = self.get_serializer().fields
+            if 'items' in fields:
+                queryset = queryset.prefetch_related('items')
+            if 'user_name' in fields:
+                queryset = queryset.select_related('user')
+            if 'ocr_data' not in fields:
+                queryset = queryset.defer('ocr_data')
+        else:
+            queryset = queryset.prefetch_related('items')
         
         # Filter by status
         status_filter = self.request.query_params.get('status', None)
@@ -36,23 +64,47 @@ class BillViewSet(viewsets.ModelViewSet):
         # Search
         search = self.request.query_params.get('search', None)
         if search:
-            queryset = queryset.filter(
-                Q(bill_number__icontains=search) |
-                Q(vendor_name__icontains=search) |
-                Q(notes__icontains=search)
-            )
+            queryset = search_bills(queryset, self.request.user.pk, search)
         
         return queryset
     
+    @property
+    def paginator(self):
+        # Opt-in keyset pagination for the list (?pagination=cursor)
+        if (not hasattr(self, '_paginator') and self.action == 'list'
+                and KeysetPagination.requested(self.request)):
+            self._paginator = KeysetPagination()
+        return super().paginator
+    
     def get_serializer_class(self):
         if self.action == 'create':
             return BillCreateSerializer
         elif self.action in ['update', 'partial_update']:
             return BillUpdateSerializer
+        elif self.action == 'list':
+            return BillListSerializer
         return BillSerializer
     
+    def get_serializer(self, *args, **kwargs):
+        # Sparse fieldsets: ?fields=id,total_amount and ?expand=items
+        if self.action in ('list', 'retrieve'):
+            for param in ('fields', 'expand'):
+                names = [name.strip() for name in self.request.query_params.get(param, '').split(',')]
+                kwargs.setdefault(param, [name for name in names if name])
+        return super().get_serializer(*args, **kwargs)
+    
+    def create(self, request, *args, **kwargs):
+        # Re-uploading an image that is already stored returns its bill
+        image = request.FILES.get('image')
+        duplicate = find_duplicate(request.user, content_hash(image)) if image else None
+        if duplicate is not None:
+            serializer = BillSerializer(duplicate, context=self.get_serializer_context())
+            return Response(serializer.data, status=status.HTTP_200_OK)
+        return super().create(request, *args, **kwargs)
+    
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        image = serializer.validated_data.get('image')
+        serializer.save(user=self.request.user, image_hash=content_hash(image) if image else '')
     
     @action(detail=True, methods=['post'])
     def correct(self, request, pk=None):
@@ -88,16 +140,163 @@ class BillViewSet(viewsets.ModelViewSet):
             status=status.HTTP_201_CREATED
         )
     
+    @action(detail=True, methods=['post'])
+    def correct_batch(self, request, pk=None):
+        """
+        Apply several bill and item field corrections in one request
+        
+        Body: ``{"corrections": [{"field_name": "vendor_name", "corrected_value": "D-Mart"},
+        {"field_name": "items.category", "item": 12, "corrected_value": "Dairy"}]}``;
+        ``original_value`` defaults to the value being replaced.
+        """
+        bill = self.get_object()
+        serializer = BillCorrectionBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        corrections = apply_correction_batch(bill, serializer.validated_data['corrections'])
+        return Response(
+            BillCorrectionSerializer(corrections, many=True).data,
+            status=status.HTTP_201_CREATED
+        )
+    
+    @action(detail=True, methods=['post'])
+    def split_vendor(self, request, pk=None):
+        """
+        Give the bill's vendor spelling its own vendor (undo a wrong vendor match)
+        """
+        bill = self.get_object()
+        if split_vendor(bill) is None:
+            return Response(
+                {'error': "The bill's vendor name is already its vendor's own spelling"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(BillSerializer(bill, context=self.get_serializer_context()).data)
+    
+    @action(detail=True, methods=['post'])
+    def extract(self, request, pk=None):
+        """
+        Queue server-side OCR extraction for a bill
+        """
+        jobs = queue_extraction([self.get_object()])
+        schedule_extractions()
+        return Response(ExtractionJobSerializer(jobs[0]).data, status=status.HTTP_202_ACCEPTED)
+    
+    @action(detail=False, methods=['post'], url_path='extract')
+    def extract_batch(self, request):
+        """
+        Queue server-side OCR extraction for several bills (``bill_ids``)
+        """
+        bill_ids = request.data.get('bill_ids')
+        try:
+            bill_ids = [int(pk) for pk in bill_ids]
+        except (TypeError, ValueError):
+            bill_ids = None
+        if not bill_ids:
+            return Response({'error': 'bill_ids must be a non-empty list of ids'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        
+        bills = Bill.objects.filter(user=request.user, pk__in=bill_ids).only('pk')
+        jobs = queue_extraction(bills)
+        schedule_extractions()
+        return Response(ExtractionJobSerializer(jobs, many=True).data, status=status.HTTP_202_ACCEPTED)
+    
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[])
+    def import_bills(self, request):
+        """
+        Bulk import bills (with nested items) from an NDJSON or CSV upload
+        
+        Send the data either as a multipart ``file`` field or as the raw request
+        body. The format comes from ``?file_type=ndjson|csv``, else the file
+        extension or content type. ``?batch_size=`` overrides the insert batch.
+        """
+        # No parsers are declared, so DRF never buffers the body; multipart
+        # uploads are spooled to disk by Django and read back line by line
+        upload = None
+        content_type = request.content_type or ''
+        if content_type.startswith('multipart/form-data'):
+            upload = request._request.FILES.get('file')
+            if upload is None:
+                return Response({'error': 'file is required'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        file_type = request.query_params.get('file_type')
+        if not file_type:
+            name = (upload.name if upload else '').lower()
+            media_type = (upload.content_type if upload else content_type) or ''
+            if name.endswith('.csv') or 'csv' in media_type:
+                file_type = 'csv'
+            elif name.endswith(('.ndjson', '.jsonl')) or 'ndjson' in media_type or 'jsonl' in media_type:
+                file_type = 'ndjson'
+        if file_type not in ('csv', 'ndjson'):
+            return Response(
+                {'error': 'Unknown file type; pass file_type=ndjson or file_type=csv'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            batch_size = int(request.query_params.get('batch_size', 0)) or None
+        except ValueError:
+            return Response({'error': 'batch_size must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        lines = iter_text_lines(upload if upload is not None else request.stream or ())
+        records = iter_csv_records(lines) if file_type == 'csv' else iter_ndjson_records(lines)
+        importer = BillImporter(request.user, batch_size=batch_size)
+        try:
+            report = importer.run(records)
+        except UnicodeDecodeError:
+            # Batches already committed stay imported; report how far we got
+            return Response(
+                {'error': 'Upload must be UTF-8 encoded', **importer.report()},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response(report, status=status.HTTP_201_CREATED if report['created'] else status.HTTP_200_OK)
+    
+    @action(detail=False, methods=['get'],
+            renderer_classes=[*api_settings.DEFAULT_RENDERER_CLASSES, ExportRenderer])
+    def export(self, request):
+        """
+        Stream the filtered bills and their items as a CSV or NDJSON download
+        
+        Honors the list filters (status, start_date, end_date, search).
+        ``?file_type=csv|ndjson`` picks the format (CSV by default, in the bulk
+        import layout) and ``?compression=gzip`` compresses the stream.
+        """
+        file_type = request.query_params.get('file_type') or 'csv'
+        if file_type not in CONTENT_TYPES:
+            return Response({'error': 'file_type must be csv or ndjson'}, status=status.HTTP_400_BAD_REQUEST)
+        compression = request.query_params.get('compression') or None
+        if compression not in (None, 'gzip'):
+            return Response({'error': 'compression must be gzip'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        compress = compression == 'gzip'
+        response = StreamingHttpResponse(
+            export_stream(self.get_queryset(), file_type, compress=compress),
+            content_type='application/gzip' if compress else CONTENT_TYPES[file_type],
+        )
+        filename = f"bills.{file_type}{'.gz' if compress else ''}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+    
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """
         Get bill statistics
         """
-        queryset = self.get_queryset()
-        
-        total_bills = queryset.count()
-        total_amount = sum(bill.total_amount for bill in queryset)
-        total_tax = sum(bill.tax_amount for bill in queryset)
+        params = request.query_params
+        if any(params.get(name) for name in ('start_date', 'end_date', 'search')):
+            # Arbitrary filters: a single aggregate over the filtered bills
+            totals = self.get_queryset().order_by().aggregate(
+                total_bills=Count('id'),
+                total_amount=Sum('total_amount'),
+                total_tax=Sum('tax_amount'),
+            )
+            total_bills = totals['total_bills']
+            total_amount = totals['total_amount'] or 0
+            total_tax = totals['total_tax'] or 0
+        else:
+            # Unfiltered or status-only: read the precomputed totals rows
+            total_bills, total_amount, total_tax = get_totals(
+                request.user.pk, status=params.get('status') or None
+            )
         
         return Response({
             'total_bills': total_bills,
@@ -105,3 +304,95 @@ class BillViewSet(viewsets.ModelViewSet):
             'total_tax': float(total_tax),
             'average_amount': float(total_amount / total_bills) if total_bills > 0 else 0
         })
+
+
+class ExtractionJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Status of the user's OCR extraction jobs (filter with ``?bill=`` or ``?status=``)
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = ExtractionJobSerializer
+    
+    def get_queryset(self):
+        queryset = ExtractionJob.objects.filter(bill__user=self.request.user).order_by('-created_at')
+        bill_id = self.request.query_params.get('bill')
+        if bill_id:
+            queryset = queryset.filter(bill_id=bill_id)
+        status_filter = self.request.query_params.get('status')
+        if status_filter:
+            queryset = queryset.filter(status=status_filter)
+        return queryset
+
+
+class UploadSessionViewSet(mixins.CreateModelMixin,
+                           mixins.RetrieveModelMixin,
+                           mixins.DestroyModelMixin,
+                           viewsets.GenericViewSet):
+    """
+    Resumable, chunked bill image uploads
+    
+    POST a session (filename, total_size, optional sha256), PUT the bytes to
+    ``<id>/chunk/`` with a ``Content-Range`` header, GET the session to learn
+    the offset to resume from, then POST the bill fields to ``<id>/complete/``.
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = UploadSessionSerializer
+    
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.request.user)
+    
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        # Known image: skip the transfer and point straight at the existing bill
+        duplicate = find_duplicate(request.user, serializer.validated_data.get('sha256'))
+        if duplicate is not None:
+            serializer.save(user=request.user, status='complete', bill=duplicate)
+            return Response(serializer.data, status=status.HTTP_200_OK)
+        
+        serializer.save(user=request.user)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    
+    def perform_destroy(self, instance):
+        discard_partial(instance)
+        instance.delete()
+    
+    def upload_error(self, exc, session):
+        if exc.conflict:
+            session.refresh_from_db()
+            return Response(
+                {'error': exc.message, 'received': session.received, 'status': session.status},
+                status=status.HTTP_409_CONFLICT
+            )
+        return Response({'error': exc.message}, status=status.HTTP_400_BAD_REQUEST)
+    
+    @action(detail=True, methods=['put'], parser_classes=[])
+    def chunk(self, request, pk=None):
+        """
+        Append raw bytes to the upload, starting at the session's offset
+        """
+        session = self.get_object()
+        try:
+            start = parse_content_range(request.headers.get('Content-Range'), session)
+            session = append_chunk(session.pk, request.user, start, request.stream)
+        except UploadError as exc:
+            return self.upload_error(exc, session)
+        return Response(self.get_serializer(session).data)
+    
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        """
+        Create the bill from a fully uploaded image, or return its duplicate
+        """
+        session = self.get_object()
+        serializer = BillImportSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            bill, created = complete_upload(session, serializer)
+        except UploadError as exc:
+            return self.upload_error(exc, session)
+        return Response(
+            BillSerializer(bill, context=self.get_serializer_context()).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
@@ -0,0 +1,22 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['task', 'status', 'priority', 'attempts', 'max_attempts', 'run_at', 'locked_by', 'finished_at']
+    list_filter = ['status', 'task']
+    search_fields = ['task', 'dedupe_key', 'last_error']
+    readonly_fields = ['created_at', 'updated_at', 'finished_at']
+    actions = ['requeue']
+    
+    @admin.action(description='Requeue selected jobs')
+    def requeue(self, request, queryset):
+        now = timezone.now()
+        count = queryset.exclude(status='running').update(
+            status='queued', attempts=0, run_at=now, locked_by='', locked_until=None, finished_at=None,
+            updated_at=now
+        )
+        self.message_user(request, f'Requeued {count} jobs')
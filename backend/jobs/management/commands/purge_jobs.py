@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from jobs.models import Job
+
+
+class Command(BaseCommand):
+    help = 'Delete finished background jobs older than the given age'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7,
+                            help='Keep jobs finished within this many days')
+        parser.add_argument('--keep-failed', action='store_true',
+                            help='Do not delete failed jobs')
+    
+    def handle(self, *args, **options):
+        statuses = ['succeeded'] if options['keep_failed'] else ['succeeded', 'failed']
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        deleted, _ = Job.objects.filter(status__in=statuses, finished_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} jobs'))
@@ -0,0 +1,49 @@
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from jobs.registry import registered_tasks
+from jobs.worker import Worker
+
+
+class Command(BaseCommand):
+    help = 'Run background jobs from the database queue'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=settings.JOBS_WORKER_CONCURRENCY,
+                            help='Worker threads in this process (add processes to scale further)')
+        parser.add_argument('--task', action='append', dest='tasks', default=[],
+                            help='Only run jobs for this task (may be repeated)')
+        parser.add_argument('--batch-size', type=int, default=1,
+                            help='Jobs claimed per poll')
+        parser.add_argument('--interval', type=float, default=settings.JOBS_POLL_INTERVAL,
+                            help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--burst', action='store_true',
+                            help='Exit once the queue is empty')
+        parser.add_argument('--max-jobs', type=int, default=None,
+                            help='Exit after running this many jobs')
+    
+    def handle(self, *args, **options):
+        unknown = set(options['tasks']) - set(registered_tasks())
+        if unknown:
+            self.stderr.write(self.style.ERROR(f'Unknown tasks: {", ".join(sorted(unknown))}'))
+            return
+        
+        worker = Worker(
+            concurrency=options['concurrency'],
+            task_names=options['tasks'],
+            batch_size=options['batch_size'],
+            poll_interval=options['interval'],
+            burst=options['burst'],
+            max_jobs=options['max_jobs'],
+        )
+        # Finish the jobs in hand, then exit
+        signal.signal(signal.SIGINT, worker.stop)
+        signal.signal(signal.SIGTERM, worker.stop)
+        
+        self.stdout.write(f'Worker {worker.worker_id} running {worker.concurrency} threads')
+        worker.run()
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {worker.processed} jobs ({worker.failed} failed)'
+        ))
@@ -0,0 +1,152 @@
+"""
+Database-backed job queue.
+
+Jobs are claimed by flipping them to ``running`` with a lock token and a
+visibility deadline. On PostgreSQL the candidate rows are locked with
+``SELECT ... FOR UPDATE SKIP LOCKED`` so concurrent workers never wait on each
+other; elsewhere (SQLite) a single conditional ``UPDATE`` claims whatever is
+still available, which is safe because writers are serialized. A worker that
+dies leaves its jobs running until the deadline passes, after which another
+worker picks them up again.
+"""
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+from .registry import UnknownTask, get_task
+
+
+def enqueue(task_name, payload=None, priority=None, run_at=None, dedupe_key=''):
+    """
+    Queue a job for ``task_name``; returns the new (or coalesced) job
+    
+    With a ``dedupe_key``, a job that is already queued under the same key is
+    returned instead of adding another.
+    """
+    task = get_task(task_name)
+    if dedupe_key:
+        existing = Job.objects.filter(dedupe_key=dedupe_key, status='queued').first()
+        if existing is not None:
+            return existing
+    return Job.objects.create(
+        task=task_name,
+        payload=payload or {},
+        priority=task.priority if priority is None else priority,
+        run_at=run_at or timezone.now(),
+        dedupe_key=dedupe_key,
+        max_attempts=task.max_attempts,
+    )
+
+
+def available_jobs(now, task_names=None):
+    """
+    Jobs that may be claimed right now: due queued jobs and expired locks
+    """
+    jobs = Job.objects.filter(
+        Q(status='queued', run_at__lte=now) |
+        Q(status='running', locked_until__lt=now, attempts__lt=F('max_attempts'))
+    )
+    if task_names:
+        jobs = jobs.filter(task__in=task_names)
+    return jobs
+
+
+def expire_abandoned(now):
+    """
+    Fail running jobs whose lock expired after their last allowed attempt
+    """
+    return Job.objects.filter(
+        status='running', locked_until__lt=now, attempts__gte=F('max_attempts')
+    ).update(
+        status='failed', last_error='Visibility timeout expired', locked_by='', locked_until=None,
+        finished_at=now, updated_at=now
+    )
+
+
+def claim(worker_id, limit=1, task_names=None):
+    """
+    Claim up to ``limit`` jobs for ``worker_id`` and return them
+    """
+    now = timezone.now()
+    expire_abandoned(now)
+    token = f'{worker_id}:{uuid.uuid4().hex[:12]}'
+    available = available_jobs(now, task_names)
+    claim_values = {
+        'status': 'running',
+        'locked_by': token,
+        'locked_until': now + timedelta(seconds=settings.JOBS_VISIBILITY_TIMEOUT),
+        'attempts': F('attempts') + 1,
+        'updated_at': now,
+    }
+    
+    connection = connections[Job.objects.db]
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            job_ids = list(
+                available.select_for_update(skip_locked=True)
+                .order_by('-priority', 'run_at', 'id')
+                .values_list('id', flat=True)[:limit]
+            )
+            if job_ids:
+                Job.objects.filter(id__in=job_ids).update(**claim_values)
+    else:
+        job_ids = list(available.order_by('-priority', 'run_at', 'id').values_list('id', flat=True)[:limit])
+        if job_ids:
+            # Re-checks availability in the UPDATE itself, so two workers
+            # racing for the same rows cannot both win
+            available.filter(id__in=job_ids).update(**claim_values)
+    
+    if not job_ids:
+        return []
+    return list(Job.objects.filter(locked_by=token, status='running').order_by('-priority', 'run_at', 'id'))
+
+
+def _owned(job):
+    # Updates only apply while this worker still holds the job's lock
+    return Job.objects.filter(pk=job.pk, locked_by=job.locked_by, status='running')
+
+
+def complete(job):
+    now = timezone.now()
+    return _owned(job).update(
+        status='succeeded', last_error='', locked_by='', locked_until=None, finished_at=now, updated_at=now
+    )
+
+
+def fail(job, error):
+    """
+    Record a failed attempt: retry later with exponential backoff, or give up
+    """
+    now = timezone.now()
+    message = f'{type(error).__name__}: {error}'
+    if job.attempts < job.max_attempts and not isinstance(error, UnknownTask):
+        delay = settings.JOBS_RETRY_BACKOFF * 2 ** (job.attempts - 1)
+        return _owned(job).update(
+            status='queued', last_error=message, locked_by='', locked_until=None,
+            run_at=now + timedelta(seconds=delay), updated_at=now
+        )
+    return _owned(job).update(
+        status='failed', last_error=message, locked_by='', locked_until=None, finished_at=now, updated_at=now
+    )
+
+
+def run_job(job):
+    """
+    Run a claimed job and record the outcome; returns True on success
+    """
+    try:
+        task = get_task(job.task)
+        # Extend the lock to the task's own visibility timeout
+        job.locked_until = timezone.now() + timedelta(seconds=task.timeout)
+        _owned(job).update(locked_until=job.locked_until)
+        task(**job.payload)
+    except Exception as exc:
+        fail(job, exc)
+        return False
+    complete(job)
+    return True
@@ -0,0 +1,58 @@
+"""
+Registry of the tasks the job queue can run.
+
+Apps declare tasks in their ``tasks`` module with the ``task`` decorator; the
+jobs app imports every such module at startup. A job stores only the task
+name and a JSON payload, which is passed to the function as keyword arguments.
+"""
+from django.conf import settings
+
+_tasks = {}
+
+
+class UnknownTask(LookupError):
+    """
+    A job names a task that is not registered in this process
+    """
+
+
+class Task:
+    """
+    A registered task function with its queueing defaults
+    """
+    def __init__(self, name, func, priority=0, max_attempts=3, timeout=None):
+        self.name = name
+        self.func = func
+        self.priority = priority
+        self.max_attempts = max_attempts
+        self.timeout = timeout or settings.JOBS_VISIBILITY_TIMEOUT
+    
+    def __call__(self, **payload):
+        return self.func(**payload)
+    
+    def __repr__(self):
+        return f'<Task {self.name}>'
+
+
+def task(name, priority=0, max_attempts=3, timeout=None):
+    """
+    Register the decorated function as a background task called ``name``
+    
+    ``timeout`` is the visibility timeout in seconds: a job still running
+    after that long is assumed lost and becomes claimable again.
+    """
+    def decorator(func):
+        _tasks[name] = Task(name, func, priority=priority, max_attempts=max_attempts, timeout=timeout)
+        return func
+    return decorator
+
+
+def get_task(name):
+    try:
+        return _tasks[name]
+    except KeyError:
+        raise UnknownTask(f'No task registered as {name!r}')
+
+
+def registered_tasks():
+    return dict(_tasks)
@@ -0,0 +1,99 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from analytics.models import WeeklyAnalysis
+from bills.models import Bill
+from .models import Job
+from .queue import claim, complete, enqueue, run_job
+from .registry import task
+
+
+User = get_user_model()
+
+
+calls = []
+
+
+@task('tests.record', priority=5)
+def record(value, fail=False):
+    calls.append(value)
+    if fail:
+        raise RuntimeError('failed on purpose')
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+    
+    def expire_locks(self):
+        Job.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+    
+    def test_priority_and_dedupe(self):
+        low = enqueue('tests.record', {'value': 1}, priority=0)
+        default = enqueue('tests.record', {'value': 2})
+        deduped = enqueue('tests.record', {'value': 3}, dedupe_key='k')
+        self.assertEqual(enqueue('tests.record', {'value': 4}, dedupe_key='k').pk, deduped.pk)
+        
+        jobs = claim('worker-1', limit=10)
+        self.assertEqual([job.pk for job in jobs], [default.pk, deduped.pk, low.pk])
+        self.assertEqual(claim('worker-2', limit=10), [])
+        for job in jobs:
+            self.assertTrue(run_job(job))
+        self.assertEqual(calls, [2, 3, 1])
+        self.assertEqual(Job.objects.filter(status='succeeded').count(), 3)
+    
+    def test_failed_job_is_retried_later(self):
+        job = enqueue('tests.record', {'value': 1, 'fail': True})
+        [claimed] = claim('worker-1')
+        self.assertFalse(run_job(claimed))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'queued')
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertEqual(claim('worker-1'), [])
+    
+    def test_expired_lock_is_reclaimed(self):
+        job = enqueue('tests.record', {'value': 1})
+        Job.objects.filter(pk=job.pk).update(max_attempts=2)
+        [lost] = claim('worker-1')
+        self.expire_locks()
+        [reclaimed] = claim('worker-2')
+        self.assertEqual(reclaimed.attempts, 2)
+        # The lost worker's late completion is ignored
+        self.assertEqual(complete(lost), 0)
+        self.expire_locks()
+        self.assertEqual(claim('worker-3'), [])
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+    
+    def test_unknown_task_fails(self):
+        job = Job.objects.create(task='tests.missing')
+        [claimed] = claim('worker-1', task_names=['tests.missing'])
+        run_job(claimed)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+    
+    def test_bill_writes_queue_one_recompute(self):
+        user = User.objects.create_user(username='alice', password='test-password-123')
+        api = APIClient()
+        api.force_authenticate(user)
+        
+        def make_bill():
+            Bill.objects.create(user=user, total_amount=Decimal('10.00'), date=timezone.localdate(),
+                                image='bills/test.png')
+        
+        make_bill()
+        api.get('/api/analytics/weekly/')
+        for _ in range(2):
+            with self.captureOnCommitCallbacks(execute=True):
+                make_bill()
+        self.assertEqual(Job.objects.filter(task='analytics.recompute_dirty', status='queued').count(), 1)
+        self.assertTrue(WeeklyAnalysis.objects.get().is_dirty)
+        for job in claim('worker-1', limit=5):
+            run_job(job)
+        self.assertFalse(WeeklyAnalysis.objects.get().is_dirty)
+        self.assertEqual(Job.objects.get(task='analytics.recompute_dirty').status, 'succeeded')
@@ -0,0 +1,88 @@
+"""
+Threaded worker loop behind ``manage.py runworker``.
+"""
+import logging
+import os
+import socket
+import threading
+
+from django.db import close_old_connections, connections
+
+from .queue import claim, run_job
+
+logger = logging.getLogger(__name__)
+
+
+class Worker:
+    """
+    Poll the queue from ``concurrency`` threads until stopped
+    
+    Each thread claims ``batch_size`` jobs at a time and runs them in order.
+    With ``burst`` the worker exits once the queue is empty; ``max_jobs``
+    caps the jobs run before exiting.
+    """
+    def __init__(self, concurrency=1, task_names=None, batch_size=1, poll_interval=1.0,
+                 burst=False, max_jobs=None):
+        self.concurrency = max(concurrency, 1)
+        self.task_names = task_names or None
+        self.batch_size = max(batch_size, 1)
+        self.poll_interval = poll_interval
+        self.burst = burst
+        self.max_jobs = max_jobs
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        self.stop_event = threading.Event()
+        self.processed = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+    
+    def stop(self, *args):
+        self.stop_event.set()
+    
+    def run(self):
+        threads = [
+            threading.Thread(target=self._loop, name=f'jobs-worker-{index}', daemon=True)
+            for index in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            # Joined with a timeout so signal handlers still run in the main thread
+            while thread.is_alive():
+                thread.join(timeout=0.5)
+        return self.processed
+    
+    def _take_slot(self):
+        with self._lock:
+            if self.max_jobs is not None and self.processed >= self.max_jobs:
+                return False
+            return True
+    
+    def _record(self, succeeded):
+        with self._lock:
+            self.processed += 1
+            if not succeeded:
+                self.failed += 1
+            if self.max_jobs is not None and self.processed >= self.max_jobs:
+                self.stop_event.set()
+    
+    def _loop(self):
+        thread_id = f'{self.worker_id}:{threading.current_thread().name}'
+        try:
+            while not self.stop_event.is_set() and self._take_slot():
+                close_old_connections()
+                jobs = claim(thread_id, limit=self.batch_size, task_names=self.task_names)
+                if not jobs:
+                    if self.burst:
+                        break
+                    self.stop_event.wait(self.poll_interval)
+                    continue
+                for job in jobs:
+                    succeeded = run_job(job)
+                    if not succeeded:
+                        logger.warning('Job %s (%s) failed', job.pk, job.task)
+                    self._record(succeeded)
+        except Exception:
+            logger.exception('Worker thread %s crashed', thread_id)
+            raise
+        finally:
+            connections.close_all()
@@ -0,0 +1,42 @@
+from django.contrib import admin
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
+
+from .models import ProfileRecord
+
+
+@admin.register(ProfileRecord)
+class ProfileRecordAdmin(admin.ModelAdmin):
+    list_display = ['method', 'path', 'route', 'status_code', 'duration_ms', 'sample_count', 'trigger',
+                    'user', 'created_at', 'download_link']
+    list_filter = ['trigger', 'route', 'method', 'created_at']
+    search_fields = ['path', 'route', 'user__username']
+    readonly_fields = ['user', 'method', 'path', 'route', 'status_code', 'trigger', 'duration_ms',
+                       'interval_ms', 'sample_count', 'stacks', 'created_at', 'download_link']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def get_urls(self):
+        return [
+            path('<int:pk>/download/', self.admin_site.admin_view(self.download),
+                 name='monitoring_profilerecord_download'),
+            *super().get_urls(),
+        ]
+    
+    @admin.display(description='Stacks')
+    def download_link(self, obj):
+        if obj.pk is None:
+            return '-'
+        return format_html('<a href="{}">Download</a>',
+                           reverse('admin:monitoring_profilerecord_download', args=[obj.pk]))
+    
+    def download(self, request, pk):
+        if not self.has_view_permission(request):
+            return HttpResponse(status=403)
+        record = get_object_or_404(ProfileRecord, pk=pk)
+        response = HttpResponse(record.stacks, content_type='text/plain; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="profile-{record.pk}.collapsed"'
+        return response
@@ -0,0 +1,15 @@
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+
+class MonitoringConfig(AppConfig):
+    name = 'monitoring'
+    
+    def ready(self):
+        from .collectors import install_query_counter, job_queue_depth
+        from .instrumentation import install_query_recorder
+        from .metrics import REGISTRY
+        
+        connection_created.connect(install_query_counter, dispatch_uid='monitoring.query_counter')
+        connection_created.connect(install_query_recorder, dispatch_uid='monitoring.query_recorder')
+        REGISTRY.register_collector(job_queue_depth)
@@ -0,0 +1,83 @@
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.utils.module_loading import import_string
+
+from .collectors import CACHE_REQUESTS
+
+_missing = object()
+
+
+class InstrumentedCache(BaseCache):
+    """
+    Cache backend counting hits and misses in ``cache_requests_total``
+    
+    Everything is delegated to the backend named in the ``CACHE_BACKEND``
+    parameter (LocMem, Redis, Memcached, ...), built from the same location and
+    parameters, so the metrics don't depend on which one is configured.
+    ``get_or_set`` goes through ``get``, so it is counted too. The series is
+    labelled with the ``CACHE_NAME`` parameter (default: ``default``).
+    """
+    def __init__(self, location, params):
+        params = dict(params)
+        backend = import_string(params.pop('CACHE_BACKEND'))
+        name = params.pop('CACHE_NAME', 'default')
+        super().__init__(params)
+        self.cache = backend(location, params)
+        self.hits = CACHE_REQUESTS.labels(name, 'hit')
+        self.misses = CACHE_REQUESTS.labels(name, 'miss')
+    
+    def __getattr__(self, name):
+        # Backend-specific extras (the LocMem dict, the Redis client, ...)
+        if name == 'cache':
+            raise AttributeError(name)
+        return getattr(self.cache, name)
+    
+    def get(self, key, default=None, version=None):
+        value = self.cache.get(key, _missing, version)
+        if value is _missing:
+            self.misses.inc()
+            return default
+        self.hits.inc()
+        return value
+    
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        values = self.cache.get_many(keys, version)
+        self.hits.inc(len(values))
+        self.misses.inc(len(keys) - len(values))
+        return values
+    
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.cache.add(key, value, timeout, version)
+    
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.cache.set(key, value, timeout, version)
+    
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.cache.touch(key, timeout, version)
+    
+    def delete(self, key, version=None):
+        return self.cache.delete(key, version)
+    
+    def has_key(self, key, version=None):
+        return self.cache.has_key(key, version)
+    
+    def incr(self, key, delta=1, version=None):
+        return self.cache.incr(key, delta, version)
+    
+    def decr(self, key, delta=1, version=None):
+        return self.cache.decr(key, delta, version)
+    
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.cache.set_many(data, timeout, version)
+    
+    def delete_many(self, keys, version=None):
+        self.cache.delete_many(keys, version)
+    
+    def incr_version(self, key, delta=1, version=None):
+        return self.cache.incr_version(key, delta, version)
+    
+    def clear(self):
+        self.cache.clear()
+    
+    def close(self, **kwargs):
+        self.cache.close(**kwargs)
@@ -0,0 +1,77 @@
+"""
+The application's Prometheus metrics.
+
+Request counts and latencies are recorded per route (the URL pattern's view
+name, so ids in paths don't multiply the series) and method by
+``middleware.MetricsMiddleware``, which also counts the SQL statements each
+route runs through an execute wrapper installed on every new connection.
+Cache lookups are counted by ``cache.InstrumentedCache`` and the job
+queue depth is read from the database at scrape time.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models import Count
+
+from .metrics import REGISTRY
+
+HTTP_REQUESTS = REGISTRY.counter(
+    'http_requests_total', 'HTTP requests handled', ('route', 'method', 'status'),
+)
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    'http_request_duration_seconds', 'Time spent handling HTTP requests', ('route', 'method'),
+)
+DB_QUERIES = REGISTRY.counter(
+    'db_queries_total', 'SQL statements run while handling HTTP requests', ('route', 'method'),
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    'cache_requests_total', 'Cache lookups by result (hit or miss)', ('cache', 'result'),
+)
+JOBS = REGISTRY.gauge(
+    'jobs', 'Background jobs waiting or running, by task', ('task', 'status'),
+)
+
+# Statements run by the current request, as a one-element list so sync code
+# run from async views (in a copied context) adds to the same count
+_query_count = ContextVar('metrics_query_count', default=None)
+
+
+def count_queries(execute, sql, params, many, context):
+    counter = _query_count.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def install_query_counter(sender, connection, **kwargs):
+    """
+    ``connection_created`` receiver adding ``count_queries`` to the connection
+    """
+    if count_queries not in connection.execute_wrappers:
+        # First in the list, so the push/pop of temporary wrappers is unaffected
+        connection.execute_wrappers.insert(0, count_queries)
+
+
+@contextmanager
+def counting_queries():
+    """
+    Count the statements run in the block; yields a list holding the count
+    """
+    counter = [0]
+    token = _query_count.set(counter)
+    try:
+        yield counter
+    finally:
+        _query_count.reset(token)
+
+
+def job_queue_depth():
+    """
+    Collector reporting the queued and running jobs per task
+    """
+    from jobs.models import Job
+    
+    rows = (Job.objects.filter(status__in=('queued', 'running'))
+            .values_list('task', 'status').annotate(count=Count('id')).order_by())
+    for task, status, count in rows:
+        yield JOBS, (task, status), count
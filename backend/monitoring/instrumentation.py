@@ -0,0 +1,168 @@
+"""
+Per-request SQL and timing instrumentation.
+
+A ``RequestMetrics`` object is active for each instrumented request (through a
+context variable). An execute wrapper installed on every database connection
+adds every statement to it, also when the ORM runs in another thread than the
+request (sync code called from an async view or middleware runs in a copy of
+the request's context), and code can time sections of its own work with
+``span()``. Statements are also grouped by fingerprint (the SQL with literals
+and ``IN`` lists collapsed), so a query repeated once per row, the usual N+1,
+shows up as one fingerprint with a high count.
+"""
+import re
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.db import connections
+
+_current = ContextVar('request_metrics', default=None)
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+IN_LIST_RE = re.compile(r'\bIN\s*\((?:\s*\?\s*,?)+\)', re.IGNORECASE)
+SPACE_RE = re.compile(r'\s+')
+
+# Longest SQL text kept per statement in reports
+SQL_PREVIEW_LENGTH = 500
+
+
+def fingerprint(sql):
+    """
+    Reduce a statement to its shape: literals become ? and IN lists (...)
+    """
+    sql = STRING_RE.sub('?', sql)
+    sql = NUMBER_RE.sub('?', sql)
+    sql = IN_LIST_RE.sub('IN (...)', sql.replace('%s', '?'))
+    return SPACE_RE.sub(' ', sql).strip()
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper counting statements and the time spent in them
+    
+    Also keeps the ``slowest`` slowest statements and a count and total time
+    per fingerprint.
+    """
+    def __init__(self, slowest=5):
+        self.count = 0
+        self.duration = 0.0
+        self.slowest_limit = slowest
+        self.slowest = []
+        self.fingerprints = {}
+    
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.record(sql, time.perf_counter() - start, context['connection'].alias)
+    
+    def record(self, sql, duration, alias):
+        self.count += 1
+        self.duration += duration
+        if self.slowest_limit and (len(self.slowest) < self.slowest_limit or duration > self.slowest[-1][0]):
+            self.slowest.append((duration, alias, sql))
+            self.slowest.sort(key=lambda entry: -entry[0])
+            del self.slowest[self.slowest_limit:]
+        key = fingerprint(sql)
+        entry = self.fingerprints.setdefault(key, [0, 0.0])
+        entry[0] += 1
+        entry[1] += duration
+    
+    @contextmanager
+    def capture(self):
+        """
+        Record the statements run on every database connection of this thread
+        """
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+    
+    def repeated(self, threshold):
+        """
+        Fingerprints run at least ``threshold`` times, most frequent first
+        """
+        repeated = [
+            {'fingerprint': key[:SQL_PREVIEW_LENGTH], 'count': count, 'ms': round(duration * 1000, 2)}
+            for key, (count, duration) in self.fingerprints.items() if count >= threshold
+        ]
+        return sorted(repeated, key=lambda entry: (-entry['count'], -entry['ms']))
+    
+    def slowest_statements(self):
+        return [
+            {'sql': sql[:SQL_PREVIEW_LENGTH], 'db': alias, 'ms': round(duration * 1000, 2)}
+            for duration, alias, sql in self.slowest
+        ]
+
+
+class RequestMetrics:
+    """
+    Timings and database statements of one request
+    """
+    def __init__(self, slowest=5):
+        self.queries = QueryRecorder(slowest=slowest)
+        self.spans = {}
+        self.started = time.perf_counter()
+        self.view_started = None
+    
+    def add_span(self, name, duration):
+        self.spans[name] = self.spans.get(name, 0.0) + duration
+    
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+def current_metrics():
+    """
+    Return the metrics of the request being handled, if it is instrumented
+    """
+    return _current.get()
+
+
+def record_queries(execute, sql, params, many, context):
+    """
+    Execute wrapper adding the statement to the current request's metrics
+    """
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics.queries(execute, sql, params, many, context)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """
+    ``connection_created`` receiver adding ``record_queries`` to the connection
+    """
+    if record_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_queries)
+
+
+@contextmanager
+def collect(metrics):
+    """
+    Make ``metrics`` current, so the database statements run meanwhile are recorded
+    """
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def span(name):
+    """
+    Add the time spent in the block to the current request's ``name`` timing
+    """
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add_span(name, time.perf_counter() - start)
@@ -0,0 +1,458 @@
+"""
+In-process metrics registry exported in the Prometheus text format.
+
+Counters, gauges and fixed-bucket histograms are declared once at import time
+with their label names; ``metric.labels(*values)`` returns a child that is
+created on first use and cached under the tuple of label values, so the hot
+path allocates nothing beyond that tuple and takes one short per-child lock.
+
+By default values live in process memory. With ``METRICS_MULTIPROCESS_DIR``
+set, each process keeps its values in a memory-mapped file of its own in that
+directory, and a scrape served by any process sums the files of all of them
+(gauges only over processes that are still alive). Empty the directory when
+the server is restarted.
+"""
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_HEADER = struct.Struct('<I4x')
+_LENGTH = struct.Struct('<I')
+_VALUE = struct.Struct('<d')
+_INITIAL_FILE_SIZE = 1024 * 1024
+
+
+def multiprocess_dir():
+    return getattr(settings, 'METRICS_MULTIPROCESS_DIR', '') or ''
+
+
+class ValueFile:
+    """
+    Append-only memory-mapped file of ``key -> float`` entries
+    
+    Layout: an 8-byte header holding the used size, then entries of a 4-byte
+    key length, the UTF-8 key padded to 8 bytes and an 8-byte double. Values
+    are updated in place, so a reader sees each one whole.
+    
+    ``get`` and ``set`` don't take the lock, so when the file grows the new
+    mapping replaces ``mm`` before the new entry is published and the old one
+    is kept open: a thread still holding it keeps reading and writing the same
+    shared pages.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.offsets = {}
+        self.retired = []
+        exists = os.path.exists(path) and os.path.getsize(path) >= _HEADER.size
+        self.file = open(path, 'r+b' if exists else 'w+b')
+        if not exists:
+            self.file.truncate(_INITIAL_FILE_SIZE)
+        self.mm = mmap.mmap(self.file.fileno(), 0)
+        if not exists:
+            _HEADER.pack_into(self.mm, 0, _HEADER.size)
+        for key, _, offset in self.entries(self.mm):
+            self.offsets[key] = offset
+    
+    @staticmethod
+    def entries(data):
+        """
+        Yield ``(key, value, value_offset)`` for each entry in a file's bytes
+        """
+        used = _HEADER.unpack_from(data, 0)[0]
+        position = _HEADER.size
+        while position < used:
+            length = _LENGTH.unpack_from(data, position)[0]
+            key_end = position + _LENGTH.size + length
+            value_offset = key_end + (-key_end % 8)
+            key = bytes(data[position + _LENGTH.size:key_end]).decode()
+            yield key, _VALUE.unpack_from(data, value_offset)[0], value_offset
+            position = value_offset + _VALUE.size
+    
+    @classmethod
+    def read(cls, path):
+        with open(path, 'rb') as file:
+            data = file.read()
+        if len(data) < _HEADER.size:
+            return []
+        return [(key, value) for key, value, _ in cls.entries(data)]
+    
+    def offset(self, key):
+        offset = self.offsets.get(key)
+        if offset is None:
+            with self.lock:
+                offset = self.offsets.get(key)
+                if offset is None:
+                    offset = self.offsets[key] = self._append(key)
+        return offset
+    
+    def _append(self, key):
+        encoded = key.encode()
+        used = _HEADER.unpack_from(self.mm, 0)[0]
+        key_end = used + _LENGTH.size + len(encoded)
+        value_offset = key_end + (-key_end % 8)
+        end = value_offset + _VALUE.size
+        if end > len(self.mm):
+            size = len(self.mm)
+            while size < end:
+                size *= 2
+            self.file.truncate(size)
+            self.retired.append(self.mm)
+            self.mm = mmap.mmap(self.file.fileno(), 0)
+        _LENGTH.pack_into(self.mm, used, len(encoded))
+        self.mm[used + _LENGTH.size:key_end] = encoded
+        _VALUE.pack_into(self.mm, value_offset, 0.0)
+        # Publish the entry only once it is complete
+        _HEADER.pack_into(self.mm, 0, end)
+        return value_offset
+    
+    def get(self, offset):
+        return _VALUE.unpack_from(self.mm, offset)[0]
+    
+    def set(self, offset, value):
+        _VALUE.pack_into(self.mm, offset, value)
+
+
+_files = {}
+_files_lock = threading.Lock()
+
+
+def process_file(kind):
+    """
+    Return this process's value file for ``kind`` (counter, gauge or histogram)
+    """
+    key = (os.getpid(), kind)
+    value_file = _files.get(key)
+    if value_file is None:
+        with _files_lock:
+            value_file = _files.get(key)
+            if value_file is None:
+                path = os.path.join(multiprocess_dir(), f'{kind}_{os.getpid()}.db')
+                value_file = _files[key] = ValueFile(path)
+    return value_file
+
+
+class LocalValue:
+    """
+    A float in process memory
+    """
+    def __init__(self, kind, key):
+        self.value = 0.0
+    
+    def get(self):
+        return self.value
+    
+    def add(self, amount):
+        self.value += amount
+    
+    def set(self, value):
+        self.value = value
+
+
+class FileValue:
+    """
+    A float in this process's value file (re-resolved after a fork)
+    """
+    def __init__(self, kind, key):
+        self.kind = kind
+        self.key = key
+        self.pid = None
+    
+    def _slot(self):
+        if self.pid != os.getpid():
+            self.file = process_file(self.kind)
+            self.offset = self.file.offset(self.key)
+            self.pid = os.getpid()
+        return self.file, self.offset
+    
+    def get(self):
+        value_file, offset = self._slot()
+        return value_file.get(offset)
+    
+    def add(self, amount):
+        value_file, offset = self._slot()
+        value_file.set(offset, value_file.get(offset) + amount)
+    
+    def set(self, value):
+        value_file, offset = self._slot()
+        value_file.set(offset, value)
+
+
+def value_class():
+    return FileValue if multiprocess_dir() else LocalValue
+
+
+def sample_key(name, label_values):
+    return json.dumps([name, list(label_values)])
+
+
+class Metric:
+    """
+    A named metric family with fixed label names
+    """
+    kind = None
+    
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+    
+    def labels(self, *values):
+        """
+        Return the child for these label values (positional, in label order)
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f'{self.name} expects labels {self.labelnames}')
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self.new_child(tuple(str(value) for value in values))
+        return child
+    
+    def new_child(self, label_values):
+        raise NotImplementedError
+    
+    def samples(self):
+        """
+        Yield ``(sample_name, label_values, value)`` from this process's children
+        """
+        for child in list(self._children.values()):
+            yield from child.samples()
+
+
+class _ScalarChild:
+    def __init__(self, metric, label_values):
+        self.metric = metric
+        self.label_values = label_values
+        self.lock = threading.Lock()
+        self.value = value_class()(metric.kind, sample_key(metric.name, label_values))
+    
+    def get(self):
+        return self.value.get()
+    
+    def samples(self):
+        yield self.metric.name, self.label_values, self.value.get()
+
+
+class CounterChild(_ScalarChild):
+    def inc(self, amount=1):
+        if amount < 0:
+            raise ValueError('Counters can only increase')
+        with self.lock:
+            self.value.add(amount)
+
+
+class GaugeChild(_ScalarChild):
+    def inc(self, amount=1):
+        with self.lock:
+            self.value.add(amount)
+    
+    def dec(self, amount=1):
+        self.inc(-amount)
+    
+    def set(self, value):
+        with self.lock:
+            self.value.set(value)
+
+
+class HistogramChild:
+    def __init__(self, metric, label_values):
+        self.metric = metric
+        self.label_values = label_values
+        self.lock = threading.Lock()
+        value = value_class()
+        self.bucket_values = [
+            value('histogram', sample_key(f'{metric.name}_bucket', label_values + (_format_bound(bound),)))
+            for bound in metric.buckets
+        ]
+        self.sum = value('histogram', sample_key(f'{metric.name}_sum', label_values))
+    
+    def observe(self, amount):
+        index = bisect_left(self.metric.buckets, amount)
+        with self.lock:
+            self.bucket_values[index].add(1)
+            self.sum.add(amount)
+    
+    def samples(self):
+        # Buckets are stored per bucket and reported cumulatively on export
+        name = self.metric.name
+        for bound, value in zip(self.metric.buckets, self.bucket_values):
+            yield f'{name}_bucket', self.label_values + (_format_bound(bound),), value.get()
+        yield f'{name}_sum', self.label_values, self.sum.get()
+
+
+class Counter(Metric):
+    kind = 'counter'
+    
+    def new_child(self, label_values):
+        return CounterChild(self, label_values)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+    
+    def new_child(self, label_values):
+        return GaugeChild(self, label_values)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+    
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(float(bound) for bound in buckets)) + (math.inf,)
+    
+    def new_child(self, label_values):
+        return HistogramChild(self, label_values)
+
+
+def _format_bound(bound):
+    return '+Inf' if bound == math.inf else repr(float(bound))
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if value == int(value):
+        return f'{int(value)}'
+    return repr(value)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _multiprocess_samples(directory):
+    """
+    Sum the samples of every process's value files by sample name and labels
+    """
+    totals = defaultdict(float)
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.db'):
+            continue
+        kind, _, pid = filename[:-3].partition('_')
+        if kind == 'gauge' and not (pid.isdigit() and _pid_alive(int(pid))):
+            continue
+        for key, value in ValueFile.read(os.path.join(directory, filename)):
+            name, label_values = json.loads(key)
+            totals[name, tuple(label_values)] += value
+    return totals
+
+
+class Registry:
+    """
+    The metric families of this process and the collectors run at scrape time
+    """
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+        self._lock = threading.Lock()
+    
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self.metrics:
+                raise ValueError(f'Metric {metric.name} is already registered')
+            self.metrics[metric.name] = metric
+        return metric
+    
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+    
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+    
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+    
+    def register_collector(self, collector):
+        """
+        Add a callable run on every scrape; it yields ``(metric, label_values, value)``
+        for gauges whose value is read at scrape time (never stored)
+        """
+        self.collectors.append(collector)
+        return collector
+    
+    def _samples(self):
+        directory = multiprocess_dir()
+        if directory:
+            totals = _multiprocess_samples(directory)
+        else:
+            totals = defaultdict(float)
+            for metric in self.metrics.values():
+                for name, label_values, value in metric.samples():
+                    totals[name, label_values] += value
+        return totals
+    
+    def render(self):
+        """
+        Return every metric in the Prometheus text exposition format
+        """
+        totals = self._samples()
+        collected = defaultdict(list)
+        for collector in self.collectors:
+            for metric, label_values, value in collector():
+                collected[metric.name].append((label_values, value))
+        
+        by_family = defaultdict(list)
+        for (name, label_values), value in totals.items():
+            by_family[name].append((label_values, value))
+        
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f'# HELP {metric.name} {_escape(metric.documentation)}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            if metric.kind == 'histogram':
+                lines.extend(self._histogram_lines(metric, by_family))
+                continue
+            samples = by_family.get(metric.name, []) + collected.get(metric.name, [])
+            for label_values, value in sorted(samples):
+                lines.append(self._line(metric.name, metric.labelnames, label_values, value))
+        return '\n'.join(lines) + '\n'
+    
+    def _histogram_lines(self, metric, by_family):
+        buckets = defaultdict(dict)
+        for label_values, value in by_family.get(f'{metric.name}_bucket', []):
+            buckets[label_values[:-1]][label_values[-1]] = value
+        sums = dict(by_family.get(f'{metric.name}_sum', []))
+        labelnames = metric.labelnames + ('le',)
+        for label_values in sorted(buckets):
+            cumulative = 0.0
+            for bound in metric.buckets:
+                cumulative += buckets[label_values].get(_format_bound(bound), 0.0)
+                yield self._line(f'{metric.name}_bucket', labelnames,
+                                 label_values + (_format_bound(bound),), cumulative)
+            yield self._line(f'{metric.name}_sum', metric.labelnames, label_values, sums.get(label_values, 0.0))
+            yield self._line(f'{metric.name}_count', metric.labelnames, label_values, cumulative)
+    
+    @staticmethod
+    def _line(name, labelnames, label_values, value):
+        if labelnames:
+            labels = ','.join(f'{label}="{_escape(str(value))}"' for label, value in zip(labelnames, label_values))
+            name = f'{name}{{{labels}}}'
+        return f'{name} {_format_value(value)}'
+
+
+REGISTRY = Registry()
@@ -0,0 +1,309 @@
+"""
+Request instrumentation middleware.
+
+With ``REQUEST_METRICS_ENABLED`` every request records its SQL statements
+and its timings: authentication (see ``authentication``), the view, response
+rendering (serialization of the payload) and the total. The timings go out
+in a ``Server-Timing`` header, which browser devtools show next to the
+request. Requests that cross the slow-request thresholds, or repeat a
+statement often enough to suggest an N+1, are logged as JSON on the
+``monitoring.requests`` logger together with their slowest statements and
+repeated fingerprints.
+
+``MetricsMiddleware`` (on unless ``METRICS_ENABLED`` is off) feeds the
+per-route request, latency and query counters of ``collectors``, and
+``ProfilingMiddleware`` (``PROFILING_ENABLED``) samples the stacks of a share
+of requests, or of staff requests asking for it, into ``ProfileRecord`` rows.
+
+Like Django's own middleware they run in the server's mode: under ASGI they
+become coroutine functions and await the rest of the chain, so a request
+isn't moved to a thread just to pass through them.
+"""
+import json
+import logging
+import random
+import sys
+import threading
+import time
+
+from asgiref.sync import SyncToAsync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .collectors import DB_QUERIES, HTTP_REQUEST_DURATION, HTTP_REQUESTS, counting_queries
+from .instrumentation import RequestMetrics, collect, current_metrics
+from .profiling import StackSampler
+
+logger = logging.getLogger('monitoring.requests')
+
+# Server-Timing entries in display order, with their descriptions
+TIMINGS = (
+    ('auth', 'Authentication'),
+    ('view', 'View'),
+    ('render', 'Rendering'),
+)
+
+
+def server_timing(metrics, total):
+    """
+    Format request metrics as a Server-Timing header value
+    """
+    entries = [
+        f'db;dur={metrics.queries.duration * 1000:.1f};desc="{metrics.queries.count} queries"',
+    ]
+    for name, description in TIMINGS:
+        if name in metrics.spans:
+            entries.append(f'{name};dur={metrics.spans[name] * 1000:.1f};desc="{description}"')
+    entries.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(entries)
+
+
+def slow_request_record(request, response, metrics, total):
+    """
+    Build the structured slow-request log entry, or None if the request was fine
+    """
+    repeated = metrics.queries.repeated(settings.REPEATED_QUERY_THRESHOLD)
+    total_ms = total * 1000
+    if (total_ms < settings.SLOW_REQUEST_MS and metrics.queries.count < settings.SLOW_REQUEST_QUERIES
+            and not repeated):
+        return None
+    user = getattr(request, 'user', None)
+    return {
+        'method': request.method,
+        'path': request.get_full_path(),
+        'status': response.status_code,
+        'user_id': user.pk if user is not None and user.is_authenticated else None,
+        'total_ms': round(total_ms, 2),
+        'db_ms': round(metrics.queries.duration * 1000, 2),
+        'queries': metrics.queries.count,
+        'timings_ms': {name: round(duration * 1000, 2) for name, duration in metrics.spans.items()},
+        'slowest_queries': metrics.queries.slowest_statements(),
+        'repeated_queries': repeated,
+    }
+
+
+class HybridMiddleware:
+    """
+    Middleware running sync under WSGI and async under ASGI
+    
+    As with Django's ``MiddlewareMixin``, an instance whose ``get_response`` is
+    a coroutine function is marked as one too, and ``__call__`` then returns
+    ``__acall__(request)``.
+    """
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+
+class RequestMetricsMiddleware(HybridMiddleware):
+    """
+    Measure each request's database work and timings
+    """
+    def __init__(self, get_response):
+        if not settings.REQUEST_METRICS_ENABLED:
+            raise MiddlewareNotUsed()
+        super().__init__(get_response)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics(slowest=settings.SLOW_REQUEST_TOP_QUERIES)
+        with collect(metrics):
+            response = self.get_response(request)
+        return self.finish(request, response, metrics)
+    
+    async def __acall__(self, request):
+        metrics = RequestMetrics(slowest=settings.SLOW_REQUEST_TOP_QUERIES)
+        with collect(metrics):
+            response = await self.get_response(request)
+        return self.finish(request, response, metrics)
+    
+    def finish(self, request, response, metrics):
+        total = metrics.elapsed()
+        # Views without a separate render step end when their response is returned
+        if metrics.view_started is not None and 'view' not in metrics.spans:
+            metrics.add_span('view', time.perf_counter() - metrics.view_started)
+        
+        if settings.REQUEST_METRICS_SERVER_TIMING:
+            response['Server-Timing'] = server_timing(metrics, total)
+        record = slow_request_record(request, response, metrics, total)
+        if record is not None:
+            logger.warning('Slow request %s', json.dumps(record), extra={'request_metrics': record})
+        return response
+    
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        current_metrics().view_started = time.perf_counter()
+    
+    def process_template_response(self, request, response):
+        # Runs between the view returning and the response being rendered
+        metrics = current_metrics()
+        now = time.perf_counter()
+        if metrics.view_started is not None:
+            metrics.add_span('view', now - metrics.view_started)
+        response.add_post_render_callback(
+            lambda rendered: metrics.add_span('render', time.perf_counter() - now)
+        )
+        return response
+
+
+# Any other method is counted as 'other', so junk methods can't add series
+METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'))
+
+
+def route_name(request):
+    """
+    The metrics label of a request's route: its URL pattern's view name
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route or 'unnamed'
+
+
+class MetricsMiddleware(HybridMiddleware):
+    """
+    Count requests, their latency and their SQL statements per route and method
+    """
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed()
+        super().__init__(get_response)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        with counting_queries() as queries:
+            response = self.get_response(request)
+        return self.observe(request, response, start, queries[0])
+    
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        with counting_queries() as queries:
+            response = await self.get_response(request)
+        return self.observe(request, response, start, queries[0])
+    
+    def observe(self, request, response, start, queries):
+        route = route_name(request)
+        method = request.method if request.method in METHODS else 'other'
+        HTTP_REQUEST_DURATION.labels(route, method).observe(time.perf_counter() - start)
+        HTTP_REQUESTS.labels(route, method, str(response.status_code)).inc()
+        if queries:
+            DB_QUERIES.labels(route, method).inc(queries)
+        return response
+
+
+class ProfilingMiddleware(HybridMiddleware):
+    """
+    Profile ``PROFILING_SAMPLE_RATE`` of requests, and staff requests sending
+    the ``PROFILING_HEADER`` header, with a stack sampler
+    
+    A request sending the header is authenticated (by its session, or by the
+    API's authentication classes) before anything is sampled, and profiled
+    for staff only, so other clients can't make the server sample their
+    requests. Kept profiles are saved as ``ProfileRecord`` rows (the newest
+    ``PROFILING_KEEP``) and their id is returned in ``X-Profile-Id``.
+    
+    Under ASGI the request's sync work (authentication, sync views and the
+    ORM) runs in the worker thread of its ``sync_to_async`` calls, so that
+    thread is sampled, while it runs such a call.
+    """
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed()
+        super().__init__(get_response)
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+        self.header = settings.PROFILING_HEADER
+        self.interval = settings.PROFILING_INTERVAL_MS / 1000
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        staff = self.requested_by(request) if self.requested(request) else None
+        trigger = self.trigger(staff)
+        if trigger is None:
+            return self.get_response(request)
+        with StackSampler(sys._getframe(), self.interval) as sampler:
+            response = self.get_response(request)
+        return self.keep(request, response, sampler, trigger)
+    
+    async def __acall__(self, request):
+        staff = await sync_to_async(self.requested_by)(request) if self.requested(request) else None
+        trigger = self.trigger(staff)
+        if trigger is None:
+            return await self.get_response(request)
+        # Thread-sensitive calls of one request all run in the same thread
+        thread_id = await sync_to_async(threading.get_ident)()
+        root = SyncToAsync.thread_handler.__code__
+        with StackSampler(root, self.interval, thread_id=thread_id) as sampler:
+            response = await self.get_response(request)
+        return await sync_to_async(self.keep)(request, response, sampler, trigger)
+    
+    def requested(self, request):
+        return bool(self.header) and self.header in request.headers
+    
+    def requested_by(self, request):
+        """
+        The staff user behind a request sending the header, or None
+        """
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            api_request = Request(request, authenticators=[
+                authentication() for authentication in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+            ])
+            try:
+                user = api_request.user
+            except APIException:
+                return None
+        return user if user.is_staff else None
+    
+    def trigger(self, staff):
+        """
+        Why the request is profiled ('header' or 'sample'), or None
+        """
+        if staff is not None:
+            return 'header'
+        if self.sample_rate and random.random() < self.sample_rate:
+            return 'sample'
+        return None
+    
+    def keep(self, request, response, sampler, trigger):
+        """
+        Save the profile and point the response at it
+        """
+        user = getattr(request, 'user', None)
+        try:
+            record = self.save(request, response, sampler, trigger, user)
+        except Exception:
+            logger.exception('Could not save the profile of %s %s', request.method, request.path)
+        else:
+            response['X-Profile-Id'] = str(record.pk)
+        return response
+    
+    def save(self, request, response, sampler, trigger, user):
+        from .models import ProfileRecord
+        
+        record = ProfileRecord.objects.create(
+            user=user if user is not None and user.is_authenticated else None,
+            method=request.method[:10],
+            path=request.get_full_path()[:500],
+            route=route_name(request)[:200],
+            status_code=response.status_code,
+            trigger=trigger,
+            duration_ms=round(sampler.duration * 1000, 2),
+            interval_ms=self.interval * 1000,
+            sample_count=sampler.samples,
+            stacks=sampler.collapsed(),
+        )
+        cutoff = (ProfileRecord.objects.order_by('-created_at', '-pk')
+                  .values_list('created_at', flat=True)[settings.PROFILING_KEEP:][:1].first())
+        if cutoff is not None:
+            ProfileRecord.objects.filter(created_at__lte=cutoff).delete()
+        return record
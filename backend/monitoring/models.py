@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.db import models
+
+
+class ProfileRecord(models.Model):
+    """
+    The sampled stacks of one profiled request (see ``profiling``)
+    """
+    TRIGGER_CHOICES = [
+        ('sample', 'Sampled'),
+        ('header', 'Requested'),
+    ]
+    
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                             related_name='profile_records')
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    route = models.CharField(max_length=200, blank=True)
+    status_code = models.IntegerField()
+    trigger = models.CharField(max_length=10, choices=TRIGGER_CHOICES)
+    
+    duration_ms = models.FloatField()
+    interval_ms = models.FloatField()
+    sample_count = models.IntegerField()
+    
+    # Collapsed stacks: "outer;inner;leaf count" per line
+    stacks = models.TextField(blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['route', '-created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.method} {self.path} - {self.duration_ms:.0f} ms"
@@ -0,0 +1,83 @@
+"""
+Sampling profiler for live requests.
+
+While a request is profiled, a background thread wakes every ``interval``
+seconds, reads the request thread's current stack from
+``sys._current_frames()`` and counts it in the collapsed-stack format
+(``outer;inner;leaf count`` per line) that flame graph tools such as
+``flamegraph.pl`` and speedscope read. Only the request's thread is sampled and
+nothing is traced, so the view runs at full speed between samples and a
+request that is not profiled pays nothing.
+"""
+import sys
+import threading
+import time
+from collections import Counter
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}:{code.co_qualname}"
+
+
+class StackSampler:
+    """
+    Sample the stacks of a thread (by default the calling one) below ``root``
+    
+    ``root`` is a frame, or a code object standing for any frame running it.
+    Samples taken while the thread is not below the root (such as a worker
+    thread waiting for work) are left out.
+    """
+    def __init__(self, root, interval=0.005, thread_id=None):
+        self.root = root
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.stacks = Counter()
+        self.samples = 0
+        self.duration = 0.0
+        self._names = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+    
+    def __enter__(self):
+        self._started = time.perf_counter()
+        self._thread.start()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self._started
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.sample(frame)
+    
+    def sample(self, frame):
+        names = []
+        root = self.root
+        while frame is not root and frame.f_code is not root:
+            if frame.f_globals is globals():
+                # The request thread is already stopping the sampler
+                return
+            code = frame.f_code
+            # Code objects outlive the sample, so their names are built once
+            name = self._names.get(code)
+            if name is None:
+                name = self._names[code] = frame_name(frame)
+            names.append(name)
+            frame = frame.f_back
+            if frame is None:
+                return
+        if names:
+            names.reverse()
+            self.stacks[';'.join(names)] += 1
+            self.samples += 1
+    
+    def collapsed(self):
+        """
+        The samples in collapsed-stack format, most frequent stack first
+        """
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
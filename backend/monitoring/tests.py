@@ -0,0 +1,311 @@
+import os
+import shutil
+import tempfile
+import time
+from datetime import date
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import path
+from rest_framework.response import Response
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from bills.models import Bill, BillItem
+from jobs.models import Job
+from .cache import InstrumentedCache
+from .collectors import CACHE_REQUESTS
+from .instrumentation import fingerprint
+from .metrics import _VALUE, Registry, ValueFile
+from .models import ProfileRecord
+
+
+User = get_user_model()
+
+
+def make_user(username='alice', **kwargs):
+    return User.objects.create_user(username=username, password='test-password-123', **kwargs)
+
+
+def jwt_client_for(user):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+    return client
+
+
+def make_bill(user, items=()):
+    bill = Bill.objects.create(user=user, total_amount=Decimal('10.00'), date=date(2026, 10, 12),
+                               vendor_name='D-Mart', image='bills/test.png')
+    for name in items:
+        BillItem.objects.create(bill=bill, name=name, unit_price=Decimal('1.00'), total_price=Decimal('1.00'))
+    return bill
+
+
+def bills_with_item_counts(request):
+    # One item query per bill: the N+1 the slow-request log should flag
+    return JsonResponse({'items': [len(bill.items.all()) for bill in Bill.objects.all()]})
+
+
+urlpatterns = [
+    path('n-plus-one/', bills_with_item_counts),
+]
+
+
+@override_settings(REQUEST_METRICS_ENABLED=True, SLOW_REQUEST_MS=100000, REPEATED_QUERY_THRESHOLD=5)
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.api = jwt_client_for(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(6):
+                make_bill(self.user, items=['a'])
+    
+    def test_server_timing(self):
+        timing = self.api.get('/api/bills/')['Server-Timing']
+        for entry in ('db;dur=', 'auth;dur=', 'view;dur=', 'render;dur=', 'total;dur='):
+            self.assertIn(entry, timing)
+    
+    def test_slow_request_log(self):
+        with self.assertNoLogs('monitoring.requests'):
+            self.api.get('/api/bills/')
+        with self.assertLogs('monitoring.requests', 'WARNING') as logs:
+            with override_settings(SLOW_REQUEST_QUERIES=1):
+                self.api.get('/api/bills/')
+        record = logs.records[0].request_metrics
+        self.assertEqual(record['user_id'], self.user.pk)
+        self.assertEqual(record['path'], '/api/bills/')
+        self.assertTrue(record['slowest_queries'])
+    
+    @override_settings(ROOT_URLCONF=__name__)
+    def test_repeated_queries_are_logged(self):
+        with self.assertLogs('monitoring.requests', 'WARNING') as logs:
+            self.api.get('/n-plus-one/')
+        repeated = logs.records[0].request_metrics['repeated_queries']
+        self.assertEqual(repeated[0]['count'], 6)
+    
+    async def test_async_requests(self):
+        # Under ASGI the view's queries run in a worker thread
+        headers = {'Authorization': self.api._credentials['HTTP_AUTHORIZATION']}
+        response = await self.async_client.get('/api/bills/', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        timing = response['Server-Timing']
+        self.assertNotIn('desc="0 queries"', timing)
+        for entry in ('auth;dur=', 'view;dur=', 'render;dur='):
+            self.assertIn(entry, timing)
+
+
+class FingerprintTests(SimpleTestCase):
+    def test_literals_and_in_lists_are_collapsed(self):
+        self.assertEqual(fingerprint("SELECT a FROM t WHERE id IN (%s, %s) AND b = 'x' LIMIT 21"),
+                         'SELECT a FROM t WHERE id IN (...) AND b = ? LIMIT ?')
+
+
+class RegistryTests(SimpleTestCase):
+    def test_render(self):
+        registry = Registry()
+        counter = registry.counter('requests_total', 'Requests', ('path',))
+        gauge = registry.gauge('depth', 'Depth')
+        histogram = registry.histogram('latency_seconds', 'Latency', ('route',), buckets=(0.1, 1))
+        counter.labels('a"\n').inc()
+        counter.labels('a"\n').inc(2)
+        gauge.labels().set(3.5)
+        for amount in (0.05, 0.5, 5):
+            histogram.labels('r').observe(amount)
+        
+        output = registry.render()
+        self.assertIn('# TYPE requests_total counter', output)
+        self.assertIn('requests_total{path="a\\"\\n"} 3', output)
+        self.assertIn('depth 3.5', output)
+        # Buckets are cumulative
+        self.assertIn('latency_seconds_bucket{route="r",le="0.1"} 1', output)
+        self.assertIn('latency_seconds_bucket{route="r",le="1.0"} 2', output)
+        self.assertIn('latency_seconds_bucket{route="r",le="+Inf"} 3', output)
+        self.assertIn('latency_seconds_count{route="r"} 3', output)
+        self.assertIn('latency_seconds_sum{route="r"} 5.55', output)
+    
+    def test_counters_only_increase(self):
+        counter = Registry().counter('requests_total', 'Requests')
+        with self.assertRaises(ValueError):
+            counter.labels().inc(-1)
+    
+    def test_growing_keeps_the_old_mapping_usable(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        values = ValueFile(os.path.join(directory, 'values.db'))
+        offset = values.offset('a')
+        mapping = values.mm
+        number = 0
+        while values.mm is mapping:
+            values.offset(f'{number:0>200}')
+            number += 1
+        # A thread still using the old mapping writes to the same file
+        _VALUE.pack_into(mapping, offset, 2.5)
+        self.assertEqual(values.get(offset), 2.5)
+        values.set(offset, 4.0)
+        self.assertEqual(_VALUE.unpack_from(mapping, offset)[0], 4.0)
+    
+    def test_multiprocess_files_are_summed(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        with self.settings(METRICS_MULTIPROCESS_DIR=directory):
+            registry = Registry()
+            counter = registry.counter('requests_total', 'Requests', ('path',))
+            histogram = registry.histogram('latency_seconds', 'Latency', buckets=(1,))
+            gauge = registry.gauge('depth', 'Depth')
+            counter.labels('a').inc(2)
+            histogram.labels().observe(0.5)
+            gauge.labels().set(7)
+            # Enough series to grow the file past its first mapping
+            for number in range(3000):
+                counter.labels(f'path-{number}').inc()
+            
+            pid = os.fork()
+            if pid == 0:
+                counter.labels('a').inc(5)
+                histogram.labels().observe(3)
+                gauge.labels().set(1)
+                os._exit(0)
+            os.waitpid(pid, 0)
+            
+            output = registry.render()
+        self.assertIn('requests_total{path="a"} 7', output)
+        self.assertIn('requests_total{path="path-2999"} 1', output)
+        self.assertIn('latency_seconds_count 2', output)
+        # The exited process's gauge no longer counts
+        self.assertIn('depth 7', output)
+
+
+class MetricsEndpointTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.api = jwt_client_for(self.user)
+        make_bill(self.user)
+        Job.objects.create(task='bills.extract')
+        Job.objects.create(task='bills.extract')
+    
+    def test_staff_only(self):
+        self.assertEqual(self.api.get('/api/metrics/').status_code, 403)
+        self.assertEqual(APIClient().get('/api/metrics/').status_code, 401)
+    
+    def test_metrics(self):
+        self.api.get('/api/bills/')
+        self.api.get('/api/bills/')
+        self.api.get('/not-a-route/')
+        cache.get('missing-key')
+        self.user.is_staff = True
+        self.user.save()
+        
+        response = self.api.get('/api/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        output = response.content.decode()
+        self.assertIn('http_requests_total{route="bill-list",method="GET",status="200"}', output)
+        self.assertIn('http_requests_total{route="unmatched",method="GET",status="404"} 1', output)
+        self.assertIn('http_request_duration_seconds_bucket{route="bill-list",method="GET",le="+Inf"}', output)
+        self.assertIn('db_queries_total{route="bill-list",method="GET"}', output)
+        self.assertIn('cache_requests_total{cache="default",result="miss"}', output)
+        self.assertIn('jobs{task="bills.extract",status="queued"} 2', output)
+
+
+class InstrumentedCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = InstrumentedCache('instrumented-tests', {
+            'CACHE_BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'CACHE_NAME': 'tests',
+        })
+        self.hits = CACHE_REQUESTS.labels('tests', 'hit')
+        self.misses = CACHE_REQUESTS.labels('tests', 'miss')
+    
+    def counts(self):
+        return self.hits.get(), self.misses.get()
+    
+    def test_counts_hits_and_misses(self):
+        before = self.counts()
+        self.cache.set('a', 1)
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c']), {'a': 1})
+        self.assertEqual(self.cache.get_or_set('d', 4), 4)
+        hits, misses = self.counts()
+        self.assertEqual((hits - before[0], misses - before[1]), (3, 4))
+    
+    def test_delegates_writes(self):
+        self.assertTrue(self.cache.add('n', 1))
+        self.assertEqual(self.cache.incr('n'), 2)
+        self.cache.set_many({'x': 1, 'y': 2})
+        self.cache.delete_many(['x'])
+        self.assertFalse(self.cache.has_key('x'))
+        self.assertTrue(self.cache.cache.has_key('y'))
+        self.cache.clear()
+        self.assertFalse(self.cache.cache.has_key('y'))
+
+
+def busy_stats(self, request):
+    started = time.perf_counter()
+    while time.perf_counter() - started < 0.05:
+        pass
+    return Response({})
+
+
+@override_settings(PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=0.0, PROFILING_KEEP=2)
+class ProfilingTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.api = jwt_client_for(self.user)
+    
+    def test_requested_profiles_are_kept_for_staff_only(self):
+        with mock.patch('bills.views.BillViewSet.stats', busy_stats):
+            response = self.api.get('/api/bills/stats/', HTTP_X_PROFILE='1')
+            self.assertNotIn('X-Profile-Id', response)
+            self.assertFalse(ProfileRecord.objects.exists())
+            self.user.is_staff = True
+            self.user.save()
+            response = self.api.get('/api/bills/stats/', HTTP_X_PROFILE='1')
+        record = ProfileRecord.objects.get(pk=response['X-Profile-Id'])
+        self.assertEqual((record.route, record.trigger, record.user), ('bill-stats', 'header', self.user))
+        self.assertGreater(record.sample_count, 0)
+        self.assertIn('monitoring.tests:busy_stats', record.stacks)
+        # Stacks start below the middleware and leave out the sampler itself
+        self.assertNotIn('ProfilingMiddleware', record.stacks)
+        self.assertNotIn('StackSampler', record.stacks)
+    
+    async def test_async_requests_are_profiled(self):
+        await User.objects.filter(pk=self.user.pk).aupdate(is_staff=True)
+        headers = {'Authorization': self.api._credentials['HTTP_AUTHORIZATION'], 'X-Profile': '1'}
+        with mock.patch('bills.views.BillViewSet.stats', busy_stats):
+            response = await self.async_client.get('/api/bills/stats/', headers=headers)
+        record = await ProfileRecord.objects.aget(pk=response['X-Profile-Id'])
+        self.assertGreater(record.sample_count, 0)
+        self.assertIn('monitoring.tests:busy_stats', record.stacks)
+        # Only the worker thread's calls are sampled, from asgiref's handler up
+        self.assertNotIn('threading:', record.stacks)
+        self.assertNotIn('asyncio', record.stacks)
+    
+    def test_header_starts_no_sampler_for_other_users(self):
+        with mock.patch('monitoring.middleware.StackSampler') as sampler:
+            self.assertEqual(self.api.get('/api/bills/', HTTP_X_PROFILE='1').status_code, 200)
+            response = APIClient().get('/api/bills/', HTTP_X_PROFILE='1', HTTP_AUTHORIZATION='Bearer junk')
+            self.assertEqual(response.status_code, 401)
+            self.assertEqual(APIClient().get('/api/bills/', HTTP_X_PROFILE='1').status_code, 401)
+        sampler.assert_not_called()
+    
+    def test_sampled_profiles_are_capped(self):
+        with self.settings(PROFILING_SAMPLE_RATE=1.0):
+            for _ in range(4):
+                self.api.get('/api/bills/')
+        self.assertEqual(ProfileRecord.objects.count(), 2)
+        self.assertEqual(set(ProfileRecord.objects.values_list('trigger', flat=True)), {'sample'})
+    
+    def test_admin_download(self):
+        record = ProfileRecord.objects.create(method='GET', path='/api/bills/', status_code=200, trigger='sample',
+                                              duration_ms=5, interval_ms=5, sample_count=1, stacks='a;b 1\n')
+        admin = make_user('admin', is_staff=True, is_superuser=True)
+        self.client.force_login(admin)
+        response = self.client.get(f'/admin/monitoring/profilerecord/{record.pk}/download/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'a;b 1\n')
+        self.assertIn('attachment', response['Content-Disposition'])
+        self.assertEqual(self.client.get('/admin/monitoring/profilerecord/').status_code, 200)
@@ -0,0 +1,41 @@
+import json
+
+from rest_framework.authentication import BasicAuthentication, SessionAuthentication
+from rest_framework.permissions import IsAdminUser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
+
+from .metrics import REGISTRY
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class PrometheusRenderer(BaseRenderer):
+    """
+    The Prometheus text exposition format; error payloads render as JSON
+    """
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+    
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, str):
+            return data.encode()
+        return json.dumps(data).encode()
+
+
+class MetricsView(APIView):
+    """
+    Application metrics for Prometheus (staff only)
+    
+    Scrapers can authenticate with a JWT or with HTTP basic auth.
+    """
+    authentication_classes = [*api_settings.DEFAULT_AUTHENTICATION_CLASSES, BasicAuthentication,
+                              SessionAuthentication]
+    permission_classes = [IsAdminUser]
+    renderer_classes = [PrometheusRenderer, JSONRenderer]
+    
+    def get(self, request):
+        return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
@@ -73,6 +73,7 @@ export const billsAPI = {
     update: (id: number, data: any) => api.patch(`/bills/${id}/`, data),
     delete: (id: number) => api.delete(`/bills/${id}/`),
     correct: (id: number, correction: any) => api.post(`/bills/${id}/correct/`, correction),
+    correctBatch: (id: number, corrections: any[]) => api.post(`/bills/${id}/correct_batch/`, { corrections }),
     getStats: () => api.get('/bills/stats/'),
 };
 